@@ -8,12 +8,122 @@ import os
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # 模型閒置後常駐記憶體的時間
+
+# Ollama 多後端配置（以逗號分隔多個網址，LLM 與嵌入可分別指定）
+OLLAMA_BASE_URLS = [u.strip() for u in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if u.strip()]
+OLLAMA_LLM_URLS = [u.strip() for u in os.getenv("OLLAMA_LLM_URLS", ",".join(OLLAMA_BASE_URLS)).split(",") if u.strip()]
+OLLAMA_EMBEDDING_URLS = [u.strip() for u in os.getenv("OLLAMA_EMBEDDING_URLS", ",".join(OLLAMA_BASE_URLS)).split(",") if u.strip()]
+OLLAMA_LLM_HEDGE_AFTER = float(os.getenv("OLLAMA_LLM_HEDGE_AFTER", "0"))  # 生成請求對沖門檻秒數（0 為停用）
+OLLAMA_EMBEDDING_HEDGE_AFTER = float(os.getenv("OLLAMA_EMBEDDING_HEDGE_AFTER", "0"))  # 嵌入請求對沖門檻秒數（0 為停用）
+OLLAMA_EJECT_FAILURES = int(os.getenv("OLLAMA_EJECT_FAILURES", "3"))  # 連續失敗幾次後剔除後端
+OLLAMA_EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", "30"))  # 後端被剔除的秒數
+
+# 自適應併發限制配置（AIMD）
+LLM_LIMITER_INITIAL = int(os.getenv("LLM_LIMITER_INITIAL", "2"))  # 生成請求的初始併發上限
+LLM_LIMITER_MAX = int(os.getenv("LLM_LIMITER_MAX", "16"))  # 生成請求的併發上限最大值
+EMBEDDING_LIMITER_INITIAL = int(os.getenv("EMBEDDING_LIMITER_INITIAL", "4"))  # 嵌入請求的初始併發上限
+EMBEDDING_LIMITER_MAX = int(os.getenv("EMBEDDING_LIMITER_MAX", "32"))  # 嵌入請求的併發上限最大值
+LIMITER_MIN = int(os.getenv("LIMITER_MIN", "1"))  # 併發上限最小值
+LIMITER_MAX_QUEUE = int(os.getenv("LIMITER_MAX_QUEUE", "100"))  # 排隊請求數上限，超過時返回 429
+LIMITER_MAX_WAIT = float(os.getenv("LIMITER_MAX_WAIT", "30"))  # 排隊等候秒數上限，超過時返回 429
+LIMITER_LATENCY_TOLERANCE = float(os.getenv("LIMITER_LATENCY_TOLERANCE", "2.0"))  # 延遲超過基準的倍數時降低上限
+
+# 模型生命週期配置
+MODEL_WARMUP_ENABLED = os.getenv("MODEL_WARMUP_ENABLED", "true").lower() == "true"  # 啟動時預熱模型
+MODEL_WARMUP_TIMEOUT = float(os.getenv("MODEL_WARMUP_TIMEOUT", "300"))  # 預熱請求的超時秒數
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "15"))  # 背景健康探測間隔秒數
 
 # 文本處理配置
 CHUNK_SIZE = 500  # 每個文檔片段的字數
 CHUNK_OVERLAP = 50  # 片段重疊字數
 TOP_K = 5  # 檢索返回的片段數量
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # 每次批量嵌入的片段數量
+
+# 延後嵌入配置
+DEFERRED_EMBED_WORKERS = int(os.getenv("DEFERRED_EMBED_WORKERS", "1"))  # 背景生成嵌入向量的工作者數
+
+# 近似重複文檔偵測配置（MinHash-LSH）
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))  # 判定為近似重複的 Jaccard 相似度門檻
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))  # MinHash 簽章長度
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "16"))  # LSH 分帶數（須整除簽章長度）
+
+# 知識庫匯入匯出配置
+ARCHIVE_IMPORT_MAX_BYTES = int(os.getenv("ARCHIVE_IMPORT_MAX_BYTES", str(2 * 1024 ** 3)))  # 匯入封存檔的大小上限
+ARCHIVE_STREAM_BLOCK = int(os.getenv("ARCHIVE_STREAM_BLOCK", str(1024 * 1024)))  # 串流傳送封存檔的區塊位元組數
+
+# 請求期限配置
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "180"))  # 每個請求的處理期限秒數（亦為標頭可設定的上限）
+REQUEST_TIMEOUT_HEADER = os.getenv("REQUEST_TIMEOUT_HEADER", "X-Request-Timeout")  # 用戶端指定期限秒數的標頭
+
+# 上下文打包配置
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))  # 參考資料的 token 上限
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # 近似重複判斷門檻
+
+# URL 抓取與摘要配置
+URL_FETCH_PER_HOST = int(os.getenv("URL_FETCH_PER_HOST", "2"))  # 同一網站同時抓取的請求數
+URL_SUMMARY_CONCURRENCY = int(os.getenv("URL_SUMMARY_CONCURRENCY", "8"))  # 多網址摘要同時處理的網址數
+URL_FETCH_MAX_BYTES = int(os.getenv("URL_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))  # 單一網頁最多下載的位元組數
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "lxml")  # 網頁內容提取器：lxml（快速路徑）或 soup（BeautifulSoup）
+
+# 執行緒池與行程池配置
+THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", "8"))  # NumPy 運算與檔案 I/O 的執行緒數
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", "2"))  # 解析與切割的行程數（0 為停用，改用執行緒池）
+CPU_OFFLOAD_MIN_CHARS = int(os.getenv("CPU_OFFLOAD_MIN_CHARS", "20000"))  # 輸入達此字數才移到行程池
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))  # 事件迴圈延遲的量測間隔秒數（0 為停用）
+
+# 向量搜尋配置
+VECTOR_SEARCH_SHARDS = int(os.getenv("VECTOR_SEARCH_SHARDS", "1"))  # 單次搜尋切分的分片數（1 為不分片），各分片在執行緒池平行掃描
+VECTOR_SHARD_MIN_CHUNKS = int(os.getenv("VECTOR_SHARD_MIN_CHUNKS", "50000"))  # 每個分片至少的片段數，片段不足時減少分片
+VECTOR_PREFILTER_DOCUMENTS = int(os.getenv("VECTOR_PREFILTER_DOCUMENTS", "0"))  # 先以文檔質心選出的文檔數，只為其片段計分（0 為搜尋所有片段）
+VECTOR_PREFILTER_MIN_CHUNKS = int(os.getenv("VECTOR_PREFILTER_MIN_CHUNKS", "20000"))  # 片段數達此數量才以質心篩選
+VECTOR_REDUCED_DIMS = int(os.getenv("VECTOR_REDUCED_DIMS", "0"))  # 降維粗搜尋的維度，如 64～128（0 為停用）
+VECTOR_REDUCTION_METHOD = os.getenv("VECTOR_REDUCTION_METHOD", "pca")  # 降維方法：pca 或 random（隨機投影）
+VECTOR_RERANK_CANDIDATES = int(os.getenv("VECTOR_RERANK_CANDIDATES", "200"))  # 降維矩陣選出、再以完整向量計分的候選數
+VECTOR_REDUCTION_MIN_CHUNKS = int(os.getenv("VECTOR_REDUCTION_MIN_CHUNKS", "20000"))  # 片段數達此數量才擬合降維
+VECTOR_REFIT_GROWTH = float(os.getenv("VECTOR_REFIT_GROWTH", "0.2"))  # 尚未降維的片段超過此比例時在背景重新擬合
+
+# 檢索多樣化配置（MMR）
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "1.0"))  # RAG 檢索預設的相關度權重（1 為不重新排序，越小越重視多樣性）
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "50"))  # MMR 重新排序的候選片段數
+
+# 索引服務配置（多個 uvicorn worker 共用知識庫）
+INDEX_SERVER_SOCKET = os.getenv("INDEX_SERVER_SOCKET", "")  # 索引服務的 Unix socket 路徑（空字串為行程內的知識庫）
+INDEX_SHM_PREFIX = os.getenv("INDEX_SHM_PREFIX", "rag_index")  # 共享記憶體區段名稱前綴
+
+# 網站爬取配置
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))  # 每個爬取任務的工作者數
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "0.2"))  # 同一網站兩次請求的最小間隔秒數
+CRAWL_INGEST_BATCH_SIZE = int(os.getenv("CRAWL_INGEST_BATCH_SIZE", "8"))  # 累積多少網頁後批量生成嵌入並寫入知識庫
+CRAWL_MAX_JOBS = int(os.getenv("CRAWL_MAX_JOBS", "20"))  # 保留的爬取任務紀錄數
 
+# 網頁抓取快取配置
+FETCH_CACHE_MEMORY_SIZE = int(os.getenv("FETCH_CACHE_MEMORY_SIZE", "128"))  # 記憶體快取的網頁數量
+FETCH_CACHE_DIR = os.getenv("FETCH_CACHE_DIR", "fetch_cache")  # 磁碟快取目錄（空字串為停用）
+FETCH_CACHE_DISK_MAX_ENTRIES = int(os.getenv("FETCH_CACHE_DISK_MAX_ENTRIES", "1000"))  # 磁碟快取的網頁數量上限
+FETCH_CACHE_DEFAULT_TTL = int(os.getenv("FETCH_CACHE_DEFAULT_TTL", "60"))  # 回應未指定有效期時的快取秒數
 
+# URL 問答配置
+URL_INDEX_CACHE_SIZE = int(os.getenv("URL_INDEX_CACHE_SIZE", "32"))  # 快取的網頁索引數量
+URL_INDEX_TTL = int(os.getenv("URL_INDEX_TTL", "300"))  # 網頁索引免重新抓取的秒數
 
+# LLM 排程配置
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # 同時送往 Ollama 的生成請求數上限（實際值由自適應限制器調整）
+LLM_DEFAULT_WEIGHT = int(os.getenv("LLM_DEFAULT_WEIGHT", "1"))  # 未設定端點的排程權重
+# 各端點的排程權重，格式：路徑:權重,路徑:權重
+LLM_ENDPOINT_WEIGHTS = {
+    path.strip(): int(weight)
+    for path, weight in (
+        item.rsplit(":", 1)
+        for item in os.getenv(
+            "LLM_ENDPOINT_WEIGHTS",
+            "/api/rag/query:8,/api/rag/chat:8,/api/url/qa:8,/api/summary:2,/api/url/summary:1"
+        ).split(",")
+        if item.strip()
+    )
+}
 
+# 多輪對話配置
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "256"))  # 同時保留的會話數量
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "1800"))  # 會話閒置過期秒數
+CONVERSATION_MAX_CONTEXT_TOKENS = int(os.getenv("CONVERSATION_MAX_CONTEXT_TOKENS", "8192"))  # 超過後重新開始 context
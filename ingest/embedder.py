@@ -3,10 +3,14 @@
 使用 Ollama 生成文本的嵌入向量
 """
 import httpx
-from typing import List
+from typing import Any, List, Optional, Callable, Awaitable, Tuple
 from fastapi import HTTPException
 
-from config import OLLAMA_BASE_URL, EMBEDDING_MODEL
+from config import EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, OLLAMA_KEEP_ALIVE
+from utils.ollama_pool import embedding_pool
+from utils.deadline import remaining
+from utils.executor import run_in_thread
+from vectorstore.store import MissingEmbeddingError
 
 
 async def get_embedding(text: str) -> List[float]:
@@ -23,47 +27,149 @@ async def get_embedding(text: str) -> List[float]:
         HTTPException: 當 Ollama 連接失敗或模型不存在時
     """
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/embeddings",
-                json={
-                    "model": EMBEDDING_MODEL,
-                    "prompt": text
-                }
+        response = await embedding_pool.post(
+            "/api/embeddings",
+            {
+                "model": EMBEDDING_MODEL,
+                "prompt": text,
+                "keep_alive": OLLAMA_KEEP_ALIVE
+            },
+            timeout=remaining(60.0)
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"嵌入生成失敗: {response.text}"
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"嵌入生成失敗: {response.text}"
-                )
-            
-            result = response.json()
-            return result.get("embedding", [])
+        
+        result = response.json()
+        return result.get("embedding", [])
             
     except httpx.ConnectError:
         raise HTTPException(
             status_code=503,
             detail=f"無法連接到 Ollama。請確認已啟動並下載嵌入模型: ollama pull {EMBEDDING_MODEL}"
         )
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="嵌入生成超時")
 
 
-async def get_embeddings(texts: List[str]) -> List[List[float]]:
+async def _embed_batch(texts: List[str]) -> List[List[float]]:
+    """
+    使用 Ollama /api/embed 一次生成多個嵌入向量
+    
+    Returns:
+        嵌入向量列表；舊版 Ollama 不支援批量端點時返回空列表
+    """
+    response = await embedding_pool.post(
+        "/api/embed",
+        {
+            "model": EMBEDDING_MODEL,
+            "input": texts,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        },
+        timeout=remaining(60.0)
+    )
+    
+    if response.status_code == 404:
+        return []
+    
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=500,
+            detail=f"嵌入生成失敗: {response.text}"
+        )
+    
+    return response.json().get("embeddings", [])
+
+
+async def get_embeddings(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[List[float]]:
     """
     批量獲取嵌入向量
     
     Args:
         texts: 文本列表
+        batch_size: 每次請求的文本數量
     
     Returns:
         嵌入向量列表
     """
     embeddings = []
-    for text in texts:
+    try:
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            batch_embeddings = await _embed_batch(batch)
+            if len(batch_embeddings) != len(batch):
+                # 批量端點不可用，改為逐一生成
+                break
+            embeddings.extend(batch_embeddings)
+    except httpx.ConnectError:
+        raise HTTPException(
+            status_code=503,
+            detail=f"無法連接到 Ollama。請確認已啟動並下載嵌入模型: ollama pull {EMBEDDING_MODEL}"
+        )
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="嵌入生成超時")
+    
+    for text in texts[len(embeddings):]:
         emb = await get_embedding(text)
         embeddings.append(emb)
     return embeddings
 
 
+async def embed_new_chunks(
+    store,
+    chunks: List[str],
+    embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None
+) -> List[Optional[List[float]]]:
+    """
+    只為知識庫中尚未存在的片段內容生成嵌入向量
+    
+    重複的內容只生成一次；已存在的片段對應 None，由 store.add_document 沿用既有向量。
+    
+    Args:
+        store: 向量資料庫
+        chunks: 文本片段列表
+        embed: 批量嵌入函數（預設為 get_embeddings）
+    
+    Returns:
+        與 chunks 對應的嵌入向量列表
+    """
+    missing = await run_in_thread(store.missing_chunks, chunks)
+    vectors = dict(zip(missing, await (embed or get_embeddings)(missing))) if missing else {}
+    return [vectors.get(chunk) for chunk in chunks]
 
 
+async def embed_and_store(
+    store,
+    chunks: List[str],
+    write: Callable[[List[Optional[List[float]]]], Any],
+    embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None
+) -> Tuple[List[Optional[List[float]]], Any]:
+    """
+    為新的片段內容生成嵌入向量後以 write 寫入知識庫
+    
+    生成嵌入期間其他請求可能刪除了原本沿用向量的片段，此時 write 拋出 MissingEmbeddingError；
+    補上這些片段的向量後重試一次。write 在執行緒池執行，不阻塞事件迴圈。
+    
+    Args:
+        store: 向量資料庫
+        chunks: 文本片段列表
+        write: 以嵌入向量列表寫入知識庫的同步函數（如 store.add_document 的包裝）
+        embed: 批量嵌入函數（預設為 get_embeddings）
+    
+    Returns:
+        (寫入時使用的嵌入向量列表, write 的返回值)
+    
+    Raises:
+        MissingEmbeddingError: 重試時沿用的片段再次被刪除
+    """
+    embeddings = await embed_new_chunks(store, chunks, embed)
+    try:
+        return embeddings, await run_in_thread(write, embeddings)
+    except MissingEmbeddingError:
+        reused = [chunk for chunk, embedding in zip(chunks, embeddings) if embedding is None]
+        vectors = dict(zip(reused, await embed_new_chunks(store, reused, embed)))
+        embeddings = [vectors[chunk] if embedding is None else embedding for chunk, embedding in zip(chunks, embeddings)]
+        return embeddings, await run_in_thread(write, embeddings)
@@ -4,8 +4,9 @@ LLM 生成層
 """
 from .qa import rag_qa
 from .summarizer import generate_summary
+from .scheduler import llm_scheduler
 
-__all__ = ["rag_qa", "generate_summary"]
+__all__ = ["rag_qa", "generate_summary", "llm_scheduler"]
 
 
 
@@ -0,0 +1,182 @@
+"""
+上下文打包模組
+在 token 預算內組合 RAG 提示詞的參考資料：
+去除重複片段、合併同文檔相鄰片段、裁剪低分片段
+"""
+import math
+import re
+from typing import List, Dict, Tuple
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+
+# CJK 字元大致一字一 token，其餘文字約 4 字元一 token
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+CHUNK_SEPARATOR = "\n\n---\n\n"
+SHINGLE_SIZE = 5  # 近似重複判斷使用的字元 n-gram 長度
+MIN_TRIM_TOKENS = 50  # 剩餘預算低於此值時不再裁剪片段
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 數
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 數
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+
+def _normalize(text: str) -> str:
+    """壓縮空白，用於重複比對"""
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def _shingles(text: str) -> set:
+    """字元 n-gram 集合"""
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _is_near_duplicate(normalized: str, shingles: set, kept: List[Tuple[str, set]], threshold: float) -> bool:
+    """判斷片段是否與已保留的片段重疊或近似重複"""
+    for kept_text, kept_shingles in kept:
+        if normalized in kept_text or kept_text in normalized:
+            return True
+        union = len(shingles | kept_shingles)
+        if union and len(shingles & kept_shingles) / union >= threshold:
+            return True
+    return False
+
+
+def _merge_overlap(first: str, second: str, max_overlap: int = 200) -> str:
+    """合併兩段相鄰文本，去除首尾重疊的部分"""
+    limit = min(len(first), len(second), max_overlap)
+    for size in range(limit, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n\n" + second
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    """將文本裁剪至指定 token 數以內"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + "…"
+
+
+def _format_block(title: str, content: str) -> str:
+    return f"[來源: {title}]\n{content}"
+
+
+def pack_context(
+    chunks: List[Dict],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD
+) -> Tuple[str, Dict]:
+    """
+    在 token 預算內打包參考資料
+
+    Args:
+        chunks: 檢索到的片段（需含 title、content，可含 score、document_id、chunk_index）
+        token_budget: 參考資料的 token 上限
+        dedup_threshold: 近似重複的 Jaccard 相似度門檻
+
+    Returns:
+        (組合後的上下文, 打包統計)
+    """
+    ranked = sorted(chunks, key=lambda c: c.get("score", 0), reverse=True)
+
+    # 1. 去除重複與近似重複的片段（保留分數較高者）
+    unique = []
+    kept_signatures: List[Tuple[str, set]] = []
+    for chunk in ranked:
+        normalized = _normalize(chunk.get("content", ""))
+        if not normalized:
+            continue
+        shingles = _shingles(normalized)
+        if _is_near_duplicate(normalized, shingles, kept_signatures, dedup_threshold):
+            continue
+        kept_signatures.append((normalized, shingles))
+        unique.append(chunk)
+
+    # 2. 依分數在預算內選取，最後一個放不下的片段裁剪後放入
+    separator_tokens = estimate_tokens(CHUNK_SEPARATOR)
+    selected = []
+    used = 0
+    trimmed = 0
+    for chunk in unique:
+        cost = estimate_tokens(_format_block(chunk["title"], chunk["content"]))
+        if selected:
+            cost += separator_tokens
+        if used + cost <= token_budget:
+            selected.append(chunk)
+            used += cost
+            continue
+        remaining = token_budget - used - (cost - estimate_tokens(chunk["content"]))
+        if remaining >= MIN_TRIM_TOKENS:
+            chunk = dict(chunk, content=_trim_to_tokens(chunk["content"], remaining))
+            selected.append(chunk)
+            trimmed += 1
+        break
+
+    # 3. 合併同一文檔中相鄰的片段
+    groups: List[Dict] = []
+    by_document: Dict[str, List[Dict]] = {}
+    for chunk in selected:
+        doc_id = chunk.get("document_id")
+        if doc_id is None or chunk.get("chunk_index") is None:
+            groups.append({"title": chunk["title"], "content": chunk["content"], "score": chunk.get("score", 0)})
+            continue
+        by_document.setdefault(doc_id, []).append(chunk)
+
+    merged = 0
+    for doc_chunks in by_document.values():
+        doc_chunks.sort(key=lambda c: c["chunk_index"])
+        current = None
+        for chunk in doc_chunks:
+            if current and chunk["chunk_index"] == current["last_index"] + 1:
+                current["content"] = _merge_overlap(current["content"], chunk["content"])
+                current["last_index"] = chunk["chunk_index"]
+                current["score"] = max(current["score"], chunk.get("score", 0))
+                merged += 1
+                continue
+            current = {
+                "title": chunk["title"],
+                "content": chunk["content"],
+                "score": chunk.get("score", 0),
+                "last_index": chunk["chunk_index"]
+            }
+            groups.append(current)
+
+    groups.sort(key=lambda g: g["score"], reverse=True)
+    context = CHUNK_SEPARATOR.join(_format_block(g["title"], g["content"]) for g in groups)
+
+    stats = {
+        "input_chunks": len(chunks),
+        "duplicates_removed": len(ranked) - len(unique),
+        "chunks_dropped": len(unique) - len(selected),
+        "chunks_trimmed": trimmed,
+        "chunks_merged": merged,
+        "packed_blocks": len(groups),
+        "context_tokens": estimate_tokens(context),
+        "token_budget": token_budget,
+        "chunk_ids": [c["id"] for c in selected if "id" in c]
+    }
+    return context, stats
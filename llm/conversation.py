@@ -0,0 +1,153 @@
+"""
+多輪對話 RAG 模組
+保存 Ollama 返回的 context token 陣列，後續輪次只送出新問題與新檢索到的片段
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from config import CONVERSATION_MAX_SESSIONS, CONVERSATION_TTL, CONVERSATION_MAX_CONTEXT_TOKENS
+from llm.context import pack_context
+from llm.qa import ollama_generate, build_usage, estimate_confidence, RAG_SYSTEM_PROMPT, LANGUAGE_MAP
+
+
+class ConversationSession:
+    """單一對話會話"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.context: List[int] = []  # Ollama 返回的 context token 陣列
+        self.sent_chunk_ids: set = set()  # 已放入提示詞的片段
+        self.turn_count = 0
+        self.updated_at = time.monotonic()
+        # 同一會話的輪次依序進行：生成與更新 context 期間持有
+        self.lock = asyncio.Lock()
+
+    def reset_context(self):
+        """捨棄累積的 context，下一輪重新送出完整參考資料"""
+        self.context = []
+        self.sent_chunk_ids.clear()
+
+
+class ConversationStore:
+    """對話會話的 LRU 存儲，超過數量上限或閒置過久的會話會被移除"""
+
+    def __init__(self, max_sessions: int = CONVERSATION_MAX_SESSIONS, ttl: float = CONVERSATION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.updated_at < self.ttl:
+                break
+            del self._sessions[session_id]
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ConversationSession:
+        """
+        取得會話，不存在或已過期時建立新會話
+
+        Args:
+            session_id: 會話 ID
+
+        Returns:
+            對話會話
+        """
+        self._expire()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session = ConversationSession(session_id or uuid.uuid4().hex[:12])
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        session.updated_at = time.monotonic()
+        self._sessions.move_to_end(session.session_id)
+        return session
+
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        """取得會話（不建立）"""
+        self._expire()
+        return self._sessions.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        """刪除會話"""
+        return self._sessions.pop(session_id, None) is not None
+
+    def count(self) -> int:
+        """返回會話數量"""
+        self._expire()
+        return len(self._sessions)
+
+
+async def conversational_rag_qa(
+    session: ConversationSession,
+    question: str,
+    context_chunks: List[Dict],
+    language: str = "zh-TW"
+) -> tuple[str, str, Dict]:
+    """
+    在會話中執行 RAG 問答
+
+    第一輪送出系統提示詞與參考資料；後續輪次延續 Ollama 的 context，
+    只送出先前未提供過的片段與新問題。呼叫端須持有 session.lock。
+
+    Args:
+        session: 對話會話
+        question: 問題
+        context_chunks: 相關的文本片段
+        language: 輸出語言
+
+    Returns:
+        (答案, 信心程度, token 用量統計)
+    """
+    if len(session.context) > CONVERSATION_MAX_CONTEXT_TOKENS:
+        session.reset_context()
+
+    first_turn = not session.context
+    new_chunks = [c for c in context_chunks if c.get("id") not in session.sent_chunk_ids]
+    context, packing = pack_context(new_chunks)
+    target_lang = LANGUAGE_MAP.get(language, "繁體中文")
+
+    if first_turn:
+        prompt = f"""請根據以下參考資料回答問題。
+
+## 參考資料
+{context}
+
+## 問題
+{question}
+
+請用{target_lang}回答。"""
+    elif context:
+        prompt = f"""## 補充參考資料
+{context}
+
+## 問題
+{question}
+
+請根據先前與補充的參考資料，用{target_lang}回答。"""
+    else:
+        prompt = f"""## 問題
+{question}
+
+請根據先前的參考資料，用{target_lang}回答。"""
+
+    system_prompt = RAG_SYSTEM_PROMPT if first_turn else ""
+    result = await ollama_generate(prompt, system_prompt, context=session.context or None)
+    answer = result.get("response", "").strip()
+
+    session.context = result.get("context") or []
+    session.sent_chunk_ids.update(packing["chunk_ids"])
+    session.turn_count += 1
+
+    usage = build_usage(result, system_prompt + prompt, answer, packing)
+    usage["session_context_tokens"] = len(session.context)
+    return answer, estimate_confidence(context_chunks), usage
+
+
+# 全局對話存儲實例
+conversation_store = ConversationStore()
@@ -2,41 +2,60 @@
 RAG 問答模組
 構建 prompt 並調用 LLM 生成答案
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
 import httpx
 from fastapi import HTTPException
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL
+from config import OLLAMA_MODEL, OLLAMA_KEEP_ALIVE
+from llm.context import pack_context, estimate_tokens
+from llm.scheduler import llm_scheduler
+from utils.ollama_pool import llm_pool
+from utils.deadline import remaining
 
+RAG_SYSTEM_PROMPT = """你是一個專業的問答助手。請根據提供的參考資料回答問題。
+規則：
+1. 只根據參考資料中的信息回答
+2. 如果資料中沒有相關信息，請明確說明
+3. 回答要準確、有條理
+4. 適當引用來源"""
 
-async def call_ollama(prompt: str, system_prompt: str = "") -> str:
+LANGUAGE_MAP = {
+    "zh-TW": "繁體中文",
+    "zh-CN": "简体中文",
+    "en": "English"
+}
+
+
+async def ollama_generate(prompt: str, system_prompt: str = "", context: Optional[List[int]] = None) -> Dict:
     """
-    調用 Ollama LLM
+    調用 Ollama LLM 並返回完整的回應內容
     
     Args:
         prompt: 用戶提示詞
         system_prompt: 系統提示詞
+        context: 上一輪回應返回的 context token 陣列，用於延續對話
     
     Returns:
-        LLM 生成的回應
+        Ollama /api/generate 的回應（含 response、context、prompt_eval_count 等欄位）
     """
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "system": system_prompt,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    if context:
+        payload["context"] = context
+    
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json={
-                    "model": OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "system": system_prompt,
-                    "stream": False
-                }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=500, detail=f"Ollama 請求失敗: {response.text}")
-            
-            result = response.json()
-            return result.get("response", "").strip()
+        async with llm_scheduler.slot():
+            response = await llm_pool.post("/api/generate", payload, timeout=remaining(120.0))
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail=f"Ollama 請求失敗: {response.text}")
+        
+        return response.json()
             
     except httpx.ConnectError:
         raise HTTPException(
@@ -47,7 +66,63 @@ async def call_ollama(prompt: str, system_prompt: str = "") -> str:
         raise HTTPException(status_code=504, detail="Ollama 回應超時")
 
 
-async def rag_qa(question: str, context_chunks: List[Dict], language: str = "zh-TW") -> tuple[str, str]:
+async def call_ollama(prompt: str, system_prompt: str = "") -> str:
+    """
+    調用 Ollama LLM
+    
+    Args:
+        prompt: 用戶提示詞
+        system_prompt: 系統提示詞
+    
+    Returns:
+        LLM 生成的回應
+    """
+    result = await ollama_generate(prompt, system_prompt)
+    return result.get("response", "").strip()
+
+
+def build_usage(result: Dict, prompt_text: str, answer: str, packing: Dict) -> Dict:
+    """
+    整理 token 用量統計，優先使用 Ollama 回報的 token 數，否則使用估算值
+    
+    Args:
+        result: Ollama /api/generate 的回應
+        prompt_text: 送出的提示詞（含系統提示詞）
+        answer: 生成的答案
+        packing: 上下文打包統計
+    
+    Returns:
+        token 用量統計
+    """
+    return {
+        "prompt_tokens": result.get("prompt_eval_count") or estimate_tokens(prompt_text),
+        "completion_tokens": result.get("eval_count") or estimate_tokens(answer),
+        "prompt_tokens_estimated": "prompt_eval_count" not in result,
+        "context": packing
+    }
+
+
+def estimate_confidence(context_chunks: List[Dict]) -> str:
+    """
+    依檢索片段的平均相似度估計信心程度
+    
+    Args:
+        context_chunks: 相關的文本片段
+    
+    Returns:
+        high / medium / low
+    """
+    if not context_chunks:
+        return "low"
+    avg_score = sum(chunk.get("score", 0) for chunk in context_chunks) / len(context_chunks)
+    if avg_score > 0.7:
+        return "high"
+    if avg_score > 0.5:
+        return "medium"
+    return "low"
+
+
+async def rag_qa(question: str, context_chunks: List[Dict], language: str = "zh-TW") -> tuple[str, str, Dict]:
     """
     執行 RAG 問答
     
@@ -57,30 +132,16 @@ async def rag_qa(question: str, context_chunks: List[Dict], language: str = "zh-
         language: 輸出語言
     
     Returns:
-        (答案, 信心程度)
+        (答案, 信心程度, token 用量統計)
     """
-    # 組合上下文
-    context_parts = []
-    for chunk in context_chunks:
-        context_parts.append(f"[來源: {chunk['title']}]\n{chunk['content']}")
-    
-    context = "\n\n---\n\n".join(context_parts)
+    # 在 token 預算內組合上下文（去重、合併相鄰片段、裁剪低分片段）
+    context, packing = pack_context(context_chunks)
     
     # 語言設定
-    language_map = {
-        "zh-TW": "繁體中文",
-        "zh-CN": "简体中文",
-        "en": "English"
-    }
-    target_lang = language_map.get(language, "繁體中文")
+    target_lang = LANGUAGE_MAP.get(language, "繁體中文")
     
     # 構建提示詞
-    system_prompt = """你是一個專業的問答助手。請根據提供的參考資料回答問題。
-規則：
-1. 只根據參考資料中的信息回答
-2. 如果資料中沒有相關信息，請明確說明
-3. 回答要準確、有條理
-4. 適當引用來源"""
+    system_prompt = RAG_SYSTEM_PROMPT
     
     prompt = f"""請根據以下參考資料回答問題。
 
@@ -93,21 +154,12 @@ async def rag_qa(question: str, context_chunks: List[Dict], language: str = "zh-
 請用{target_lang}回答。"""
     
     # 調用 LLM
-    answer = await call_ollama(prompt, system_prompt)
-    
-    # 計算信心程度
-    if context_chunks:
-        avg_score = sum(chunk.get("score", 0) for chunk in context_chunks) / len(context_chunks)
-        if avg_score > 0.7:
-            confidence = "high"
-        elif avg_score > 0.5:
-            confidence = "medium"
-        else:
-            confidence = "low"
-    else:
-        confidence = "low"
-    
-    return answer, confidence
+    result = await ollama_generate(prompt, system_prompt)
+    answer = result.get("response", "").strip()
+    
+    usage = build_usage(result, system_prompt + prompt, answer, packing)
+    
+    return answer, estimate_confidence(context_chunks), usage
 
 
 
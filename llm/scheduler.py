@@ -0,0 +1,239 @@
+"""
+LLM 請求排程模組
+以每個端點一個加權佇列調度對 Ollama 的生成請求：
+- 全局併發上限，並跟隨 LLM 後端池的自適應限制器調整
+- 端點之間使用平滑加權輪詢，避免批次任務壟斷模型
+- 同一端點內按用戶端輪流出隊，確保公平
+- 佇列已滿或等候過久時以 429 提早拒絕，而不是等到 Ollama 逾時
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from config import (
+    LLM_MAX_CONCURRENCY, LLM_ENDPOINT_WEIGHTS, LLM_DEFAULT_WEIGHT,
+    LIMITER_MAX_QUEUE, LIMITER_MAX_WAIT
+)
+from utils.concurrency import AdaptiveLimiter
+from utils.ollama_pool import llm_pool
+from utils.request_context import current_endpoint, current_client
+from utils.deadline import remaining, deadline_exceeded
+
+WAIT_SAMPLES = 1000  # 每個端點保留的等待時間樣本數
+
+
+class _Waiter:
+    """排隊中的請求"""
+
+    __slots__ = ("future", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _EndpointQueue:
+    """單一端點的佇列與統計"""
+
+    def __init__(self, weight: int):
+        self.weight = weight
+        self.current_weight = 0
+        self.clients: "OrderedDict[str, deque]" = OrderedDict()
+        self.queued = 0
+        self.dispatched = 0
+        self.wait_samples: deque = deque(maxlen=WAIT_SAMPLES)
+
+    def push(self, client_id: str, waiter: _Waiter):
+        self.clients.setdefault(client_id, deque()).append(waiter)
+        self.queued += 1
+
+    def pop(self) -> _Waiter:
+        """取出下一個請求，並將該用戶端移到輪詢隊尾"""
+        client_id, waiters = next(iter(self.clients.items()))
+        waiter = waiters.popleft()
+        if waiters:
+            self.clients.move_to_end(client_id)
+        else:
+            del self.clients[client_id]
+        self.queued -= 1
+        return waiter
+
+    def remove(self, client_id: str, waiter: _Waiter):
+        waiters = self.clients.get(client_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del self.clients[client_id]
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LLMScheduler:
+    """LLM 請求排程器"""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        weights: Optional[Dict[str, int]] = None,
+        default_weight: int = LLM_DEFAULT_WEIGHT,
+        limiter: Optional[AdaptiveLimiter] = None,
+        max_queue: int = LIMITER_MAX_QUEUE,
+        max_wait: float = LIMITER_MAX_WAIT
+    ):
+        self.max_concurrency = max_concurrency
+        self.weights = dict(LLM_ENDPOINT_WEIGHTS if weights is None else weights)
+        self.default_weight = default_weight
+        self.limiter = limiter
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.rejected = 0
+        self._queues: Dict[str, _EndpointQueue] = {}
+
+    @property
+    def capacity(self) -> int:
+        """目前允許的併發數"""
+        if self.limiter is None:
+            return self.max_concurrency
+        return min(self.max_concurrency, self.limiter.capacity)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        queued = sum(q.queued for q in self._queues.values())
+        latency = (self.limiter.recent_latency if self.limiter else None) or 1.0
+        retry_after = max(1, math.ceil(latency * (queued + 1) / self.capacity))
+        raise HTTPException(
+            status_code=429,
+            detail=f"LLM 請求過多（{reason}），請稍後再試",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    def _queue(self, endpoint: str) -> _EndpointQueue:
+        queue = self._queues.get(endpoint)
+        if queue is None:
+            queue = _EndpointQueue(self.weights.get(endpoint, self.default_weight))
+            self._queues[endpoint] = queue
+        return queue
+
+    def _next_queue(self) -> Optional[_EndpointQueue]:
+        """平滑加權輪詢：選出下一個出隊的端點"""
+        candidates = [q for q in self._queues.values() if q.queued]
+        if not candidates:
+            return None
+        total = sum(q.weight for q in candidates)
+        for q in candidates:
+            q.current_weight += q.weight
+        chosen = max(candidates, key=lambda q: q.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    def _dispatch(self):
+        while self.active < self.capacity:
+            queue = self._next_queue()
+            if queue is None:
+                return
+            waiter = queue.pop()
+            if waiter.future.done():
+                continue
+            queue.dispatched += 1
+            queue.wait_samples.append(time.monotonic() - waiter.enqueued_at)
+            self.active += 1
+            waiter.future.set_result(None)
+
+    async def acquire(self, endpoint: str, client_id: str):
+        """
+        等待可用的 LLM 執行名額
+
+        Args:
+            endpoint: 請求所屬端點
+            client_id: 用戶端識別
+        
+        Raises:
+            HTTPException: 佇列已滿或等候超過上限時返回 429；請求期限先到時返回 504
+        """
+        queue = self._queue(endpoint)
+        queued = sum(q.queued for q in self._queues.values())
+        if self.active < self.capacity and not queued:
+            self.active += 1
+            queue.dispatched += 1
+            queue.wait_samples.append(0.0)
+            return
+        if queued >= self.max_queue:
+            self._reject("佇列已滿")
+
+        timeout = remaining(self.max_wait)
+        waiter = _Waiter(asyncio.get_running_loop().create_future())
+        queue.push(client_id, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                return
+            waiter.future.cancel()
+            queue.remove(client_id, waiter)
+            if timeout < self.max_wait:
+                # 逾時的是請求期限而非等候上限，重試也來不及
+                raise deadline_exceeded()
+            self._reject("等候逾時")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已取得名額但請求被取消，歸還名額
+                self.release()
+            else:
+                waiter.future.cancel()
+                queue.remove(client_id, waiter)
+            raise
+
+    def release(self):
+        """歸還 LLM 執行名額"""
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, endpoint: Optional[str] = None, client_id: Optional[str] = None):
+        """
+        取得執行名額的上下文管理器，未指定時使用目前請求的端點與用戶端
+        """
+        await self.acquire(endpoint or current_endpoint.get(), client_id or current_client.get())
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        """返回排程統計（等待時間單位：毫秒）"""
+        endpoints = {}
+        for name, queue in self._queues.items():
+            samples = list(queue.wait_samples)
+            endpoints[name] = {
+                "weight": queue.weight,
+                "queued": queue.queued,
+                "waiting_clients": len(queue.clients),
+                "dispatched": queue.dispatched,
+                "wait_ms_p50": round(_percentile(samples, 50) * 1000, 2),
+                "wait_ms_p99": round(_percentile(samples, 99) * 1000, 2),
+                "wait_ms_max": round(max(samples) * 1000, 2) if samples else 0.0
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "capacity": self.capacity,
+            "active": self.active,
+            "rejected": self.rejected,
+            "endpoints": endpoints
+        }
+
+
+# 全局 LLM 排程器實例
+llm_scheduler = LLMScheduler(limiter=llm_pool.limiter)
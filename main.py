@@ -4,20 +4,43 @@ RAG 摘要與QA API
 支援多文檔上傳、向量檢索、智能問答
 （輕量版 - 不需要額外安裝 chromadb 和 sentence-transformers）
 """
-import httpx
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL, EMBEDDING_MODEL
+from config import OLLAMA_MODEL, EMBEDDING_MODEL
 from vectorstore import vector_store
-from routes import documents_router, rag_router, summary_router, url_router
+from routes import documents_router, rag_router, summary_router, url_router, metrics_router, crawl_router
+from services import model_manager, embedding_queue
+from utils.http_client import close_http_clients
+from utils.executor import loop_monitor, shutdown_executors, run_in_thread
+from utils.request_context import RequestContextMiddleware
+from utils.deadline import DeadlineMiddleware
 
 # ============ 初始化 FastAPI ============
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    啟動時預熱模型、開始背景健康探測與事件迴圈延遲量測；
+    關閉時停止背景工作，並關閉共用的 HTTP 用戶端與執行器
+    """
+    loop_monitor.start()
+    await model_manager.start()
+    yield
+    await embedding_queue.stop()
+    await model_manager.stop()
+    await loop_monitor.stop()
+    await close_http_clients()
+    shutdown_executors()
+
+
 app = FastAPI(
     title="RAG 摘要與QA API",
     description="使用 RAG（檢索增強生成）技術的智能問答系統，支援多文檔上傳和向量檢索",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -27,6 +50,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 綁定請求端點與用戶端，供 LLM 排程器依端點權重與用戶端公平調度
+app.add_middleware(RequestContextMiddleware)
+# 設定請求期限，用戶端中斷時取消處理
+app.add_middleware(DeadlineMiddleware)
+
 
 # ============ 註冊路由 ============
 
@@ -34,6 +62,8 @@ app.include_router(documents_router)
 app.include_router(rag_router)
 app.include_router(summary_router)
 app.include_router(url_router)
+app.include_router(metrics_router)
+app.include_router(crawl_router)
 
 # ============ 根端點 ============
 
@@ -49,20 +79,24 @@ async def root():
             "Vector Semantic Search",
             "Smart Summarization",
             "URL Content Summarization",
-            "URL Question Answering"
+            "URL Question Answering",
+            "Site Crawling into Knowledge Base"
         ],
         "stats": {
-            "documents": vector_store.count_documents(),
-            "total_chunks": vector_store.count_chunks(),
+            "documents": await run_in_thread(vector_store.count_documents),
+            "total_chunks": await run_in_thread(vector_store.count_chunks),
             "embedding_model": EMBEDDING_MODEL,
             "llm_model": OLLAMA_MODEL
         },
         "endpoints": {
             "documents": "POST /api/documents",
             "rag_query": "POST /api/rag/query",
+            "rag_chat": "POST /api/rag/chat",
             "summary": "POST /api/summary",
             "url_summary": "POST /api/url/summary",
             "url_qa": "POST /api/url/qa",
+            "crawl": "POST /api/crawl",
+            "metrics": "GET /api/metrics",
             "docs": "/docs"
         }
     }
@@ -70,37 +104,20 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康檢查"""
-    ollama_status = "unknown"
-    embedding_status = "unknown"
-    
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # 檢查 Ollama
-            response = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
-            if response.status_code == 200:
-                ollama_status = "healthy"
-                models = response.json().get("models", [])
-                model_names = [m.get("name", "") for m in models]
-                
-                # 檢查嵌入模型是否存在
-                if any(EMBEDDING_MODEL in name for name in model_names):
-                    embedding_status = "ready"
-                else:
-                    embedding_status = f"missing - 請執行: ollama pull {EMBEDDING_MODEL}"
-            else:
-                ollama_status = "error"
-    except Exception:
-        ollama_status = "unreachable"
+    """健康檢查（讀取背景探測的快取結果，不會即時呼叫 Ollama）"""
+    status = model_manager.status
     
     return {
         "status": "healthy",
-        "ollama_status": ollama_status,
-        "embedding_status": embedding_status,
+        "ollama_status": status["ollama_status"],
+        "embedding_status": status["embedding_status"],
+        "backends": status.get("backends", {}),
+        "checked_at": status["checked_at"],
         "llm_model": OLLAMA_MODEL,
         "embedding_model": EMBEDDING_MODEL,
-        "documents_count": vector_store.count_documents(),
-        "chunks_count": vector_store.count_chunks()
+        "cold_start": model_manager.cold_start,
+        "documents_count": await run_in_thread(vector_store.count_documents),
+        "chunks_count": await run_in_thread(vector_store.count_chunks)
     }
 
 
@@ -3,13 +3,20 @@
 定義所有 API 的請求/回應模型
 """
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 # ============ 文檔管理 ============
 
 class DocumentUploadRequest(BaseModel):
     content: str = Field(..., description="文檔內容", min_length=10)
     title: str = Field(default="未命名文檔", description="文檔標題")
+    skip_near_duplicates: bool = Field(default=False, description="已有近似重複的文檔時不新增，直接返回既有文檔")
+    defer_embedding: bool = Field(default=False, description="立即返回，嵌入向量在背景生成（完成前以詞彙比對搜尋）")
+
+
+class DocumentUpdateRequest(BaseModel):
+    content: str = Field(..., description="新的文檔內容", min_length=10)
+    title: Optional[str] = Field(default=None, description="新的標題（不提供則沿用原標題）")
 
 
 class DocumentResponse(BaseModel):
@@ -17,7 +24,12 @@ class DocumentResponse(BaseModel):
     title: str
     content_length: int
     chunks_count: int
+    embedded_chunks: Optional[int] = None  # 實際生成嵌入向量的片段數（其餘沿用既有向量）
     created_at: str
+    near_duplicates: Optional[List[Dict]] = None  # 上傳時偵測到的近似重複文檔
+    duplicate_of: Optional[str] = None  # 因近似重複而未新增時，返回的既有文檔 ID
+    chunk_changes: Optional[Dict[str, int]] = None  # 更新時的片段變化（kept / added / removed）
+    indexing: Optional[Dict] = None  # 延後嵌入的進度（status / pending_chunks / total_chunks）
 
 
 # ============ RAG 問答 ============
@@ -25,6 +37,7 @@ class DocumentResponse(BaseModel):
 class RAGQueryRequest(BaseModel):
     question: str = Field(..., description="要回答的問題", min_length=3)
     top_k: int = Field(default=5, description="檢索片段數量", ge=1, le=20)
+    mmr_lambda: Optional[float] = Field(default=None, description="MMR 相關度權重（越小結果越多樣；省略時使用伺服器預設）", ge=0, le=1)
     language: str = Field(default="zh-TW", description="輸出語言")
 
 
@@ -33,6 +46,25 @@ class RAGQueryResponse(BaseModel):
     answer: str
     sources: List[Dict]
     confidence: str
+    usage: Optional[Dict] = None
+
+
+class RAGChatRequest(BaseModel):
+    question: str = Field(..., description="要回答的問題", min_length=3)
+    session_id: Optional[str] = Field(default=None, description="會話 ID（首輪可省略）")
+    top_k: int = Field(default=5, description="檢索片段數量", ge=1, le=20)
+    mmr_lambda: Optional[float] = Field(default=None, description="MMR 相關度權重（越小結果越多樣；省略時使用伺服器預設）", ge=0, le=1)
+    language: str = Field(default="zh-TW", description="輸出語言")
+
+
+class RAGChatResponse(BaseModel):
+    session_id: str
+    turn: int
+    question: str
+    answer: str
+    sources: List[Dict]
+    confidence: str
+    usage: Optional[Dict] = None
 
 
 # ============ 摘要 ============
@@ -49,6 +81,16 @@ class URLSummaryRequest(BaseModel):
     url: List[str] = Field(..., description="要摘要的網址（可傳多個）", min_length=1)
     max_length: int = Field(default=200, description="摘要最大長度", ge=10, le=1000)
     language: str = Field(default="zh-TW", description="輸出語言")
+    stream: bool = Field(default=False, description="以 NDJSON 串流逐一返回各網址的結果")
+
+
+# ============ 網站爬取 ============
+
+class CrawlRequest(BaseModel):
+    seeds: List[str] = Field(..., description="起始網址（只追蹤同網站的連結）", min_length=1)
+    max_depth: int = Field(default=2, description="從起始網址起算的最大連結深度", ge=0, le=10)
+    max_pages: int = Field(default=50, description="最多抓取的網頁數", ge=1, le=2000)
+    concurrency: Optional[int] = Field(default=None, description="併發抓取的工作者數", ge=1, le=32)
 
 
 # ============ URL 問答 ============
@@ -56,6 +98,7 @@ class URLSummaryRequest(BaseModel):
 class URLQARequest(BaseModel):
     url: str = Field(..., description="要問答的網址", min_length=5)
     question: str = Field(..., description="要回答的問題", min_length=3)
+    top_k: int = Field(default=5, description="檢索片段數量", ge=1, le=20)
     language: str = Field(default="zh-TW", description="輸出語言")
 
 
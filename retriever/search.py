@@ -2,27 +2,33 @@
 相似度搜尋模組
 在向量資料庫中搜索相關內容
 """
-from typing import List
+from typing import List, Optional
+from config import MMR_LAMBDA
 from vectorstore import vector_store
 from ingest import get_embedding
+from utils.deadline import check_deadline
 
 
-async def search_similar_chunks(query: str, top_k: int = 5) -> List[dict]:
+async def search_similar_chunks(query: str, top_k: int = 5, mmr_lambda: Optional[float] = None) -> List[dict]:
     """
     搜索與查詢相關的文本片段
     
     Args:
         query: 查詢文本
         top_k: 返回最相關的 k 個結果
+        mmr_lambda: MMR 相關度權重，小於 1 時重新排序以減少重複內容（None 使用 MMR_LAMBDA）
     
     Returns:
-        相關片段列表，包含相似度分數
+        相關片段列表，包含相似度分數（尚未生成向量的片段以詞彙比對計分）
     """
     # 獲取查詢向量
     query_embedding = await get_embedding(query)
     
-    # 在向量資料庫中搜索
-    results = vector_store.search(query_embedding, top_k)
+    # 在向量資料庫中搜索（嵌入生成可能已耗盡請求期限）
+    check_deadline()
+    if mmr_lambda is None:
+        mmr_lambda = MMR_LAMBDA
+    results = await vector_store.asearch(query_embedding, top_k, query_text=query, mmr_lambda=mmr_lambda)
     
     return results
 
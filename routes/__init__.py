@@ -5,8 +5,10 @@ from .documents import router as documents_router
 from .rag import router as rag_router
 from .summary import router as summary_router
 from .url import router as url_router
+from .metrics import router as metrics_router
+from .crawl import router as crawl_router
 
-__all__ = ["documents_router", "rag_router", "summary_router", "url_router"]
+__all__ = ["documents_router", "rag_router", "summary_router", "url_router", "metrics_router", "crawl_router"]
 
 
 
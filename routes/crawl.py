@@ -0,0 +1,57 @@
+"""
+網站爬取路由
+建立爬取任務，將整個網站的網頁寫入知識庫
+"""
+from fastapi import APIRouter, HTTPException
+
+from models import CrawlRequest
+from services import site_crawler
+
+router = APIRouter(prefix="/api/crawl", tags=["網站爬取"])
+
+
+@router.post("", status_code=202)
+async def start_crawl(request: CrawlRequest):
+    """
+    🕸️ 建立爬取任務
+    
+    從起始網址沿同網站連結抓取網頁（深度與網頁數有上限），去除重複內容後分批寫入知識庫。
+    任務在背景執行，以 GET /api/crawl/{job_id} 查詢進度與每秒網頁數。
+    """
+    job = site_crawler.start(
+        seeds=request.seeds,
+        max_depth=request.max_depth,
+        max_pages=request.max_pages,
+        concurrency=request.concurrency
+    )
+    return job.to_dict()
+
+
+@router.get("")
+async def list_crawls():
+    """📋 列出爬取任務"""
+    jobs = [job.to_dict() for job in site_crawler.jobs.values()]
+    for job in jobs:
+        # 列表只顯示統計
+        job.pop("documents")
+        job.pop("errors")
+    return {"total": len(jobs), "jobs": jobs}
+
+
+@router.get("/{job_id}")
+async def get_crawl(job_id: str):
+    """📄 查詢爬取任務進度"""
+    job = site_crawler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到爬取任務: {job_id}")
+    return job.to_dict()
+
+
+@router.delete("/{job_id}")
+async def cancel_crawl(job_id: str):
+    """⏹️ 取消爬取任務（已寫入知識庫的網頁會保留）"""
+    if site_crawler.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"找不到爬取任務: {job_id}")
+    if not site_crawler.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"爬取任務已結束: {job_id}")
+    return {"message": f"已取消爬取任務 {job_id}"}
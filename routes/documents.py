@@ -2,12 +2,20 @@
 文檔管理路由
 處理文檔的上傳、查詢、刪除等操作
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+import tempfile
 import uuid
 
-from models import DocumentUploadRequest, DocumentResponse
-from vectorstore import vector_store
-from ingest import split_text, get_embeddings
+from config import EMBEDDING_MODEL, ARCHIVE_IMPORT_MAX_BYTES
+from models import DocumentUploadRequest, DocumentUpdateRequest, DocumentResponse
+from vectorstore import vector_store, MissingEmbeddingError
+from vectorstore.store import document_preview
+from vectorstore.archive import write_archive, read_archive, iter_file
+from ingest import split_text, embed_and_store
+from services.embedding_queue import embedding_queue
+from utils.executor import run_cpu_bound, run_in_thread
 
 router = APIRouter(prefix="/api/documents", tags=["文檔管理"])
 
@@ -18,42 +26,80 @@ async def upload_document(request: DocumentUploadRequest):
     📤 上傳文檔到知識庫
     
     文檔會被自動分割並建立向量索引，用於後續的 RAG 問答。
+    內容已存在於知識庫的片段（如重複的聲明或範本）沿用既有向量，不重新生成。
+    
+    上傳時會偵測近似重複的文檔（如同一文件的修訂版）並列在 near_duplicates；
+    設定 skip_near_duplicates=true 時不新增，直接返回最相似的既有文檔。
+    新增的近似重複文檔只有修改過的片段需要生成嵌入向量。
+    
+    設定 defer_embedding=true 時切割後立即返回，嵌入向量由背景佇列生成；
+    完成前這些片段以詞彙比對搜尋，進度見 GET /api/documents/{id} 的 indexing。
     """
     document_id = str(uuid.uuid4())[:8]
     
-    # 分割文檔
-    chunks = split_text(request.content)
+    near_duplicates = await run_in_thread(vector_store.find_near_duplicates, request.content)
+    if near_duplicates and request.skip_near_duplicates:
+        existing = await run_in_thread(vector_store.get_document, near_duplicates[0]["document_id"])
+        if existing:
+            return DocumentResponse(
+                document_id=existing["id"],
+                title=existing["title"],
+                content_length=existing["content_length"],
+                chunks_count=existing["chunks_count"],
+                embedded_chunks=0,
+                created_at=existing["created_at"],
+                near_duplicates=near_duplicates,
+                duplicate_of=existing["id"]
+            )
+    
+    # 分割文檔（長文檔在行程池切割）
+    chunks = await run_cpu_bound(split_text, request.content, size=len(request.content))
     
     if not chunks:
         raise HTTPException(status_code=400, detail="文檔內容太短")
     
-    # 生成嵌入向量
-    print(f"正在為 {len(chunks)} 個片段生成嵌入向量...")
-    embeddings = await get_embeddings(chunks)
+    def store(embeddings):
+        # 存入向量資料庫
+        return vector_store.add_document(
+            doc_id=document_id,
+            title=request.title,
+            content=request.content,
+            chunks=chunks,
+            embeddings=embeddings,
+            defer=request.defer_embedding
+        )
     
-    # 存入向量資料庫
-    vector_store.add_document(
-        doc_id=document_id,
-        title=request.title,
-        content=request.content,
-        chunks=chunks,
-        embeddings=embeddings
-    )
+    if request.defer_embedding:
+        # 已存在的內容沿用既有向量，其餘由背景佇列生成
+        embeddings = [None] * len(chunks)
+        doc = await run_in_thread(store, embeddings)
+    else:
+        # 只為新的片段內容生成嵌入向量
+        try:
+            embeddings, doc = await embed_and_store(vector_store, chunks, store)
+        except MissingEmbeddingError:
+            raise HTTPException(status_code=409, detail="知識庫在處理期間被其他請求修改，請重試")
+    embedded = sum(1 for e in embeddings if e is not None)
+    print(f"{len(chunks)} 個片段中 {embedded} 個生成了嵌入向量，其餘沿用既有向量或延後生成")
     
-    doc = vector_store.documents[document_id]
+    # 使用寫入時返回的文檔：之後其他請求可能已刪除這個文檔
+    if doc.get("indexing", {}).get("status") == "pending":
+        embedding_queue.submit(document_id)
     
     return DocumentResponse(
         document_id=document_id,
         title=request.title,
         content_length=doc["content_length"],
         chunks_count=doc["chunks_count"],
-        created_at=doc["created_at"]
+        embedded_chunks=embedded,
+        created_at=doc["created_at"],
+        near_duplicates=near_duplicates or None,
+        indexing=doc.get("indexing")
     )
 
 
-@router.get("")
-async def list_documents():
-    """📋 列出所有文檔"""
+def _document_list() -> dict:
+    """列出文檔摘要（在執行緒池執行：索引服務模式下可能需要取得新的快照）"""
     documents = []
     for doc_id, doc in vector_store.documents.items():
         documents.append({
@@ -62,7 +108,8 @@ async def list_documents():
             "content_length": doc["content_length"],
             "chunks_count": doc["chunks_count"],
             "created_at": doc["created_at"],
-            "preview": doc["content"][:100] + "..." if len(doc["content"]) > 100 else doc["content"]
+            "indexing_status": doc.get("indexing", {}).get("status", "ready"),
+            "preview": document_preview(doc)
         })
     
     return {
@@ -72,19 +119,145 @@ async def list_documents():
     }
 
 
+@router.get("")
+async def list_documents():
+    """📋 列出所有文檔"""
+    return await run_in_thread(_document_list)
+
+
+def _export_to_file():
+    """將知識庫寫入暫存檔（在執行緒池執行）"""
+    fileobj = tempfile.TemporaryFile()
+    try:
+        write_archive(vector_store, fileobj, EMBEDDING_MODEL)
+    except Exception:
+        fileobj.close()
+        raise
+    return fileobj
+
+
+@router.get("/export")
+async def export_archive():
+    """
+    📦 匯出知識庫
+    
+    以 zip 封存檔串流下載所有文檔、片段與已生成的嵌入向量（float32），
+    可在其他環境以 POST /api/documents/import 匯入，不需要重新生成向量。
+    """
+    fileobj = await run_in_thread(_export_to_file)
+    filename = f"knowledge_base_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        iter_file(fileobj),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import")
+async def import_archive(request: Request):
+    """
+    📥 匯入知識庫
+    
+    請求內容為 GET /api/documents/export 匯出的封存檔（以串流上傳）。
+    嵌入模型與向量維度須與目前的知識庫相同；向量直接批次加入，不呼叫嵌入服務。
+    ID 已存在的文檔會略過；匯出時尚未生成向量的片段交由背景佇列處理。
+    """
+    with tempfile.TemporaryFile() as fileobj:
+        received = 0
+        async for data in request.stream():
+            received += len(data)
+            if received > ARCHIVE_IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"封存檔超過 {ARCHIVE_IMPORT_MAX_BYTES} 位元組")
+            fileobj.write(data)
+        fileobj.seek(0)
+        
+        matrix = await run_in_thread(lambda: vector_store.matrix)
+        dimension = matrix.shape[1] if matrix.size else 0
+        try:
+            archive = await run_in_thread(read_archive, fileobj, EMBEDDING_MODEL, dimension)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result = await run_in_thread(
+            vector_store.import_documents,
+            archive["documents"], archive["texts"], archive["embeddings"], archive["refs"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if result["pending_chunks"]:
+        documents = await run_in_thread(lambda: vector_store.documents)
+        skipped = set(result["skipped"])
+        for doc in archive["documents"]:
+            if doc["id"] not in skipped and documents.get(doc["id"], {}).get("indexing", {}).get("status") == "pending":
+                embedding_queue.submit(doc["id"])
+    
+    return dict(result, embedding_model=archive["manifest"]["embedding_model"])
+
+
 @router.get("/{document_id}")
 async def get_document(document_id: str):
-    """📄 獲取特定文檔"""
-    if document_id not in vector_store.documents:
+    """📄 獲取特定文檔（延後嵌入的文檔附有 indexing 進度）"""
+    document = await run_in_thread(vector_store.get_document, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"找不到文檔 ID: {document_id}")
+    
+    return document
+
+
+@router.put("/{document_id}", response_model=DocumentResponse)
+async def update_document(document_id: str, request: DocumentUpdateRequest):
+    """
+    ✏️ 更新文檔內容
+    
+    重新切割新的內容，只為新增或修改過的片段生成嵌入向量，未改變的片段沿用既有向量。
+    文檔 ID 與建立時間不變。
+    """
+    existing = await run_in_thread(vector_store.get_document, document_id)
+    if existing is None:
+        raise HTTPException(status_code=404, detail=f"找不到文檔 ID: {document_id}")
+    
+    chunks = await run_cpu_bound(split_text, request.content, size=len(request.content))
+    if not chunks:
+        raise HTTPException(status_code=400, detail="文檔內容太短")
+    
+    def store(embeddings):
+        return vector_store.update_document(
+            doc_id=document_id,
+            title=request.title or existing["title"],
+            content=request.content,
+            chunks=chunks,
+            embeddings=embeddings
+        )
+    
+    try:
+        embeddings, changes = await embed_and_store(vector_store, chunks, store)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"找不到文檔 ID: {document_id}")
+    except MissingEmbeddingError:
+        raise HTTPException(status_code=409, detail="知識庫在處理期間被其他請求修改，請重試")
+    
+    # 更新後到返回前其他請求可能已刪除這個文檔
+    doc = await run_in_thread(vector_store.get_document, document_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail=f"找不到文檔 ID: {document_id}")
     
-    return vector_store.documents[document_id]
+    return DocumentResponse(
+        document_id=document_id,
+        title=doc["title"],
+        content_length=doc["content_length"],
+        chunks_count=doc["chunks_count"],
+        embedded_chunks=sum(1 for e in embeddings if e is not None),
+        created_at=doc["created_at"],
+        chunk_changes=changes
+    )
 
 
 @router.delete("/{document_id}")
 async def delete_document(document_id: str):
     """🗑️ 刪除文檔"""
-    if not vector_store.delete_document(document_id):
+    if not await run_in_thread(vector_store.delete_document, document_id):
         raise HTTPException(status_code=404, detail=f"找不到文檔 ID: {document_id}")
     
     return {"message": f"已成功刪除文檔 {document_id}"}
@@ -93,6 +266,6 @@ async def delete_document(document_id: str):
 @router.delete("")
 async def clear_all_documents():
     """🗑️ 清空所有文檔"""
-    vector_store.clear()
+    await run_in_thread(vector_store.clear)
     return {"message": "已清空所有文檔"}
 
@@ -0,0 +1,33 @@
+"""
+監控指標路由
+提供排程、佇列、事件迴圈延遲等運行時指標
+"""
+from fastapi import APIRouter
+
+from llm import llm_scheduler
+from llm.conversation import conversation_store
+from utils.ollama_pool import llm_pool, embedding_pool
+from services.fetch_cache import fetch_cache
+from services.crawler import site_crawler
+from services.embedding_queue import embedding_queue
+from utils.executor import loop_monitor, executor_stats
+
+router = APIRouter(prefix="/api/metrics", tags=["監控"])
+
+
+@router.get("")
+async def get_metrics():
+    """📈 運行時指標"""
+    return {
+        "event_loop": loop_monitor.stats(),
+        "executors": executor_stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "conversations": conversation_store.count(),
+        "fetch_cache": fetch_cache.stats(),
+        "crawler": site_crawler.stats(),
+        "embedding_queue": embedding_queue.stats(),
+        "ollama_backends": {
+            "llm": llm_pool.stats(),
+            "embedding": embedding_pool.stats()
+        }
+    }
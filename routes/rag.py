@@ -4,15 +4,29 @@ RAG 問答路由
 """
 from fastapi import APIRouter, HTTPException
 
-from models import RAGQueryRequest, RAGQueryResponse
+from models import RAGQueryRequest, RAGQueryResponse, RAGChatRequest, RAGChatResponse
 from vectorstore import vector_store
 from retriever import search_similar_chunks
 from llm import rag_qa
+from llm.conversation import conversation_store, conversational_rag_qa
 from utils.debug_logger import rag_debug_logger
+from utils.executor import run_in_thread
 
 router = APIRouter(prefix="/api/rag", tags=["RAG 問答"])
 
 
+def _format_sources(results):
+    """整理回應中的來源信息"""
+    return [
+        {
+            "document_title": r["title"],
+            "content": r["content"][:200] + "..." if len(r["content"]) > 200 else r["content"],
+            "relevance_score": round(r["score"], 3)
+        }
+        for r in results
+    ]
+
+
 @router.post("/query", response_model=RAGQueryResponse)
 async def rag_query(request: RAGQueryRequest):
     """
@@ -23,11 +37,11 @@ async def rag_query(request: RAGQueryRequest):
     2. 將片段作為上下文傳給 LLM
     3. LLM 根據上下文生成答案
     """
-    if vector_store.count_chunks() == 0:
+    if await run_in_thread(vector_store.count_chunks) == 0:
         raise HTTPException(status_code=400, detail="知識庫為空，請先上傳文檔")
     
     # 搜索相關片段
-    results = await search_similar_chunks(request.question, request.top_k)
+    results = await search_similar_chunks(request.question, request.top_k, request.mmr_lambda)
     
     # 記錄檢索過程（Debug）
     rag_debug_logger.log_retrieval(
@@ -37,19 +51,14 @@ async def rag_query(request: RAGQueryRequest):
     )
     
     # 準備來源信息
-    sources = []
-    for r in results:
-        sources.append({
-            "document_title": r["title"],
-            "content": r["content"][:200] + "..." if len(r["content"]) > 200 else r["content"],
-            "relevance_score": round(r["score"], 3)
-        })
+    sources = _format_sources(results)
     
     # 執行 RAG 問答
-    answer, confidence = await rag_qa(request.question, results, request.language)
+    answer, confidence, usage = await rag_qa(request.question, results, request.language)
     
-    # 記錄完整的 RAG 會話（Debug）
-    rag_debug_logger.log_full_rag_session(
+    # 記錄完整的 RAG 會話（Debug，寫檔在執行緒池進行）
+    await run_in_thread(
+        rag_debug_logger.log_full_rag_session,
         question=request.question,
         retrieved_chunks=results,
         answer=answer,
@@ -61,6 +70,61 @@ async def rag_query(request: RAGQueryRequest):
         question=request.question,
         answer=answer,
         sources=sources,
-        confidence=confidence
+        confidence=confidence,
+        usage=usage
     )
 
+
+@router.post("/chat", response_model=RAGChatResponse)
+async def rag_chat(request: RAGChatRequest):
+    """
+    💬 多輪對話 RAG
+    
+    首輪可省略 session_id，回應會帶回新的 session_id。
+    後續輪次延續模型的對話 context，只送出新問題與先前未提供過的片段。
+    """
+    if await run_in_thread(vector_store.count_chunks) == 0:
+        raise HTTPException(status_code=400, detail="知識庫為空，請先上傳文檔")
+    
+    session = conversation_store.get_or_create(request.session_id)
+    
+    results = await search_similar_chunks(request.question, request.top_k, request.mmr_lambda)
+    rag_debug_logger.log_retrieval(
+        query=request.question,
+        retrieved_chunks=results,
+        top_k=request.top_k
+    )
+    
+    # 同一會話的並行請求依序生成，後一輪延續前一輪返回的 context
+    async with session.lock:
+        answer, confidence, usage = await conversational_rag_qa(session, request.question, results, request.language)
+        turn = session.turn_count
+    
+    # 記錄完整的 RAG 會話（Debug，寫檔在執行緒池進行）
+    await run_in_thread(
+        rag_debug_logger.log_full_rag_session,
+        question=request.question,
+        retrieved_chunks=results,
+        answer=answer,
+        confidence=confidence,
+        top_k=request.top_k
+    )
+    
+    return RAGChatResponse(
+        session_id=session.session_id,
+        turn=turn,
+        question=request.question,
+        answer=answer,
+        sources=_format_sources(results),
+        confidence=confidence,
+        usage=usage
+    )
+
+
+@router.delete("/chat/{session_id}")
+async def end_chat(session_id: str):
+    """🗑️ 結束對話會話"""
+    if not conversation_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"找不到會話 ID: {session_id}")
+    
+    return {"message": f"已結束會話 {session_id}"}
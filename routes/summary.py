@@ -7,6 +7,7 @@ from fastapi import APIRouter, HTTPException
 from models import SummaryRequest
 from vectorstore import vector_store
 from llm import generate_summary
+from utils.executor import run_in_thread
 
 router = APIRouter(prefix="/api/summary", tags=["摘要"])
 
@@ -16,10 +17,10 @@ async def create_summary(request: SummaryRequest):
     """
     📝 生成文檔摘要
     """
-    if request.document_id not in vector_store.documents:
+    doc = await run_in_thread(vector_store.get_document, request.document_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail=f"找不到文檔 ID: {request.document_id}")
     
-    doc = vector_store.documents[request.document_id]
     text = doc["content"]
     
     summary = await generate_summary(text, request.max_length, request.language)
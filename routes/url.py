@@ -2,68 +2,96 @@
 URL 相關路由
 處理網址摘要和問答功能
 """
+import asyncio
+import json
+from typing import Dict
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 
+from config import URL_SUMMARY_CONCURRENCY
+
 from models import URLSummaryRequest, URLQARequest, URLQAResponse
-from services import fetch_webpage_content
-from llm.qa import call_ollama
+from services import fetch_webpage_content, url_index_cache
+from ingest import get_embedding
+from llm.qa import call_ollama, LANGUAGE_MAP
+from llm.context import pack_context
 from llm import generate_summary
 
 router = APIRouter(prefix="/api/url", tags=["URL 功能"])
 
+# 摘要使用的網頁內容字數
+SUMMARY_INPUT_CHARS = 5000
 
-@router.post("/summary")
-async def url_summary(request: URLSummaryRequest):
+
+async def _summarize_url(url: str, max_length: int, language: str, semaphore: asyncio.Semaphore) -> Dict:
     """
-    🌐 網址摘要（支援多個網址）
+    抓取單一網址並生成摘要
     
-    輸入一個或多個網址，系統會自動抓取網頁內容並生成摘要。
-    可以同時處理多個網址，返回每個網址的摘要。
+    Returns:
+        成功時 status 為 success，失敗時 status 為 error 並帶有 error 訊息
     """
-    results = []
-    errors = []
-    
-    # 處理每個網址
-    for url in request.url:
+    async with semaphore:
         try:
-            # 抓取網頁內容
-            webpage = await fetch_webpage_content(url)
+            # 抓取網頁內容（只需要摘要使用的長度）
+            webpage = await fetch_webpage_content(url, max_chars=SUMMARY_INPUT_CHARS)
             
             if not webpage["content"] or len(webpage["content"]) < 50:
-                errors.append({
+                return {
                     "url": url,
+                    "status": "error",
                     "error": "無法從網頁中提取足夠的文字內容，可能是網頁結構特殊或需要登入"
-                })
-                continue
+                }
             
             # 如果內容太長，先截取前 5000 字
             content = webpage["content"]
-            if len(content) > 5000:
-                content = content[:5000] + "..."
+            if webpage.get("truncated") or len(content) > SUMMARY_INPUT_CHARS:
+                content = content[:SUMMARY_INPUT_CHARS] + "..."
             
             # 使用摘要生成模組
-            summary = await generate_summary(content, request.max_length, request.language)
+            summary = await generate_summary(content, max_length, language)
             
-            results.append({
+            return {
                 "url": url,
                 "title": webpage["title"],
                 "original_length": len(webpage["content"]),
                 "summary": summary,
                 "summary_length": len(summary),
                 "status": "success"
-            })
+            }
             
         except HTTPException as e:
-            errors.append({
-                "url": url,
-                "error": e.detail
-            })
+            return {"url": url, "status": "error", "error": e.detail}
         except Exception as e:
-            errors.append({
-                "url": url,
-                "error": f"處理失敗: {str(e)}"
-            })
+            return {"url": url, "status": "error", "error": f"處理失敗: {str(e)}"}
+
+
+@router.post("/summary")
+async def url_summary(request: URLSummaryRequest):
+    """
+    🌐 網址摘要（支援多個網址）
+    
+    輸入一個或多個網址，系統會同時抓取網頁內容並生成摘要，返回每個網址的摘要。
+    同時處理的網址數與同一網站的抓取數皆有上限。
+    
+    設定 stream=true 時以 NDJSON 串流回應：每個網址完成後立即輸出一行結果，
+    最後一行為統計資訊（type 為 summary）。
+    """
+    semaphore = asyncio.Semaphore(URL_SUMMARY_CONCURRENCY)
+    
+    if request.stream:
+        return StreamingResponse(
+            _stream_summaries(request, semaphore),
+            media_type="application/x-ndjson"
+        )
+    
+    outcomes = await asyncio.gather(*[
+        _summarize_url(url, request.max_length, request.language, semaphore)
+        for url in request.url
+    ])
+    
+    results = [o for o in outcomes if o["status"] == "success"]
+    errors = [{"url": o["url"], "error": o["error"]} for o in outcomes if o["status"] == "error"]
     
     # 如果所有網址都失敗
     if len(results) == 0 and len(errors) > 0:
@@ -82,34 +110,57 @@ async def url_summary(request: URLSummaryRequest):
     }
 
 
+async def _stream_summaries(request: URLSummaryRequest, semaphore: asyncio.Semaphore):
+    """依完成順序逐行輸出各網址的摘要結果"""
+    tasks = [
+        asyncio.create_task(_summarize_url(url, request.max_length, request.language, semaphore))
+        for url in request.url
+    ]
+    success_count = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            outcome = await next_done
+            if outcome["status"] == "success":
+                success_count += 1
+            yield json.dumps(outcome, ensure_ascii=False) + "\n"
+    finally:
+        # 用戶端中斷時取消尚未完成的網址
+        for task in tasks:
+            task.cancel()
+    
+    yield json.dumps({
+        "type": "summary",
+        "total_urls": len(request.url),
+        "success_count": success_count,
+        "error_count": len(request.url) - success_count,
+        "created_at": datetime.now().isoformat()
+    }, ensure_ascii=False) + "\n"
+
+
 @router.post("/qa", response_model=URLQAResponse)
 async def url_qa(request: URLQARequest):
     """
     ❓ 網址問答
     
-    輸入網址和問題，系統會自動抓取網頁內容並根據內容回答問題。
+    輸入網址和問題，系統會抓取網頁內容、切割並建立向量索引，
+    只將與問題最相關的片段傳給 LLM。同一網頁的後續問題會沿用快取的索引。
     """
-    # 抓取網頁內容
-    webpage = await fetch_webpage_content(request.url)
+    # 取得網頁索引（抓取、切割、嵌入，或使用快取）
+    page = await url_index_cache.get(request.url)
     
-    if not webpage["content"] or len(webpage["content"]) < 50:
+    if not page.content or len(page.content) < 50:
         raise HTTPException(
             status_code=400,
             detail="無法從網頁中提取足夠的文字內容，可能是網頁結構特殊或需要登入"
         )
     
     # 語言設定
-    language_map = {
-        "zh-TW": "繁體中文",
-        "zh-CN": "简体中文",
-        "en": "English"
-    }
-    target_lang = language_map.get(request.language, "繁體中文")
+    target_lang = LANGUAGE_MAP.get(request.language, "繁體中文")
     
-    # 如果內容太長，先截取前 8000 字（問答需要更多上下文）
-    content = webpage["content"]
-    if len(content) > 8000:
-        content = content[:8000] + "..."
+    # 只檢索與問題相關的片段
+    question_embedding = await get_embedding(request.question)
+    results = await page.store.asearch(question_embedding, request.top_k)
+    context, _ = pack_context(results)
     
     system_prompt = """你是一個專業的問答助手。請根據提供的網頁內容回答問題。
 規則：
@@ -120,10 +171,10 @@ async def url_qa(request: URLQARequest):
     
     prompt = f"""請根據以下網頁內容回答問題。
 
-網頁標題：{webpage["title"]}
+網頁標題：{page.title}
 
 網頁內容：
-{content}
+{context}
 
 問題：{request.question}
 
@@ -135,6 +186,5 @@ async def url_qa(request: URLQARequest):
         url=request.url,
         question=request.question,
         answer=answer,
-        title=webpage["title"]
+        title=page.title
     )
-
@@ -3,8 +3,12 @@
 處理特殊功能（如 URL 處理）
 """
 from .url_service import fetch_webpage_content
+from .url_index import url_index_cache
+from .model_manager import model_manager
+from .crawler import site_crawler
+from .embedding_queue import embedding_queue
 
-__all__ = ["fetch_webpage_content"]
+__all__ = ["fetch_webpage_content", "url_index_cache", "model_manager", "site_crawler", "embedding_queue"]
 
 
 
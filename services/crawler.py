@@ -0,0 +1,302 @@
+"""
+網站爬取模組
+從種子網址開始沿同站連結抓取網頁，並分批寫入知識庫：
+- 非同步工作者池併發抓取，同一網站另有最小請求間隔
+- 以內容雜湊略過重複的網頁
+- 累積數個網頁後一次批量生成嵌入向量，再逐頁以 embed_and_store 寫入向量資料庫
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+from fastapi import HTTPException
+
+from config import CRAWL_CONCURRENCY, CRAWL_HOST_DELAY, CRAWL_INGEST_BATCH_SIZE, CRAWL_MAX_JOBS
+from ingest import split_text, get_embeddings, embed_new_chunks, embed_and_store
+from vectorstore import VectorStore, vector_store, MissingEmbeddingError
+from services.url_service import fetch_webpage
+from services.extractor import extract_links
+from utils.deadline import current_deadline
+from utils.debug_logger import logger
+from utils.executor import run_cpu_bound
+from utils.request_context import DEFAULT_CLIENT, DEFAULT_ENDPOINT, bind_request
+
+MAX_ERRORS = 50  # 每個任務保留的錯誤紀錄數
+
+EmbedFunc = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def _normalize_seed(url: str) -> str:
+    url = url.strip()
+    if not urlparse(url).scheme:
+        url = "https://" + url
+    return url
+
+
+class CrawlJob:
+    """單一爬取任務的設定、進度與統計"""
+
+    def __init__(self, seeds: List[str], max_depth: int, max_pages: int, concurrency: int):
+        self.id = str(uuid.uuid4())[:8]
+        self.seeds = [_normalize_seed(url) for url in seeds]
+        self.hosts = {urlparse(url).netloc for url in self.seeds}
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.status = "pending"
+        self.counters = {"fetched": 0, "failed": 0, "duplicates": 0, "empty": 0, "ingested": 0, "chunks": 0}
+        self.documents: List[Dict] = []
+        self.errors: List[Dict] = []
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+        # 執行期間的狀態
+        self.queue: "asyncio.Queue" = asyncio.Queue()
+        self.seen: Set[str] = set()
+        self.hashes: Set[str] = set()
+        self.pending: List[Dict] = []
+        self.claimed = 0
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def record_error(self, url: str, error: str):
+        self.counters["failed"] += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"url": url, "error": error})
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def to_dict(self) -> Dict:
+        elapsed = self.elapsed()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "seeds": self.seeds,
+            "max_depth": self.max_depth,
+            "max_pages": self.max_pages,
+            "concurrency": self.concurrency,
+            "created_at": self.created_at,
+            "elapsed_seconds": round(elapsed, 2),
+            "pages_per_second": round(self.counters["fetched"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "queued": self.queue.qsize(),
+            **self.counters,
+            "documents": self.documents,
+            "errors": self.errors
+        }
+
+
+class SiteCrawler:
+    """網站爬取任務管理"""
+
+    def __init__(
+        self,
+        store: VectorStore = vector_store,
+        embed: EmbedFunc = get_embeddings,
+        host_delay: float = CRAWL_HOST_DELAY,
+        batch_size: int = CRAWL_INGEST_BATCH_SIZE,
+        max_jobs: int = CRAWL_MAX_JOBS
+    ):
+        self.store = store
+        self.embed = embed
+        self.host_delay = host_delay
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, CrawlJob]" = OrderedDict()
+
+    def start(
+        self,
+        seeds: List[str],
+        max_depth: int,
+        max_pages: int,
+        concurrency: Optional[int] = None
+    ) -> CrawlJob:
+        """
+        建立並在背景執行爬取任務
+        
+        Args:
+            seeds: 種子網址（只追蹤與種子相同網站的連結）
+            max_depth: 從種子起算的最大連結深度
+            max_pages: 最多抓取的網頁數
+            concurrency: 工作者數（預設 CRAWL_CONCURRENCY）
+        
+        Returns:
+            爬取任務
+        """
+        job = CrawlJob(seeds, max_depth, max_pages, concurrency or CRAWL_CONCURRENCY)
+        self.jobs[job.id] = job
+        # 只保留最近的已結束任務
+        for job_id in [j.id for j in self.jobs.values() if j.done][:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消執行中的任務，已寫入知識庫的網頁會保留"""
+        job = self.jobs.get(job_id)
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    async def wait(self, job_id: str) -> CrawlJob:
+        """等待任務結束"""
+        job = self.jobs[job_id]
+        try:
+            await asyncio.shield(job.task)
+        except asyncio.CancelledError:
+            if not job.task.cancelled():
+                raise
+        return job
+
+    async def _run(self, job: CrawlJob):
+        # 背景任務不沿用建立任務的請求期限與端點、用戶端識別
+        current_deadline.set(None)
+        bind_request(DEFAULT_ENDPOINT, DEFAULT_CLIENT)
+        job.status = "running"
+        job.started_at = time.monotonic()
+        logger.info(f"Crawl {job.id} started: seeds={job.seeds}, depth={job.max_depth}, pages={job.max_pages}")
+
+        for url in job.seeds:
+            if url not in job.seen:
+                job.seen.add(url)
+                job.queue.put_nowait((url, 0))
+
+        workers = [asyncio.create_task(self._worker(job)) for _ in range(job.concurrency)]
+        try:
+            await job.queue.join()
+            await self._ingest(job)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.errors.append({"url": None, "error": f"{type(e).__name__}: {e}"})
+            logger.error(f"Crawl {job.id} failed: {e}")
+        finally:
+            for worker in workers:
+                worker.cancel()
+            job.finished_at = time.monotonic()
+            logger.info(f"Crawl {job.id} {job.status}: {job.to_dict()['pages_per_second']} pages/s, {job.counters}")
+
+    async def _worker(self, job: CrawlJob):
+        while True:
+            url, depth = await job.queue.get()
+            try:
+                if job.claimed < job.max_pages:
+                    job.claimed += 1
+                    await self._crawl_page(job, url, depth)
+            except Exception as e:
+                job.record_error(url, f"{type(e).__name__}: {e}")
+            finally:
+                job.queue.task_done()
+
+    async def _crawl_page(self, job: CrawlJob, url: str, depth: int):
+        """抓取單一網頁、加入同站連結，並在累積足夠網頁後寫入知識庫"""
+        try:
+            page, html = await fetch_webpage(url, min_interval=self.host_delay)
+        except HTTPException as e:
+            job.record_error(url, str(e.detail))
+            return
+        job.counters["fetched"] += 1
+        job.seen.add(page["url"])
+
+        if depth < job.max_depth and job.claimed < job.max_pages:
+            for link in await run_cpu_bound(extract_links, html, page["url"], size=len(html)):
+                if link not in job.seen and urlparse(link).netloc in job.hosts:
+                    job.seen.add(link)
+                    job.queue.put_nowait((link, depth + 1))
+
+        if not page["content"]:
+            job.counters["empty"] += 1
+            return
+        digest = hashlib.sha256(page["content"].encode("utf-8")).hexdigest()
+        if digest in job.hashes:
+            job.counters["duplicates"] += 1
+            return
+        job.hashes.add(digest)
+
+        job.pending.append(page)
+        if len(job.pending) >= self.batch_size:
+            await self._ingest(job)
+
+    async def _ingest(self, job: CrawlJob):
+        """
+        將累積的網頁切割後一次生成嵌入向量，再逐頁寫入知識庫
+
+        寫入時沿用批量生成的向量；期間被刪除而需要重新嵌入的片段由 embed_and_store 補上。
+        單一網頁寫入失敗時記錄錯誤，不影響同批的其他網頁。
+        """
+        pages, job.pending = job.pending, []
+        if not pages:
+            return
+        chunk_lists = await asyncio.gather(*[
+            run_cpu_bound(split_text, page["content"], size=len(page["content"])) for page in pages
+        ])
+        texts = [chunk for chunks in chunk_lists for chunk in chunks]
+        if not texts:
+            return
+        try:
+            vectors = dict(zip(texts, await embed_new_chunks(self.store, texts, self.embed)))
+        except HTTPException as e:
+            for page in pages:
+                job.record_error(page["url"], str(e.detail))
+            return
+
+        async def embed(missing: List[str]) -> List[List[float]]:
+            new = [text for text in missing if vectors.get(text) is None]
+            if new:
+                vectors.update(zip(new, await self.embed(new)))
+            return [vectors[text] for text in missing]
+
+        for page, chunks in zip(pages, chunk_lists):
+            if not chunks:
+                continue
+            document_id = str(uuid.uuid4())[:8]
+
+            def write(embeddings, page=page, chunks=chunks, document_id=document_id):
+                self.store.add_document(
+                    doc_id=document_id,
+                    title=page["title"] or page["url"],
+                    content=page["content"],
+                    chunks=chunks,
+                    embeddings=embeddings
+                )
+
+            try:
+                await embed_and_store(self.store, chunks, write, embed)
+            except MissingEmbeddingError as e:
+                job.record_error(page["url"], f"知識庫在處理期間被修改: {e}")
+                continue
+            except HTTPException as e:
+                job.record_error(page["url"], str(e.detail))
+                continue
+            job.counters["ingested"] += 1
+            job.counters["chunks"] += len(chunks)
+            job.documents.append({"document_id": document_id, "url": page["url"], "title": page["title"]})
+
+    def stats(self) -> Dict:
+        """返回爬取任務統計"""
+        return {
+            "jobs": len(self.jobs),
+            "running": sum(1 for job in self.jobs.values() if job.status == "running")
+        }
+
+
+# 全局網站爬取實例
+site_crawler = SiteCrawler()
@@ -0,0 +1,111 @@
+"""
+延後嵌入佇列
+延後嵌入上傳的文檔先以詞彙比對搜尋，由背景工作者分批生成嵌入向量並補進向量資料庫；
+每批完成後文檔的 indexing 進度即更新
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config import DEFERRED_EMBED_WORKERS, EMBEDDING_BATCH_SIZE
+from ingest import get_embeddings
+from vectorstore import VectorStore, vector_store
+from utils.debug_logger import logger
+from utils.deadline import current_deadline
+from utils.executor import run_in_thread
+from utils.request_context import DEFAULT_CLIENT, DEFAULT_ENDPOINT, bind_request
+
+EmbedFunc = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class EmbeddingQueue:
+    """背景嵌入佇列"""
+
+    def __init__(
+        self,
+        store: VectorStore = vector_store,
+        embed: EmbedFunc = get_embeddings,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        workers: int = DEFERRED_EMBED_WORKERS
+    ):
+        self.store = store
+        self.embed = embed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "embedded_chunks": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, doc_id: str):
+        """將文檔加入佇列（第一次使用時啟動工作者）"""
+        if not self._tasks:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+        self.counters["submitted"] += 1
+        self._queue.put_nowait(doc_id)
+
+    async def stop(self):
+        """停止工作者（未完成的文檔維持詞彙比對搜尋）"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def join(self):
+        """等待佇列中的文檔全部處理完"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self):
+        # 工作者在第一個延後上傳的請求中建立，不沿用該請求的期限與端點、用戶端識別
+        current_deadline.set(None)
+        bind_request(DEFAULT_ENDPOINT, DEFAULT_CLIENT)
+        while True:
+            doc_id = await self._queue.get()
+            try:
+                await self._process(doc_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, doc_id: str):
+        """
+        分批為文檔的待嵌入片段生成向量，直到全部補上或文檔已不存在
+
+        嵌入服務返回的向量不足而待嵌入片段沒有減少時視為失敗，不重複送出同一批。
+        """
+        try:
+            previous = None
+            while True:
+                pending = await run_in_thread(self.store.pending_chunks, doc_id)
+                if not pending:
+                    break
+                if previous is not None and len(pending) >= previous:
+                    raise RuntimeError(f"嵌入服務未返回向量，仍有 {len(pending)} 個片段待嵌入")
+                previous = len(pending)
+                # 其他文檔已存入的相同內容不需重新生成
+                texts = (await run_in_thread(self.store.missing_chunks, pending))[:self.batch_size]
+                embeddings = await self.embed(texts) if texts else []
+                if not await run_in_thread(self.store.attach_embeddings, doc_id, texts, embeddings):
+                    break
+                self.counters["embedded_chunks"] += len(texts)
+            self.counters["completed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.counters["failed"] += 1
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.warning(f"Deferred embedding failed for document {doc_id}: {error}")
+            await run_in_thread(self.store.mark_indexing_failed, doc_id, str(error))
+
+    def stats(self) -> Dict:
+        """返回佇列統計"""
+        return dict(self.counters, queued=self._queue.qsize() if self._queue else 0, workers=len(self._tasks))
+
+
+# 全局延後嵌入佇列實例
+embedding_queue = EmbeddingQueue()
@@ -0,0 +1,251 @@
+"""
+網頁內容提取模組
+從 HTML 提取標題與主要內容，提供兩種可替換的實作：
+- soup：BeautifulSoup 完整解析樹（原始實作）
+- lxml：直接使用 lxml.html，省去 BeautifulSoup 的 Python 物件樹，結果與 soup 相同
+
+兩者皆可指定 max_chars：超過時截斷內容並標記 truncated，lxml 收集到足夠文字後即停止。
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin, urldefrag
+
+from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+
+from config import HTML_EXTRACTOR
+
+# 提取前移除的標籤
+REMOVED_TAGS = ("script", "style", "nav", "footer", "header", "aside")
+CONTENT_CLASS_PATTERN = re.compile("content|article|post|entry")
+MIN_CONTENT_LENGTH = 100
+
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+_REMOVED_MARKER = "_removed"
+
+
+def _clean(content: str) -> str:
+    """移除多餘空白"""
+    content = re.sub(r'\n\s*\n', '\n\n', content)
+    return content.strip()
+
+
+def _finish(title: str, content: str, max_chars: Optional[int]) -> Dict:
+    """清理內容並依 max_chars 截斷"""
+    content = _clean(content)
+    truncated = max_chars is not None and len(content) > max_chars
+    return {
+        "title": title,
+        "content": content[:max_chars] if truncated else content,
+        "truncated": truncated
+    }
+
+
+class BaseExtractor:
+    """網頁內容提取器"""
+
+    name = "base"
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> Dict:
+        """
+        從 HTML 提取標題與主要內容
+        
+        Args:
+            html: 網頁 HTML
+            max_chars: 內容的最大字數（None 為不限制）
+        
+        Returns:
+            包含標題、內容與是否截斷（truncated）的字典
+        """
+        raise NotImplementedError
+
+
+class SoupExtractor(BaseExtractor):
+    """BeautifulSoup 提取器"""
+
+    name = "soup"
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> Dict:
+        # 解析 HTML
+        soup = BeautifulSoup(html, 'lxml')
+        
+        # 移除 script 和 style 標籤
+        for script in soup(list(REMOVED_TAGS)):
+            script.decompose()
+        
+        # 提取標題
+        title = ""
+        if soup.title:
+            title = soup.title.get_text().strip()
+        elif soup.find("h1"):
+            title = soup.find("h1").get_text().strip()
+        
+        # 提取主要內容
+        # 優先查找 article, main, 或包含大量文字的 div
+        content = ""
+        article = soup.find("article") or soup.find("main") or soup.find("div", class_=CONTENT_CLASS_PATTERN)
+        
+        if article:
+            content = article.get_text(separator="\n", strip=True)
+        else:
+            # 如果沒有找到特定標籤，提取所有段落
+            paragraphs = soup.find_all("p")
+            content = "\n".join([p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True)])
+        
+        # 如果內容太短，嘗試提取 body
+        if len(content) < MIN_CONTENT_LENGTH:
+            body = soup.find("body")
+            if body:
+                content = body.get_text(separator="\n", strip=True)
+        
+        return _finish(title, content, max_chars)
+
+
+def _strings(element) -> Iterable[str]:
+    """與 BeautifulSoup 的 strip=True 相同：逐段去除空白並略過空字串（註解不計）"""
+    for text in element.itertext():
+        text = text.strip()
+        if text:
+            yield text
+
+
+def _take(pieces: Iterable[str], max_chars: Optional[int]) -> str:
+    """
+    以換行串接文字片段，清理後的長度超過 max_chars 即停止讀取後續片段
+
+    片段皆已去除前後空白且不為空，清理只會在片段內部進行，
+    因此提早停止得到的內容與完整內容清理後的前綴相同。
+    """
+    if max_chars is None:
+        return "\n".join(pieces)
+    # 至少收集到判斷內容是否過短所需的長度
+    limit = max(max_chars, MIN_CONTENT_LENGTH)
+    collected = []
+    length = -1
+    target = limit
+    for piece in pieces:
+        collected.append(piece)
+        length += len(piece) + 1
+        if length > target:
+            cleaned = len(_clean("\n".join(collected)))
+            if cleaned > limit:
+                break
+            target = length + limit - cleaned
+    return "\n".join(collected)
+
+
+def _has_content_class(element) -> bool:
+    classes = element.get("class")
+    if not classes:
+        return False
+    return any(CONTENT_CLASS_PATTERN.search(c) for c in classes.split()) or bool(CONTENT_CLASS_PATTERN.search(classes))
+
+
+class LxmlExtractor(BaseExtractor):
+    """
+    lxml 快速提取器
+
+    移除標籤時只清空節點並保留其後的文字節點，文字的分段方式因此與 BeautifulSoup 的
+    decompose 一致；所有查找都在 libxml2 的樹上進行，每段文字只取一次。
+    """
+
+    name = "lxml"
+
+    def _parse(self, html: str):
+        # lxml 不接受帶有編碼宣告的 Unicode 字串
+        html = _XML_DECLARATION.sub("", html, count=1)
+        try:
+            return lxml_html.document_fromstring(html)
+        except (etree.ParserError, ValueError):
+            return None
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> Dict:
+        root = self._parse(html)
+        if root is None:
+            return _finish("", "", max_chars)
+        
+        for element in list(root.iter(*REMOVED_TAGS)):
+            element.clear(keep_tail=True)
+            element.tag = _REMOVED_MARKER
+        
+        title = ""
+        heading = root.find(".//title")
+        if heading is None:
+            heading = root.find(".//h1")
+        if heading is not None:
+            title = "".join(heading.itertext()).strip()
+        
+        article = root.find(".//article")
+        if article is None:
+            article = root.find(".//main")
+        if article is None:
+            article = next((div for div in root.iter("div") if _has_content_class(div)), None)
+        
+        if article is not None:
+            content = _take(_strings(article), max_chars)
+        else:
+            paragraphs = ("".join(_strings(p)) for p in root.iter("p"))
+            content = _take((text for text in paragraphs if text), max_chars)
+        
+        if len(content) < MIN_CONTENT_LENGTH:
+            body = root.find(".//body")
+            if body is not None:
+                content = _take(_strings(body), max_chars)
+        
+        return _finish(title, content, max_chars)
+
+
+def extract_links(html: str, base_url: str) -> List[str]:
+    """
+    提取網頁中的 http(s) 連結
+    
+    Args:
+        html: 網頁 HTML
+        base_url: 解析相對連結的網址（網頁中的 <base href> 優先）
+    
+    Returns:
+        去除錨點後的絕對網址（依出現順序，不重複）
+    """
+    try:
+        root = lxml_html.document_fromstring(_XML_DECLARATION.sub("", html, count=1))
+    except (etree.ParserError, ValueError):
+        return []
+    
+    base = root.find(".//base[@href]")
+    if base is not None:
+        base_url = urljoin(base_url, base.get("href").strip())
+    
+    links = {}
+    for anchor in root.iter("a"):
+        href = (anchor.get("href") or "").strip()
+        if not href:
+            continue
+        link, _ = urldefrag(urljoin(base_url, href))
+        if link.startswith(("http://", "https://")):
+            links.setdefault(link, None)
+    return list(links)
+
+
+EXTRACTORS: Dict[str, BaseExtractor] = {
+    extractor.name: extractor for extractor in (SoupExtractor(), LxmlExtractor())
+}
+
+
+def get_extractor(name: str = HTML_EXTRACTOR) -> BaseExtractor:
+    """
+    取得網頁內容提取器
+    
+    Args:
+        name: 提取器名稱（lxml 或 soup）
+    
+    Raises:
+        ValueError: 名稱不存在時
+    """
+    if name not in EXTRACTORS:
+        raise ValueError(f"未知的網頁內容提取器: {name}（可用: {', '.join(EXTRACTORS)}）")
+    return EXTRACTORS[name]
+
+
+def extract(html: str, max_chars: Optional[int] = None, name: str = HTML_EXTRACTOR) -> Dict:
+    """以指定的提取器提取內容（模組層級函數，可送到行程池執行）"""
+    return get_extractor(name).extract(html, max_chars)
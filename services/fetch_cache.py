@@ -0,0 +1,259 @@
+"""
+網頁抓取快取模組
+兩層快取（記憶體 LRU + 磁碟）保存網頁原始內容與提取後的文字，
+依 Cache-Control / Expires 判斷新鮮度，過期後以 ETag / Last-Modified 條件請求重新驗證
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import FETCH_CACHE_MEMORY_SIZE, FETCH_CACHE_DIR, FETCH_CACHE_DISK_MAX_ENTRIES, FETCH_CACHE_DEFAULT_TTL
+from utils.debug_logger import logger
+from utils.executor import run_in_thread
+
+
+class CacheEntry:
+    """單一網址的快取內容"""
+
+    def __init__(
+        self,
+        url: str,
+        html: str,
+        result: Dict[str, str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        expires_at: float = 0.0,
+        max_chars: Optional[int] = None
+    ):
+        self.url = url
+        self.html = html
+        self.result = result
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.max_chars = max_chars  # 提取 result 時的字數上限
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def covers(self, max_chars: Optional[int]) -> bool:
+        """快取的提取結果是否足以回應指定字數上限的請求"""
+        if not self.result.get("truncated"):
+            return True
+        return max_chars is not None and self.max_chars is not None and max_chars <= self.max_chars
+
+    def validators(self) -> Dict[str, str]:
+        """條件請求使用的標頭"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "html": self.html,
+            "result": self.result,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "expires_at": self.expires_at,
+            "max_chars": self.max_chars
+        }
+
+
+def freshness_lifetime(headers) -> Optional[float]:
+    """
+    依回應標頭計算快取的有效秒數
+
+    Args:
+        headers: HTTP 回應標頭
+
+    Returns:
+        有效秒數；回應不可快取（no-store）時返回 None
+    """
+    directives = {}
+    for part in headers.get("cache-control", "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+
+    age = 0.0
+    try:
+        age = float(headers.get("age", 0))
+    except ValueError:
+        pass
+
+    if "max-age" in directives:
+        try:
+            return max(0.0, float(directives["max-age"]) - age)
+        except ValueError:
+            return 0.0
+
+    if headers.get("expires"):
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+            return max(0.0, expires - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+
+    return float(FETCH_CACHE_DEFAULT_TTL)
+
+
+class FetchCache:
+    """
+    記憶體 LRU + 磁碟兩層的網頁快取
+
+    磁碟的讀寫與刪除在執行緒池執行，不阻塞事件迴圈；磁碟上各項目的大小與寫入時間保存在記憶體，
+    寫入時不需重新列出快取目錄（目錄只在第一次使用時掃描一次）。
+    """
+
+    def __init__(
+        self,
+        memory_size: int = FETCH_CACHE_MEMORY_SIZE,
+        cache_dir: str = FETCH_CACHE_DIR,
+        disk_max_entries: int = FETCH_CACHE_DISK_MAX_ENTRIES
+    ):
+        self.memory_size = memory_size
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # 磁碟項目檔名 → 大小（位元組），依寫入時間排序；None 為尚未掃描目錄
+        self._disk: Optional["OrderedDict[str, int]"] = None
+        self._disk_lock = asyncio.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "revalidated": 0}
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _name(self, url: str) -> str:
+        return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    async def _disk_index(self) -> "OrderedDict[str, int]":
+        """磁碟項目索引（第一次使用時在執行緒池掃描目錄）"""
+        if self._disk is None:
+            async with self._disk_lock:
+                if self._disk is None:
+                    self._disk = await run_in_thread(_scan_dir, self.cache_dir)
+        return self._disk
+
+    async def get(self, url: str) -> Optional[CacheEntry]:
+        """
+        查詢快取（先查記憶體，再查磁碟）
+
+        Args:
+            url: 網頁 URL
+
+        Returns:
+            快取內容；不存在時返回 None
+        """
+        entry = self._memory.get(url)
+        if entry is not None:
+            self._memory.move_to_end(url)
+            self.counters["memory_hits"] += 1
+            return entry
+
+        if self.cache_dir:
+            name = self._name(url)
+            if name in await self._disk_index():
+                path = self.cache_dir / name
+                try:
+                    entry = CacheEntry(**await run_in_thread(_read_json, path))
+                    self._remember(url, entry)
+                    self.counters["disk_hits"] += 1
+                    return entry
+                except (OSError, ValueError, TypeError) as e:
+                    logger.warning(f"Fetch cache entry unreadable, ignoring: {path} ({e})")
+                    self._disk.pop(name, None)
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, entry: CacheEntry):
+        """寫入兩層快取（磁碟寫入在執行緒池執行）"""
+        self._remember(entry.url, entry)
+        if not self.cache_dir:
+            return
+        disk = await self._disk_index()
+        name = self._name(entry.url)
+        try:
+            disk[name] = await run_in_thread(_write_json, self.cache_dir / name, entry.to_dict())
+        except OSError as e:
+            logger.warning(f"Fetch cache write failed: {e}")
+            return
+        disk.move_to_end(name)
+        await self._prune_disk()
+
+    def _remember(self, url: str, entry: CacheEntry):
+        self._memory[url] = entry
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def _prune_disk(self):
+        """磁碟快取超過上限時刪除最舊的項目"""
+        disk = self._disk
+        stale = []
+        while len(disk) > self.disk_max_entries:
+            stale.append(self.cache_dir / disk.popitem(last=False)[0])
+        if stale:
+            await run_in_thread(_unlink_all, stale)
+
+    def stats(self) -> Dict:
+        """返回快取統計"""
+        stats = dict(self.counters, memory_entries=len(self._memory))
+        if self._disk is not None:
+            stats.update(disk_entries=len(self._disk), disk_bytes=sum(self._disk.values()))
+        return stats
+
+
+def _scan_dir(cache_dir: Path) -> "OrderedDict[str, int]":
+    """列出快取目錄的項目（依修改時間排序）"""
+    entries = []
+    for path in cache_dir.glob("*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, path.name, stat.st_size))
+    entries.sort()
+    return OrderedDict((name, size) for _, name, size in entries)
+
+
+def _read_json(path: Path) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: Path, data: Dict) -> int:
+    """寫入暫存檔後改名，讀取端不會讀到寫到一半的檔案；返回檔案大小"""
+    encoded = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    temp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    try:
+        temp.write_bytes(encoded)
+        os.replace(temp, path)
+    except OSError:
+        temp.unlink(missing_ok=True)
+        raise
+    return len(encoded)
+
+
+def _unlink_all(paths: List[Path]):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+# 全局抓取快取實例
+fetch_cache = FetchCache()
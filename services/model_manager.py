@@ -0,0 +1,148 @@
+"""
+模型生命週期管理模組
+啟動時預熱 LLM 與嵌入模型，背景定期探測 Ollama 並快取健康狀態
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+from config import (
+    OLLAMA_MODEL, EMBEDDING_MODEL, OLLAMA_KEEP_ALIVE,
+    MODEL_WARMUP_ENABLED, MODEL_WARMUP_TIMEOUT, HEALTH_PROBE_INTERVAL
+)
+from utils.debug_logger import logger
+from utils.ollama_pool import Backend, llm_pool, embedding_pool
+
+
+class ModelManager:
+    """Ollama 模型的預熱與健康探測"""
+
+    def __init__(self, probe_interval: float = HEALTH_PROBE_INTERVAL):
+        self.probe_interval = probe_interval
+        self.status: Dict = {
+            "ollama_status": "unknown",
+            "embedding_status": "unknown",
+            "checked_at": None
+        }
+        self.cold_start: Dict = {}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """預熱模型並啟動背景健康探測"""
+        if MODEL_WARMUP_ENABLED:
+            await self.warm_up()
+        await self.probe()
+        self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        """停止背景健康探測"""
+        if self._probe_task:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    async def _timed_post(self, client: httpx.AsyncClient, url: str, path: str, payload: Dict) -> Dict:
+        """送出預熱請求並記錄耗時"""
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"{url}{path}", json=payload)
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            if response.status_code != 200:
+                return {"ms": elapsed_ms, "error": f"HTTP {response.status_code}"}
+            return {"ms": elapsed_ms}
+        except httpx.HTTPError as e:
+            return {"ms": round((time.perf_counter() - started) * 1000, 1), "error": type(e).__name__}
+
+    async def warm_up(self):
+        """
+        以極小的請求在每個後端載入 LLM 與嵌入模型，並透過 keep_alive 讓模型常駐記憶體
+        """
+        generate_payload = {"model": OLLAMA_MODEL, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE}
+        embed_payload = {"model": EMBEDDING_MODEL, "input": "warm up", "keep_alive": OLLAMA_KEEP_ALIVE}
+
+        async with httpx.AsyncClient(timeout=MODEL_WARMUP_TIMEOUT) as client:
+            # 空的 prompt 只會載入模型，不會生成文字
+            llm_results = await asyncio.gather(*[
+                self._timed_post(client, b.url, "/api/generate", generate_payload)
+                for b in llm_pool.backends
+            ])
+            embedding_results = await asyncio.gather(*[
+                self._timed_post(client, b.url, "/api/embed", embed_payload)
+                for b in embedding_pool.backends
+            ])
+
+        self.cold_start = {
+            "llm": dict(zip([b.url for b in llm_pool.backends], llm_results)),
+            "embedding": dict(zip([b.url for b in embedding_pool.backends], embedding_results)),
+            "warmed_at": datetime.now().isoformat()
+        }
+        logger.info(f"Model warm-up: {self.cold_start}")
+
+    async def _probe_backend(self, client: httpx.AsyncClient, url: str) -> Dict:
+        """探測單一後端，返回狀態與已下載的模型"""
+        try:
+            response = await client.get(f"{url}/api/tags")
+            if response.status_code != 200:
+                return {"status": "error", "models": []}
+            models = [m.get("name", "") for m in response.json().get("models", [])]
+            return {"status": "healthy", "models": models}
+        except Exception:
+            return {"status": "unreachable", "models": []}
+
+    def _apply_probe(self, backends: List[Backend], results: Dict[str, Dict]):
+        """依探測結果更新後端的健康狀態"""
+        for backend in backends:
+            result = results[backend.url]
+            if result["status"] == "healthy":
+                backend.mark_healthy()
+            else:
+                backend.record_failure()
+
+    async def probe(self):
+        """探測所有 Ollama 後端並更新快取"""
+        urls = list(dict.fromkeys(b.url for b in llm_pool.backends + embedding_pool.backends))
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            probed = await asyncio.gather(*[self._probe_backend(client, url) for url in urls])
+        results = dict(zip(urls, probed))
+
+        self._apply_probe(llm_pool.backends, results)
+        self._apply_probe(embedding_pool.backends, results)
+
+        llm_statuses = [results[b.url]["status"] for b in llm_pool.backends]
+        if "healthy" in llm_statuses:
+            ollama_status = "healthy"
+        elif "error" in llm_statuses:
+            ollama_status = "error"
+        else:
+            ollama_status = "unreachable"
+
+        # 檢查嵌入模型是否存在
+        embedding_results = [results[b.url] for b in embedding_pool.backends]
+        if any(any(EMBEDDING_MODEL in name for name in r["models"]) for r in embedding_results):
+            embedding_status = "ready"
+        elif any(r["status"] == "healthy" for r in embedding_results):
+            embedding_status = f"missing - 請執行: ollama pull {EMBEDDING_MODEL}"
+        else:
+            embedding_status = "unknown"
+
+        self.status = {
+            "ollama_status": ollama_status,
+            "embedding_status": embedding_status,
+            "backends": {url: r["status"] for url, r in results.items()},
+            "checked_at": datetime.now().isoformat()
+        }
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            await self.probe()
+
+
+# 全局模型管理器實例
+model_manager = ModelManager()
@@ -0,0 +1,126 @@
+"""
+網頁索引快取模組
+將網頁內容切割並建立向量索引，依網址與內容雜湊快取
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from config import URL_INDEX_CACHE_SIZE, URL_INDEX_TTL
+from ingest import split_text, embed_new_chunks
+from utils.executor import run_cpu_bound, run_in_thread
+from vectorstore import VectorStore
+from services.url_service import fetch_webpage_content
+
+
+class PageIndex:
+    """單一網頁的向量索引"""
+
+    def __init__(self, url: str, title: str, content: str, content_hash: str, store: VectorStore):
+        self.url = url
+        self.title = title
+        self.content = content
+        self.content_hash = content_hash
+        self.store = store
+        self.fetched_at = time.monotonic()
+
+
+class URLIndexCache:
+    """網頁索引的 LRU 快取"""
+
+    def __init__(self, max_size: int = URL_INDEX_CACHE_SIZE, ttl: float = URL_INDEX_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, PageIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # 每個網址正在使用（持有或等待）鎖的請求數
+        self._users: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, url: str) -> PageIndex:
+        """
+        取得網頁索引
+
+        快取未過期時直接返回；過期時重新抓取，內容未變則沿用原有的嵌入向量。
+
+        Args:
+            url: 網頁 URL
+
+        Returns:
+            網頁索引
+
+        Raises:
+            HTTPException: 當網頁抓取或嵌入生成失敗時
+        """
+        # 同一網址同時只建立一次索引
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        self._users[url] = self._users.get(url, 0) + 1
+        try:
+            return await self._get_locked(url, lock)
+        finally:
+            self._users[url] -= 1
+            if not self._users[url]:
+                del self._users[url]
+                # 抓取或嵌入失敗時沒有快取項目，不保留這個網址的鎖
+                if url not in self._entries and self._locks.get(url) is lock:
+                    del self._locks[url]
+
+    async def _get_locked(self, url: str, lock: asyncio.Lock) -> PageIndex:
+        """持有網址的鎖後查詢快取，必要時重新抓取並建立索引"""
+        async with lock:
+            entry = self._entries.get(url)
+            if entry and time.monotonic() - entry.fetched_at < self.ttl:
+                self._entries.move_to_end(url)
+                self.hits += 1
+                return entry
+
+            webpage = await fetch_webpage_content(url)
+            content_hash = hashlib.sha256(webpage["content"].encode("utf-8")).hexdigest()
+
+            if entry and entry.content_hash == content_hash:
+                entry.fetched_at = time.monotonic()
+                self._entries.move_to_end(url)
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            entry = await self._build(url, webpage, content_hash)
+            self._put(url, entry)
+            return entry
+
+    async def _build(self, url: str, webpage: Dict[str, str], content_hash: str) -> PageIndex:
+        """切割網頁內容並批量生成嵌入向量"""
+        store = VectorStore(track_near_duplicates=False)
+        content = webpage["content"]
+        chunks = await run_cpu_bound(split_text, content, size=len(content)) if content else []
+        if chunks:
+            embeddings = await embed_new_chunks(store, chunks)
+            await run_in_thread(
+                store.add_document,
+                doc_id=content_hash[:8],
+                title=webpage["title"] or url,
+                content=webpage["content"],
+                chunks=chunks,
+                embeddings=embeddings
+            )
+        return PageIndex(url, webpage["title"], webpage["content"], content_hash, store)
+
+    def _put(self, url: str, entry: PageIndex):
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            if evicted not in self._users:
+                self._locks.pop(evicted, None)
+
+    def clear(self):
+        """清空快取"""
+        self._entries.clear()
+        self._locks.clear()
+
+
+# 全局網頁索引快取實例
+url_index_cache = URLIndexCache()
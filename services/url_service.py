@@ -2,91 +2,276 @@
 URL 服務模組
 處理網頁內容抓取
 """
+import asyncio
+import codecs
 import httpx
 import re
-from typing import Dict
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from fastapi import HTTPException
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 
+from config import URL_FETCH_PER_HOST, URL_FETCH_MAX_BYTES
+from utils.concurrency import KeyedSemaphore
+from utils.deadline import remaining
+from utils.debug_logger import logger
+from utils.http_client import get_http_client
+from services.fetch_cache import fetch_cache, freshness_lifetime, CacheEntry
+from services.extractor import get_extractor, extract
+from utils.executor import run_cpu_bound
 
-async def fetch_webpage_content(url: str) -> Dict[str, str]:
+# 每個網站的併發抓取限制
+host_limiter = KeyedSemaphore(URL_FETCH_PER_HOST)
+
+# 網頁內容提取器
+html_extractor = get_extractor()
+
+# 每個網站下一次可以送出請求的時間，與排序鎖及等待中的請求數（供 min_interval 使用）；
+# 間隔已過且沒有請求在等待的網站會被移除
+_next_request: "OrderedDict[str, float]" = OrderedDict()
+_pace_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+# 直接接受的內容類型；SNIFFED_CONTENT_TYPES 需檢查內容開頭
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml")
+SNIFFED_CONTENT_TYPES = ("application/octet-stream", "binary/octet-stream")
+
+_BINARY_SIGNATURES = (b"%PDF", b"PK\x03\x04", b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"\x1f\x8b", b"RIFF", b"\x7fELF")
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+
+
+def extract_content(html: str, max_chars: Optional[int] = None) -> Dict:
+    """
+    從 HTML 提取標題與主要內容（使用 HTML_EXTRACTOR 設定的提取器）
+    
+    Args:
+        html: 網頁 HTML
+        max_chars: 內容的最大字數（None 為不限制）
+    
+    Returns:
+        包含標題、內容與是否截斷（truncated）的字典
+    """
+    return html_extractor.extract(html, max_chars)
+
+
+def _looks_like_html(head: bytes) -> bool:
+    """依內容開頭判斷未標明類型的回應是否為 HTML 或文字"""
+    if head.startswith(_BINARY_SIGNATURES) or b"\x00" in head[:512]:
+        return False
+    return True
+
+
+def _sniff_charset(response: httpx.Response, head: bytes) -> str:
+    """
+    決定解碼用的字元編碼：BOM > Content-Type 標頭 > <meta> 宣告 > UTF-8
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    candidates = [response.charset_encoding]
+    match = _META_CHARSET.search(head[:2048])
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+async def _read_html(response: httpx.Response, max_bytes: int) -> Tuple[str, bool]:
+    """
+    串流讀取回應內容並逐塊解碼
+    
+    Args:
+        response: 串流中的回應
+        max_bytes: 最多讀取的位元組數（解壓縮後）
+    
+    Returns:
+        (解碼後的 HTML, 是否因超過上限而截斷)
+    
+    Raises:
+        HTTPException: 內容不是 HTML 或文字時返回 415
+    """
+    mime = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if mime and mime not in HTML_CONTENT_TYPES and mime not in SNIFFED_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail=f"不支援的網頁內容類型: {mime}")
+    
+    decoder = None
+    parts = []
+    received = 0
+    truncated = False
+    async for chunk in response.aiter_bytes():
+        if decoder is None:
+            if mime in SNIFFED_CONTENT_TYPES or not mime:
+                if not _looks_like_html(chunk):
+                    raise HTTPException(status_code=415, detail="網址內容不是網頁（偵測為二進位檔案）")
+            decoder = codecs.getincrementaldecoder(_sniff_charset(response, chunk))(errors="replace")
+        chunk = chunk[:max_bytes - received]
+        received += len(chunk)
+        parts.append(decoder.decode(chunk))
+        if received >= max_bytes:
+            truncated = True
+            break
+    if decoder is not None:
+        parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), truncated
+
+
+async def _pace(host: str, interval: float):
+    """同一網站的請求依序送出，且至少間隔 interval 秒"""
+    if interval <= 0:
+        return
+    lock, users = _pace_locks.get(host, (None, 0))
+    if lock is None:
+        lock = asyncio.Lock()
+    _pace_locks[host] = (lock, users + 1)
+    try:
+        async with lock:
+            wait = _next_request.get(host, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            _next_request[host] = time.monotonic() + interval
+            _next_request.move_to_end(host)
+    finally:
+        lock, users = _pace_locks[host]
+        if users <= 1:
+            del _pace_locks[host]
+        else:
+            _pace_locks[host] = (lock, users - 1)
+        _prune_pacing()
+
+
+def _prune_pacing():
+    """移除間隔已過且沒有請求在等待的網站（依最後請求的先後檢查，遇到仍需等待的網站即停止）"""
+    now = time.monotonic()
+    while _next_request:
+        host, next_at = next(iter(_next_request.items()))
+        if next_at > now or host in _pace_locks:
+            break
+        del _next_request[host]
+
+
+async def _extract(html: str, max_chars: Optional[int]) -> Dict:
+    """提取內容；大型網頁在行程池解析，不阻塞事件迴圈"""
+    return await run_cpu_bound(extract, html, max_chars, html_extractor.name, size=len(html))
+
+
+async def _cached_result(entry: CacheEntry, max_chars: Optional[int]) -> Dict:
+    """返回快取的提取結果（複本，呼叫端修改不影響快取），字數不足時從快取的 HTML 重新提取"""
+    if not entry.covers(max_chars):
+        entry.result = dict(await _extract(entry.html, max_chars), url=entry.result.get("url", entry.url))
+        entry.max_chars = max_chars
+        await fetch_cache.put(entry)
+    result = dict(entry.result)
+    if max_chars is not None and len(result["content"]) > max_chars:
+        result.update(content=result["content"][:max_chars], truncated=True)
+    return result
+
+
+async def fetch_webpage_content(url: str, max_chars: Optional[int] = None) -> Dict:
     """
-    抓取網頁內容並提取文字
+    抓取網頁內容並提取文字（參數與例外同 fetch_webpage）
+    
+    Returns:
+        包含標題、內容、網址與是否截斷（truncated）的字典
+    """
+    result, _ = await fetch_webpage(url, max_chars)
+    return result
+
+
+async def fetch_webpage(url: str, max_chars: Optional[int] = None, min_interval: float = 0.0) -> Tuple[Dict, str]:
+    """
+    抓取網頁並提取文字，同時返回 HTML（供爬蟲解析連結）
+    
+    以串流下載：非 HTML 的內容在讀到第一塊時即拒絕，超過 URL_FETCH_MAX_BYTES 的部分不下載，
+    並依字元編碼逐塊解碼。提取文字在收集到 max_chars 字後即停止。
+    
+    結果會寫入抓取快取：仍在有效期內直接使用快取；過期後送出條件請求，
+    伺服器回應 304 時沿用已提取的文字，不再重新解析。
     
     Args:
         url: 網頁 URL
+        max_chars: 需要的內容字數上限（None 為完整內容）
+        min_interval: 同一網站兩次請求的最小間隔秒數
     
     Returns:
-        包含標題和內容的字典
+        (包含標題、內容、網址與是否截斷的字典, 網頁 HTML)；網址為轉址後的最終網址
     
     Raises:
-        HTTPException: 當網頁抓取失敗時
+        HTTPException: 當網頁抓取失敗或內容不是網頁時
     """
+    # 超時不超過請求剩餘的處理時間
+    timeout = remaining(30.0)
+    
     try:
         # 驗證 URL
         parsed = urlparse(url)
         if not parsed.scheme:
             url = "https://" + url
         
+        cached = await fetch_cache.get(url)
+        if cached and cached.is_fresh():
+            return await _cached_result(cached, max_chars), cached.html
+        
         # 設置請求頭，模擬瀏覽器
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        if cached:
+            headers.update(cached.validators())
         
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            
-            # 解析 HTML
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            # 移除 script 和 style 標籤
-            for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
-                script.decompose()
-            
-            # 提取標題
-            title = ""
-            if soup.title:
-                title = soup.title.get_text().strip()
-            elif soup.find("h1"):
-                title = soup.find("h1").get_text().strip()
-            
-            # 提取主要內容
-            # 優先查找 article, main, 或包含大量文字的 div
-            content = ""
-            article = soup.find("article") or soup.find("main") or soup.find("div", class_=re.compile("content|article|post|entry"))
-            
-            if article:
-                content = article.get_text(separator="\n", strip=True)
-            else:
-                # 如果沒有找到特定標籤，提取所有段落
-                paragraphs = soup.find_all("p")
-                content = "\n".join([p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True)])
-            
-            # 如果內容太短，嘗試提取 body
-            if len(content) < 100:
-                body = soup.find("body")
-                if body:
-                    content = body.get_text(separator="\n", strip=True)
-            
-            # 清理內容：移除多餘空白
-            content = re.sub(r'\n\s*\n', '\n\n', content)
-            content = content.strip()
-            
-            return {
-                "title": title,
-                "content": content,
-                "url": url
-            }
+        html = None
+        async with host_limiter.hold(urlparse(url).netloc):
+            await _pace(urlparse(url).netloc, min_interval)
+            async with get_http_client("url_fetch", follow_redirects=True).stream("GET", url, headers=headers, timeout=timeout) as response:
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    html, capped = await _read_html(response, URL_FETCH_MAX_BYTES)
+                    if capped:
+                        logger.info(f"Page exceeds {URL_FETCH_MAX_BYTES} bytes, truncated: {url}")
+        
+        lifetime = freshness_lifetime(response.headers)
+        
+        # 內容未變更，沿用快取的提取結果
+        if response.status_code == 304 and cached:
+            fetch_cache.counters["revalidated"] += 1
+            if lifetime is not None:
+                cached.expires_at = time.time() + lifetime
+                cached.etag = response.headers.get("etag", cached.etag)
+                cached.last_modified = response.headers.get("last-modified", cached.last_modified)
+                await fetch_cache.put(cached)
+            return await _cached_result(cached, max_chars), cached.html
+        
+        if html is None:
+            raise HTTPException(status_code=502, detail=f"無法訪問網頁: HTTP {response.status_code}")
+        
+        result = await _extract(html, max_chars)
+        result["url"] = str(response.url)
+        
+        if lifetime is not None:
+            await fetch_cache.put(CacheEntry(
+                url=url,
+                html=html,
+                result=result,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+                expires_at=time.time() + lifetime,
+                max_chars=max_chars
+            ))
+        
+        # 快取保存的是同一個字典，返回複本
+        return dict(result), html
             
+    except HTTPException:
+        raise
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="網頁載入超時，請稍後再試")
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=502, detail=f"無法訪問網頁: HTTP {e.response.status_code}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"抓取網頁失敗: {str(e)}")
-
-
-
-
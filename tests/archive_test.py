@@ -0,0 +1,197 @@
+"""
+知識庫匯入匯出測試腳本
+驗證封存檔往返後文檔、片段引用與搜尋結果不變，匯入時檢查嵌入模型與向量維度，
+以及透過 API 串流匯出與匯入
+"""
+import io
+import time
+from typing import List, Dict
+import sys
+import os
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_MODEL
+from vectorstore import VectorStore
+from tests.helpers import fake_vector
+from vectorstore.archive import write_archive, read_archive
+
+DIM = 24
+TOPICS = ["太陽能板的轉換效率", "咖啡豆的烘焙程度", "深海魚類的生存環境", "古代城市的排水系統",
+          "火山爆發的預測方法", "候鳥遷徙的導航能力", "半導體製程的微縮技術", "茶葉發酵的化學變化"]
+DISCLAIMER = "本文件僅供內部參考，未經授權不得轉載。"
+
+
+def chunks_for(n: int, count: int = 6) -> List[str]:
+    # 每篇文檔都附有相同的聲明，測試共用片段的引用
+    return [f"第 {n} 篇第 {i} 段：關於{TOPICS[(n + i) % len(TOPICS)]}的說明。" for i in range(count)] + [DISCLAIMER]
+
+
+def build_store(documents: int, deferred: bool = True) -> VectorStore:
+    store = VectorStore()
+    for n in range(documents):
+        chunks = chunks_for(n)
+        store.add_document(f"doc{n}", f"文檔 {n}", "\n".join(chunks), chunks, [fake_vector(c, DIM) for c in chunks])
+    if deferred:
+        chunks = chunks_for(documents)
+        store.add_document("deferred", "延後", "\n".join(chunks), chunks, [None] * len(chunks), defer=True)
+    return store
+
+
+def same_results(a: List[dict], b: List[dict]) -> bool:
+    # 匯入時重新正規化向量，分數可能有 float32 捨入誤差，同分的結果順序因此可能不同
+    scores_a = {r["id"]: (r["score"], r["document_ids"]) for r in a}
+    scores_b = {r["id"]: (r["score"], r["document_ids"]) for r in b}
+    return scores_a.keys() == scores_b.keys() and all(
+        abs(scores_a[i][0] - scores_b[i][0]) < 1e-5 and scores_a[i][1] == scores_b[i][1] for i in scores_a
+    )
+
+
+def roundtrip(store: VectorStore, model: str = EMBEDDING_MODEL) -> io.BytesIO:
+    buffer = io.BytesIO()
+    write_archive(store, buffer, model)
+    buffer.seek(0)
+    return buffer
+
+
+class ArchiveTester:
+    """知識庫匯入匯出測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    def test_roundtrip(self) -> Dict:
+        """匯入後的文檔、共用片段、待嵌入片段與搜尋結果與原知識庫相同"""
+        print("\n🔍 測試封存檔往返...")
+        source = build_store(20)
+        archive = read_archive(roundtrip(source), EMBEDDING_MODEL, DIM)
+        target = VectorStore()
+        result = target.import_documents(archive["documents"], archive["texts"], archive["embeddings"], archive["refs"])
+
+        same_docs = source.documents == target.documents
+        same_refs = source._refs == target._refs
+        same_chunks = source.chunks == target.chunks and np.allclose(source.matrix, target.matrix)
+        queries = [fake_vector(c, DIM) for c in chunks_for(3)] + [fake_vector(f"查詢 {i}", DIM) for i in range(10)]
+        same_search = all(
+            same_results(source.search(q, 5, query_text="火山"), target.search(q, 5, query_text="火山"))
+            for q in queries
+        )
+        print(f"   匯入結果: {result}")
+        print(f"   文檔相同: {same_docs}, 片段引用相同: {same_refs}, 片段與向量相同: {same_chunks}, 搜尋相同: {same_search}")
+        passed = (
+            same_docs and same_refs and same_chunks and same_search
+            and result == {"imported": 21, "skipped": [], "new_chunks": 121, "pending_chunks": 6}
+            and target.pending_chunks("deferred") == source.pending_chunks("deferred")
+        )
+        return {"test_name": "roundtrip", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_validation(self) -> Dict:
+        """嵌入模型或維度不符、內容損毀時拒絕匯入；ID 已存在的文檔略過"""
+        print("\n🔍 測試匯入驗證...")
+        source = build_store(3, deferred=False)
+        errors = []
+        for label, call in [
+            ("model", lambda: read_archive(roundtrip(source, "other-model"), EMBEDDING_MODEL, DIM)),
+            ("dimension", lambda: read_archive(roundtrip(source), EMBEDDING_MODEL, DIM * 2)),
+            ("corrupt", lambda: read_archive(io.BytesIO(b"not a zip"), EMBEDDING_MODEL)),
+        ]:
+            try:
+                call()
+            except ValueError as e:
+                errors.append(label)
+                print(f"   {label}: {e}")
+
+        target = build_store(2, deferred=False)
+        archive = read_archive(roundtrip(source), EMBEDDING_MODEL, DIM)
+        result = target.import_documents(archive["documents"], archive["texts"], archive["embeddings"], archive["refs"])
+        disclaimer = next(c for c in target.chunks if c["content"] == DISCLAIMER)
+        print(f"   匯入到既有知識庫: {result}, 聲明片段引用: {disclaimer['document_ids']}")
+        passed = (
+            errors == ["model", "dimension", "corrupt"]
+            and result == {"imported": 1, "skipped": ["doc0", "doc1"], "new_chunks": 6, "pending_chunks": 0}
+            and disclaimer["document_ids"] == ["doc0", "doc1", "doc2"] and target.count_chunks() == 19
+        )
+        return {"test_name": "validation", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_api(self) -> Dict:
+        """透過 API 串流匯出與匯入"""
+        print("\n🔍 測試 API 匯出與匯入...")
+        import routes.documents as documents_route
+        source = build_store(5, deferred=False)
+        target = VectorStore()
+        app = FastAPI()
+        app.include_router(documents_route.router)
+        client = TestClient(app)
+
+        original = documents_route.vector_store
+        try:
+            documents_route.vector_store = source
+            exported = client.get("/api/documents/export")
+            documents_route.vector_store = target
+            imported = client.post("/api/documents/import", content=exported.content,
+                                   headers={"Content-Type": "application/zip"})
+            rejected = client.post("/api/documents/import", content=b"broken")
+        finally:
+            documents_route.vector_store = original
+
+        print(f"   匯出: HTTP {exported.status_code}, {len(exported.content)} bytes; 匯入: {imported.json()}")
+        passed = (
+            exported.status_code == 200 and exported.headers["content-type"] == "application/zip"
+            and imported.status_code == 200 and imported.json()["imported"] == 5
+            and rejected.status_code == 400
+            and target.documents.keys() == source.documents.keys() and target.count_chunks() == source.count_chunks()
+        )
+        return {"test_name": "api", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def benchmark_archive(self, documents: int = 2000) -> Dict:
+        """封存檔大小與匯出、匯入耗時"""
+        print("\n⏱️  封存檔大小與耗時...")
+        source = VectorStore(track_near_duplicates=False)
+        rng = np.random.default_rng(0)
+        for n in range(documents):
+            chunks = chunks_for(n, 4)
+            source.add_document(f"doc{n}", f"文檔 {n}", "\n".join(chunks), chunks,
+                                rng.standard_normal((len(chunks), 768)).tolist())
+
+        started = time.perf_counter()
+        buffer = roundtrip(source)
+        export_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        archive = read_archive(buffer, EMBEDDING_MODEL)
+        VectorStore(track_near_duplicates=False).import_documents(
+            archive["documents"], archive["texts"], archive["embeddings"], archive["refs"]
+        )
+        import_ms = (time.perf_counter() - started) * 1000
+
+        size = len(buffer.getvalue())
+        print(f"   {documents} 篇 / {source.count_chunks()} 個片段（768 維）: {size / 1024 / 1024:.1f} MiB, "
+              f"匯出 {export_ms:.0f} ms, 匯入 {import_ms:.0f} ms")
+        return {"test_name": "benchmark_archive", "bytes": size, "export_ms": round(export_ms),
+                "import_ms": round(import_ms), "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 知識庫匯入匯出測試")
+        print("=" * 60)
+
+        self.test_results = [
+            self.test_roundtrip(),
+            self.test_validation(),
+            self.test_api(),
+            self.benchmark_archive()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    ArchiveTester().run_all_tests()
@@ -0,0 +1,110 @@
+"""
+上下文打包測試腳本
+驗證 RAG 提示詞的參考資料在 token 預算內：去除重疊與近似重複的片段、
+合併同一文檔相鄰的片段、裁剪低分片段，並回報估算的 token 數
+"""
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.context import pack_context, estimate_tokens, CHUNK_SEPARATOR
+
+
+def chunk(doc_id: str, index: int, content: str, score: float) -> Dict:
+    """建立檢索結果格式的片段"""
+    return {
+        "id": f"{doc_id}_chunk_{index}",
+        "document_id": doc_id,
+        "chunk_index": index,
+        "title": f"文檔 {doc_id}",
+        "content": content,
+        "score": score
+    }
+
+
+class ContextTester:
+    """上下文打包測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    def test_deduplicate(self) -> Dict:
+        """完全相同、被包含或只差幾個字的片段只保留分數最高的一個"""
+        print("\n🔍 測試去除重複片段...")
+        text = (
+            "向量資料庫以餘弦相似度找出與問題最接近的片段，再交給語言模型生成答案。"
+            "片段在上傳時切割並生成嵌入向量，相同內容的片段只會嵌入一次。"
+            "檢索結果依分數排序，並在提示詞的 token 預算內組合成參考資料。"
+        )
+        chunks = [
+            chunk("a", 0, text, 0.9),
+            chunk("b", 3, text, 0.8),
+            chunk("c", 1, text[:20], 0.7),
+            chunk("d", 5, text.replace("一次", "一遍"), 0.6),
+            chunk("e", 2, "完全不同的內容：網頁摘要會先擷取正文再截斷長度。", 0.5)
+        ]
+        context, stats = pack_context(chunks, token_budget=1000)
+        print(f"   統計: {stats}")
+        passed = (
+            stats["duplicates_removed"] == 3 and stats["packed_blocks"] == 2
+            and stats["chunk_ids"] == ["a_chunk_0", "e_chunk_2"] and context.count(text) == 1
+        )
+        return {"test_name": "deduplicate", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_merge_adjacent(self) -> Dict:
+        """同一文檔相鄰的片段合併為一段並去除重疊，不相鄰的片段分開"""
+        print("\n🔍 測試合併相鄰片段...")
+        first = "第一段說明系統如何切割文件。切割時保留重疊的句子"
+        second = "切割時保留重疊的句子，避免答案被切斷在兩個片段之間。"
+        chunks = [
+            chunk("a", 0, first, 0.9),
+            chunk("a", 1, second, 0.8),
+            chunk("a", 4, "第五段介紹完全不同的主題：模型預熱。", 0.7)
+        ]
+        context, stats = pack_context(chunks, token_budget=1000)
+        blocks = context.split(CHUNK_SEPARATOR)
+        print(f"   合併數: {stats['chunks_merged']}, 區塊數: {stats['packed_blocks']}")
+        passed = (
+            stats["chunks_merged"] == 1 and len(blocks) == 2
+            and "第一段說明系統如何切割文件。切割時保留重疊的句子，避免答案" in blocks[0]
+            and blocks[0].count("切割時保留重疊的句子") == 1
+        )
+        return {"test_name": "merge_adjacent", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_budget(self) -> Dict:
+        """超出預算時依分數保留片段，最後一個放不下的片段裁剪後放入，整體不超過預算"""
+        print("\n🔍 測試 token 預算...")
+        chunks = [chunk(f"d{i}", 0, f"主題{i}：" + "相關說明文字" * 40, 1 - i / 10) for i in range(8)]
+        budget = 600
+        context, stats = pack_context(chunks, token_budget=budget)
+        unbounded, _ = pack_context(chunks, token_budget=100000)
+        print(f"   預算 {budget}: 使用 {stats['context_tokens']} tokens, 保留 {len(stats['chunk_ids'])} 個片段"
+              f"（裁剪 {stats['chunks_trimmed']}，捨棄 {stats['chunks_dropped']}）; 不限預算: {estimate_tokens(unbounded)} tokens")
+        kept = [int(cid[1]) for cid in stats["chunk_ids"]]
+        passed = (
+            stats["context_tokens"] <= budget and stats["context_tokens"] == estimate_tokens(context)
+            and stats["chunks_trimmed"] == 1 and kept == list(range(len(kept)))
+            and stats["chunks_dropped"] == len(chunks) - len(kept) and context.endswith("…")
+            and estimate_tokens(unbounded) > budget
+        )
+        return {"test_name": "budget", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 上下文打包測試")
+        print("=" * 60)
+
+        self.test_results = [self.test_deduplicate(), self.test_merge_adjacent(), self.test_budget()]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    ContextTester().run_all_tests()
@@ -0,0 +1,167 @@
+"""
+多輪對話測試腳本
+以模擬的 Ollama 生成函數驗證：後續輪次延續 context 並只送出新問題與先前未送過的片段、
+context 過長時重新開始、同一會話的並行請求依序進行，以及會話數量與閒置時間有上限
+"""
+import asyncio
+from typing import List, Dict, Optional
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm.conversation as conversation
+import routes.rag as rag_routes
+from llm.conversation import ConversationStore, conversational_rag_qa
+from llm.qa import RAG_SYSTEM_PROMPT
+from models import RAGChatRequest
+from vectorstore import VectorStore
+
+
+def chunk(index: int, content: str) -> Dict:
+    """建立檢索結果格式的片段"""
+    return {
+        "id": f"doc_chunk_{index}",
+        "document_id": f"doc{index}",
+        "chunk_index": 0,
+        "title": f"文檔 {index}",
+        "content": content,
+        "score": 0.9 - index / 100
+    }
+
+
+class FakeOllama:
+    """記錄每次生成請求，返回延長的 context token 陣列"""
+
+    def __init__(self, tokens_per_turn: int = 100, delay: float = 0.0):
+        self.calls: List[Dict] = []
+        self.tokens_per_turn = tokens_per_turn
+        self.delay = delay
+
+    async def generate(self, prompt: str, system_prompt: str = "", context: Optional[List[int]] = None) -> Dict:
+        self.calls.append({"prompt": prompt, "system": system_prompt, "context": context})
+        await asyncio.sleep(self.delay)
+        previous = context or []
+        return {
+            "response": f"第 {len(self.calls)} 輪回答",
+            "context": previous + list(range(self.tokens_per_turn)),
+            "prompt_eval_count": 10,
+            "eval_count": 5
+        }
+
+
+class ConversationTester:
+    """多輪對話測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def test_context_reuse(self) -> Dict:
+        """第一輪送出系統提示詞與全部片段；後續輪次帶上 context，只送出新的片段"""
+        print("\n🔍 測試延續 context...")
+        fake = FakeOllama()
+        conversation.ollama_generate = fake.generate
+        store = ConversationStore(max_sessions=4, ttl=60)
+        session = store.get_or_create()
+        first_chunks = [chunk(0, "第一個片段說明快取。"), chunk(1, "第二個片段說明檢索。")]
+        await conversational_rag_qa(session, "什麼是快取？", first_chunks)
+        await conversational_rag_qa(session, "那檢索呢？", first_chunks + [chunk(2, "第三個片段說明排程。")])
+        answer, _, usage = await conversational_rag_qa(session, "總結一下", first_chunks, language="en")
+
+        first, second, third = fake.calls
+        print(f"   三輪提示詞長度: {[len(c['prompt']) for c in fake.calls]}, "
+              f"送出的 context 長度: {[len(c['context'] or []) for c in fake.calls]}")
+        passed = (
+            first["system"] == RAG_SYSTEM_PROMPT and first["context"] is None
+            and "第一個片段" in first["prompt"] and "第二個片段" in first["prompt"]
+            and second["system"] == "" and second["context"] == list(range(100))
+            and "第三個片段" in second["prompt"] and "第一個片段" not in second["prompt"]
+            and "參考資料" not in third["prompt"].split("## 問題")[0] and "English" in third["prompt"]
+            and len(third["context"]) == 200 and session.turn_count == 3
+            and usage["session_context_tokens"] == 300 and answer == "第 3 輪回答"
+        )
+        return {"test_name": "context_reuse", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_context_limit(self) -> Dict:
+        """累積的 context 超過上限時捨棄，重新送出系統提示詞與完整參考資料"""
+        print("\n🔍 測試 context 上限...")
+        fake = FakeOllama(tokens_per_turn=conversation.CONVERSATION_MAX_CONTEXT_TOKENS)
+        conversation.ollama_generate = fake.generate
+        session = ConversationStore().get_or_create()
+        chunks = [chunk(0, "只有一個片段。")]
+        for question in ("第一題", "第二題", "第三題"):
+            await conversational_rag_qa(session, question, chunks)
+        sent = [len(c["context"] or []) for c in fake.calls]
+        print(f"   各輪送出的 context 長度: {sent}")
+        passed = (
+            sent == [0, conversation.CONVERSATION_MAX_CONTEXT_TOKENS, 0]
+            and fake.calls[2]["system"] == RAG_SYSTEM_PROMPT and "只有一個片段" in fake.calls[2]["prompt"]
+        )
+        return {"test_name": "context_limit", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_concurrent_turns(self) -> Dict:
+        """同一會話同時送出的兩個請求依序生成：第二輪延續第一輪返回的 context"""
+        print("\n🔍 測試同一會話的並行請求...")
+        fake = FakeOllama(delay=0.05)
+        conversation.ollama_generate = fake.generate
+        store = VectorStore()
+        store.add_document("doc0", "文檔", "", ["已嵌入的片段"], [[1.0, 0.0]])
+
+        async def search(question: str, top_k: int, mmr_lambda=None) -> List[Dict]:
+            return [chunk(0, "第一個片段說明快取。")]
+
+        original = (rag_routes.vector_store, rag_routes.search_similar_chunks, rag_routes.conversation_store)
+        rag_routes.vector_store, rag_routes.search_similar_chunks = store, search
+        rag_routes.conversation_store = ConversationStore()
+        try:
+            session_id = rag_routes.conversation_store.get_or_create().session_id
+            responses = await asyncio.gather(*[
+                rag_routes.rag_chat(RAGChatRequest(question=question, session_id=session_id))
+                for question in ("第一個問題", "第二個問題")
+            ])
+        finally:
+            rag_routes.vector_store, rag_routes.search_similar_chunks, rag_routes.conversation_store = original
+        sent = [len(c["context"] or []) for c in fake.calls]
+        print(f"   各輪送出的 context 長度: {sent}, 回應輪次: {[r.turn for r in responses]}")
+        passed = sent == [0, 100] and sorted(r.turn for r in responses) == [1, 2]
+        return {"test_name": "concurrent_turns", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_session_bounds(self) -> Dict:
+        """超過數量上限時移除最久未使用的會話；閒置超過期限的會話過期"""
+        print("\n🔍 測試會話上限...")
+        store = ConversationStore(max_sessions=3, ttl=60)
+        ids = [store.get_or_create().session_id for _ in range(3)]
+        store.get_or_create(ids[0])
+        newest = store.get_or_create().session_id
+        lru_evicted = store.get(ids[1]) is None and store.get(ids[0]) is not None and store.count() == 3
+
+        store.ttl = 0.05
+        await asyncio.sleep(0.1)
+        expired = store.count() == 0 and store.get(newest) is None
+        recreated = store.get_or_create(newest)
+        print(f"   LRU 移除: {lru_evicted}, 閒置過期: {expired}, 以原 ID 重新建立後輪次: {recreated.turn_count}")
+        passed = lru_evicted and expired and recreated.session_id == newest and recreated.turn_count == 0
+        return {"test_name": "session_bounds", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 多輪對話測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_context_reuse(),
+            await self.test_context_limit(),
+            await self.test_concurrent_turns(),
+            await self.test_session_bounds()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(ConversationTester().run_all_tests())
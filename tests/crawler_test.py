@@ -0,0 +1,241 @@
+"""
+網站爬取測試腳本
+在本機啟動提供固定 HTML 的網站，驗證連結追蹤、深度與網頁數限制、內容去重、同站請求間隔與批量寫入知識庫，
+以及單一網頁寫入失敗時只記錄該網頁的錯誤、背景任務不沿用建立任務的請求上下文
+"""
+import asyncio
+import time
+from http.server import ThreadingHTTPServer
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.url_service as url_service
+from services.crawler import SiteCrawler
+from services.fetch_cache import fetch_cache
+from utils.deadline import current_deadline
+from utils.request_context import DEFAULT_CLIENT, DEFAULT_ENDPOINT, bind_request, current_client, current_endpoint
+from vectorstore import VectorStore, MissingEmbeddingError
+from tests.helpers import QuietHandler, serve, url_of
+
+PARAGRAPH = "這是測試網站的內容段落，包含足夠的文字以便切割成片段並寫入知識庫。" * 8
+
+
+def page(title: str, links: List[str], body: str = "") -> bytes:
+    anchors = "".join(f"<a href='{href}'>{href}</a>" for href in links)
+    return (
+        f"<html><head><title>{title}</title></head><body><nav>{anchors}</nav>"
+        f"<article><h1>{title}</h1><p>{body or title + PARAGRAPH}</p></article></body></html>"
+    ).encode("utf-8")
+
+
+# 測試網站：/dup 與 /a 內容相同，/bin 為二進位檔案，/missing 不存在
+SITE = {
+    "/": page("首頁", ["/a", "/b", "c", "/dup", "/bin", "/missing", "http://127.0.0.1:9/external", "/#top"]),
+    "/a": page("A", ["/", "/a/deep"], body="A" + PARAGRAPH),
+    "/b": page("B", ["/b/1", "/b/2"]),
+    "/c": page("C", []),
+    "/dup": page("A", [], body="A" + PARAGRAPH),
+    "/a/deep": page("Deep", ["/a/deeper"]),
+    "/a/deeper": page("Deeper", []),
+    "/b/1": page("B1", []),
+    "/b/2": page("B2", []),
+}
+
+
+def start_site(delay: float = 0.0) -> ThreadingHTTPServer:
+    """
+    啟動測試網站
+    
+    Args:
+        delay: 每個請求的回應延遲秒數
+    
+    Returns:
+        HTTP 服務（requests 屬性記錄每個請求的路徑與時間）
+    """
+    class Handler(QuietHandler):
+        def do_GET(self):
+            self.server.requests.append((self.path, time.monotonic()))
+            time.sleep(delay)
+            if self.path == "/bin":
+                body, content_type = b"%PDF-1.4 \x00\x01", "application/octet-stream"
+            elif self.path in SITE:
+                body, content_type = SITE[self.path], "text/html; charset=utf-8"
+            else:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+    return serve(Handler, requests=[])
+
+
+class FakeEmbedder:
+    """記錄每次批量呼叫的假嵌入函數"""
+
+    def __init__(self):
+        self.calls: List[int] = []
+        self.contexts = set()
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(len(texts))
+        self.contexts.add((current_endpoint.get(), current_client.get(), current_deadline.get()))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class FlakyStore(VectorStore):
+    """寫入指定標題的文檔時拋出 MissingEmbeddingError（failures 為每個標題失敗的次數）"""
+
+    def __init__(self, failures: Dict[str, int]):
+        super().__init__()
+        self.failures = dict(failures)
+
+    def add_document(self, doc_id, title, *args, **kwargs):
+        if self.failures.get(title, 0) > 0:
+            self.failures[title] -= 1
+            raise MissingEmbeddingError(f"模擬 {title} 沿用的片段被刪除")
+        return super().add_document(doc_id, title, *args, **kwargs)
+
+
+class CrawlerTester:
+    """網站爬取測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+        # 測試不寫入磁碟快取
+        fetch_cache.cache_dir = None
+
+    async def _crawl(self, server, max_depth: int, max_pages: int, host_delay: float = 0.0, batch_size: int = 3,
+                     store: VectorStore = None):
+        store = store if store is not None else VectorStore()
+        embed = FakeEmbedder()
+        crawler = SiteCrawler(store=store, embed=embed, host_delay=host_delay, batch_size=batch_size)
+        job = crawler.start([url_of(server, "/")], max_depth, max_pages, concurrency=4)
+        await crawler.wait(job.id)
+        return job, store, embed
+
+    async def test_full_crawl(self) -> Dict:
+        """追蹤同站連結、略過外部連結與重複內容，並分批寫入知識庫"""
+        print("\n🔍 測試完整爬取...")
+        server = start_site()
+        job, store, embed = await self._crawl(server, max_depth=3, max_pages=50)
+        stats = job.to_dict()
+        paths = sorted(path for path, _ in server.requests)
+        titles = sorted(doc["title"] for doc in store.documents.values())
+        print(f"   狀態: {stats['status']}, 抓取: {stats['fetched']}, 寫入: {stats['ingested']}, "
+              f"重複: {stats['duplicates']}, 失敗: {stats['failed']}, {stats['pages_per_second']} 頁/秒")
+        print(f"   嵌入批次: {embed.calls}")
+
+        passed = (
+            stats["status"] == "completed"
+            and paths == sorted(list(SITE) + ["/bin", "/missing"])
+            and titles == sorted(["首頁", "A", "B", "C", "Deep", "Deeper", "B1", "B2"])
+            and stats["duplicates"] == 1
+            and stats["failed"] == 2
+            and store.count_chunks() == stats["chunks"]
+            and len(embed.calls) < stats["ingested"]
+        )
+        return {"test_name": "full_crawl", "stats": {k: stats[k] for k in ("fetched", "ingested", "duplicates", "failed")},
+                "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_limits(self) -> Dict:
+        """深度與網頁數上限"""
+        print("\n🔍 測試深度與網頁數上限...")
+        shallow_server = start_site()
+        shallow, _, _ = await self._crawl(shallow_server, max_depth=1, max_pages=50)
+        shallow_paths = {path for path, _ in shallow_server.requests}
+        limited_server = start_site()
+        limited, _, _ = await self._crawl(limited_server, max_depth=3, max_pages=4)
+        print(f"   深度 1 抓取路徑: {sorted(shallow_paths)}")
+        print(f"   上限 4 頁的請求數: {len(limited_server.requests)}")
+
+        passed = (
+            "/a/deep" not in shallow_paths and "/b/1" not in shallow_paths and "/a" in shallow_paths
+            and len(limited_server.requests) == 4
+        )
+        return {"test_name": "limits", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_politeness(self, host_delay: float = 0.1) -> Dict:
+        """同一網站的請求間隔不小於 host_delay"""
+        print("\n🔍 測試同站請求間隔...")
+        server = start_site(delay=0.05)
+        # 在送出請求處記錄時間：網站收到請求的時間另含連線與執行緒排程的延遲
+        pace = url_service._pace
+        sent = []
+
+        async def recording_pace(host: str, interval: float):
+            await pace(host, interval)
+            sent.append(time.monotonic())
+
+        url_service._pace = recording_pace
+        try:
+            job, _, _ = await self._crawl(server, max_depth=3, max_pages=50, host_delay=host_delay)
+        finally:
+            url_service._pace = pace
+        gaps = [b - a for a, b in zip(sent, sent[1:])]
+        received = sorted(t for _, t in server.requests)
+        received_gap = min(b - a for a, b in zip(received, received[1:]))
+        print(f"   最小間隔: 送出 {min(gaps) * 1000:.0f} ms, 網站收到 {received_gap * 1000:.0f} ms, 耗時 {job.elapsed():.2f} s")
+
+        passed = len(sent) == len(server.requests) and min(gaps) >= host_delay * 0.99
+        return {"test_name": "politeness", "min_gap_ms": round(min(gaps) * 1000), "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_ingest_errors(self) -> Dict:
+        """同批網頁中寫入失敗的網頁記錄為錯誤，其餘網頁照常寫入；沿用的片段被刪除一次時重試成功"""
+        print("\n🔍 測試逐頁寫入錯誤...")
+        server = start_site()
+        store = FlakyStore({"B": 2, "C": 1})
+        job, store, _ = await self._crawl(server, max_depth=3, max_pages=50, store=store)
+        stats = job.to_dict()
+        titles = sorted(doc["title"] for doc in store.documents.values())
+        failed_urls = sorted(error["url"].rsplit("/", 1)[-1] for error in stats["errors"])
+        print(f"   寫入: {stats['ingested']}, 失敗: {stats['failed']}, 錯誤網址: {failed_urls}")
+        passed = (
+            stats["status"] == "completed" and stats["ingested"] == 7 and stats["failed"] == 3
+            and titles == sorted(["首頁", "A", "C", "Deep", "Deeper", "B1", "B2"])
+            and failed_urls == ["b", "bin", "missing"] and store.count_chunks() == stats["chunks"]
+        )
+        return {"test_name": "ingest_errors", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_request_context(self) -> Dict:
+        """背景任務以預設的端點與用戶端生成嵌入，不沿用建立任務的請求期限"""
+        print("\n🔍 測試背景任務的請求上下文...")
+        server = start_site()
+        bind_request("/api/crawl", "user1")
+        current_deadline.set(time.monotonic() + 60)
+        job, _, embed = await self._crawl(server, max_depth=1, max_pages=3)
+        print(f"   嵌入時的上下文: {embed.contexts}")
+        passed = job.status == "completed" and embed.contexts == {(DEFAULT_ENDPOINT, DEFAULT_CLIENT, None)}
+        return {"test_name": "request_context", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 網站爬取測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_full_crawl(),
+            await self.test_limits(),
+            await self.test_politeness(),
+            await self.test_ingest_errors(),
+            await self.test_request_context()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(CrawlerTester().run_all_tests())
@@ -0,0 +1,142 @@
+"""
+請求期限測試腳本
+驗證下游超時依剩餘時間縮短、排隊等候因請求期限逾時時返回 504 而非 429，
+以及用戶端中斷連線時立即取消處理中的請求
+"""
+import asyncio
+import time
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+from utils.concurrency import AdaptiveLimiter
+from utils.deadline import DeadlineMiddleware, current_deadline, remaining
+
+
+async def _status_of(coro) -> int:
+    """執行協程並返回 HTTPException 的狀態碼（成功時為 200）"""
+    try:
+        await coro
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+class DeadlineTester:
+    """請求期限測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def test_remaining(self) -> Dict:
+        """未設定期限時沿用原本超時；設定後取較小者；超過期限時返回 504"""
+        print("\n🔍 測試剩餘時間...")
+        unbounded = remaining(30)
+        token = current_deadline.set(time.monotonic() + 2)
+        bounded = remaining(30)
+        short = remaining(0.5)
+        current_deadline.reset(token)
+
+        async def downstream():
+            return remaining(30)
+
+        token = current_deadline.set(time.monotonic() - 1)
+        expired = await _status_of(downstream())
+        current_deadline.reset(token)
+        print(f"   無期限: {unbounded}, 剩餘約 2 秒: {bounded:.2f}, 原本較短: {short}, 已過期: {expired}")
+        passed = unbounded == 30 and 1.5 < bounded <= 2 and short == 0.5 and expired == 504
+        return {"test_name": "remaining", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_limiter_status(self) -> Dict:
+        """等候超過上限返回 429 並附 Retry-After；請求期限先到則返回 504，且不留下排隊項目"""
+        print("\n🔍 測試排隊逾時的狀態碼...")
+        limiter = AdaptiveLimiter("test", initial=1, max_limit=1, min_limit=1, max_wait=0.05)
+        await limiter.acquire()
+
+        try:
+            await limiter.acquire()
+            queue_timeout = None
+        except HTTPException as e:
+            queue_timeout = e
+
+        limiter.max_wait = 5
+        token = current_deadline.set(time.monotonic() + 0.05)
+        started = time.monotonic()
+        deadline_status = await _status_of(limiter.acquire())
+        elapsed = time.monotonic() - started
+        current_deadline.reset(token)
+        # 進入時期限已過：不排隊直接返回 504
+        token = current_deadline.set(time.monotonic() - 1)
+        expired_status = await _status_of(limiter.acquire())
+        current_deadline.reset(token)
+
+        limiter.release()
+        print(f"   等候上限: {queue_timeout.status_code if queue_timeout else None}, "
+              f"請求期限: {deadline_status}（{elapsed * 1000:.0f} ms）, 已過期: {expired_status}, 統計: {limiter.stats()}")
+        passed = (
+            queue_timeout is not None and queue_timeout.status_code == 429 and "Retry-After" in queue_timeout.headers
+            and deadline_status == 504 and elapsed < 1 and expired_status == 504
+            and limiter.rejected == 1 and limiter.inflight == 0 and not limiter._waiters
+        )
+        return {"test_name": "limiter_status", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_disconnect(self) -> Dict:
+        """用戶端在回應前中斷連線時，處理中的請求立即被取消"""
+        print("\n🔍 測試用戶端中斷...")
+        outcome = {}
+
+        async def app(scope, receive, send):
+            await receive()
+            outcome["deadline_set"] = current_deadline.get() is not None
+            try:
+                await asyncio.sleep(10)
+                outcome["finished"] = True
+            except asyncio.CancelledError:
+                outcome["cancelled"] = True
+                raise
+
+        messages = asyncio.Queue()
+        await messages.put({"type": "http.request", "body": b"", "more_body": False})
+
+        async def send(message):
+            outcome.setdefault("sent", []).append(message)
+
+        scope = {"type": "http", "headers": []}
+        started = time.monotonic()
+        task = asyncio.create_task(DeadlineMiddleware(app)(scope, messages.get, send))
+        await asyncio.sleep(0.05)
+        await messages.put({"type": "http.disconnect"})
+        await task
+        elapsed = time.monotonic() - started
+        print(f"   中斷後結束耗時: {elapsed * 1000:.0f} ms, 結果: {outcome}")
+        passed = (
+            outcome.get("deadline_set") and outcome.get("cancelled") and not outcome.get("finished")
+            and "sent" not in outcome and elapsed < 1 and current_deadline.get() is None
+        )
+        return {"test_name": "disconnect", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 請求期限測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_remaining(),
+            await self.test_limiter_status(),
+            await self.test_disconnect()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(DeadlineTester().run_all_tests())
@@ -0,0 +1,190 @@
+"""
+片段去重測試腳本
+驗證內容相同的片段只生成一次嵌入向量、只保存一列向量，搜尋結果不重複，
+刪除文檔時仍被其他文檔引用的片段會保留，以及上傳後文檔立即被刪除時仍返回寫入的結果
+"""
+import asyncio
+import functools
+import random
+from typing import List, Dict
+import sys
+import os
+
+import numpy as np
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routes.documents as documents_route
+from ingest import embed_new_chunks, embed_and_store
+from models import DocumentUploadRequest
+from vectorstore import VectorStore
+from tests.helpers import fake_vector
+
+DIM = 32
+DISCLAIMER = "本文件內容僅供參考，不構成任何投資建議。"
+HEADER = "公司內部文件，請勿外流。"
+
+
+class CountingEmbedder:
+    """記錄實際送去生成嵌入向量的文字數"""
+
+    def __init__(self):
+        self.texts = 0
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        self.texts += len(texts)
+        return [fake_vector(t, DIM) for t in texts]
+
+
+def document(n: int) -> List[str]:
+    """每份文檔有共用的頁首與聲明，中間是獨有的段落"""
+    return [HEADER] + [f"文檔 {n} 的第 {i} 段內容" for i in range(3)] + [DISCLAIMER]
+
+
+class RacingStore(VectorStore):
+    """寫入後立即刪除文檔，模擬上傳返回前另一個請求刪除了它"""
+
+    def add_document(self, doc_id, *args, **kwargs):
+        document = super().add_document(doc_id, *args, **kwargs)
+        self.delete_document(doc_id)
+        return document
+
+
+class DedupTester:
+    """片段去重測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def _ingest(self, store: VectorStore, embed: CountingEmbedder, n: int):
+        chunks = document(n)
+        embeddings = await embed_new_chunks(store, chunks, embed)
+        store.add_document(f"doc{n}", f"文檔 {n}", "\n".join(chunks), chunks, embeddings)
+
+    async def test_shared_embeddings(self, documents: int = 50) -> Dict:
+        """共用的片段只生成一次向量並只保存一列"""
+        print("\n🔍 測試共用片段的嵌入向量...")
+        store = VectorStore()
+        embed = CountingEmbedder()
+        for n in range(documents):
+            await self._ingest(store, embed, n)
+
+        expected = documents * 3 + 2
+        shared = next(c for c in store.chunks if c["content"] == DISCLAIMER)
+        print(f"   文檔數: {documents}, 片段引用數: {documents * 5}, 生成向量: {embed.texts}, 保存的列數: {store.count_chunks()}")
+        passed = (
+            embed.texts == expected and store.count_chunks() == expected
+            and store.matrix.shape[0] == expected and len(shared["document_ids"]) == documents
+            and store.documents["doc3"]["chunks_count"] == 5
+        )
+        return {"test_name": "shared_embeddings", "embedded": embed.texts, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_search_unique(self) -> Dict:
+        """搜尋結果不會出現內容重複的片段"""
+        print("\n🔍 測試搜尋結果去重...")
+        store = VectorStore()
+        embed = CountingEmbedder()
+        for n in range(20):
+            await self._ingest(store, embed, n)
+
+        results = store.search(fake_vector(DISCLAIMER, DIM), 10)
+        contents = [r["content"] for r in results]
+        print(f"   前 10 名中的不同內容: {len(set(contents))}")
+        passed = len(set(contents)) == len(contents) and contents[0] == DISCLAIMER
+        return {"test_name": "search_unique", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_delete_references(self) -> Dict:
+        """刪除文檔時，共用片段改由其他文檔引用；最後一個引用刪除後才移除向量"""
+        print("\n🔍 測試刪除共用片段的文檔...")
+        store = VectorStore()
+        embed = CountingEmbedder()
+        for n in range(3):
+            await self._ingest(store, embed, n)
+
+        store.delete_document("doc0")
+        shared = next(c for c in store.chunks if c["content"] == DISCLAIMER)
+        reassigned = shared["document_id"] == "doc1" and shared["id"] == "doc1_4" and shared["document_ids"] == ["doc1", "doc2"]
+        store.delete_document("doc1")
+        store.delete_document("doc2")
+        empty = store.count_chunks() == 0 and store.matrix.shape[0] == 0
+
+        # 重新加入時沿用不到已刪除的向量，必須重新生成
+        before = embed.texts
+        await self._ingest(store, embed, 9)
+        regenerated = embed.texts - before == 5
+
+        print(f"   來源改為 doc1: {reassigned}, 全部刪除後清空: {empty}, 重新生成: {regenerated}")
+        passed = reassigned and empty and regenerated
+        return {"test_name": "delete_references", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_search_parity(self, queries: int = 20) -> Dict:
+        """去重後的搜尋與未去重時（取不重複內容）的排序一致"""
+        print("\n🔍 測試去重後的搜尋一致性...")
+        store = VectorStore()
+        embed = CountingEmbedder()
+        texts = []
+        for n in range(30):
+            await self._ingest(store, embed, n)
+            texts += document(n)
+        unique = list(dict.fromkeys(texts))
+        matrix = np.asarray([fake_vector(t, DIM) for t in unique], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+        rng = random.Random(4)
+        mismatches = 0
+        for _ in range(queries):
+            query = np.asarray([rng.gauss(0, 1) for _ in range(DIM)], dtype=np.float32)
+            expected = [unique[i] for i in np.argsort(-(matrix @ (query / np.linalg.norm(query))), kind="stable")[:5]]
+            if [r["content"] for r in store.search(query.tolist(), 5)] != expected:
+                mismatches += 1
+        print(f"   查詢數: {queries}, 不一致: {mismatches}")
+        return {"test_name": "search_parity", "mismatches": mismatches, "status": "✅ PASS" if not mismatches else "❌ FAIL"}
+
+    async def test_upload_race(self) -> Dict:
+        """add_document 返回存入的文檔；上傳在返回前文檔被刪除時仍以寫入的結果回應"""
+        print("\n🔍 測試上傳後的並行刪除...")
+        store = RacingStore()
+        embed = CountingEmbedder()
+        original = (documents_route.vector_store, documents_route.embed_and_store)
+        documents_route.vector_store = store
+        documents_route.embed_and_store = functools.partial(embed_and_store, embed=embed)
+        try:
+            chunks = document(0)
+            response = await documents_route.upload_document(
+                DocumentUploadRequest(title="文檔 0", content="\n".join(chunks))
+            )
+        finally:
+            documents_route.vector_store, documents_route.embed_and_store = original
+        stored = VectorStore().add_document("doc0", "文檔 0", "內容", chunks, [fake_vector(c, DIM) for c in chunks])
+        print(f"   回應: chunks_count={response.chunks_count}, embedded_chunks={response.embedded_chunks}, "
+              f"知識庫文檔數: {store.count_documents()}")
+        passed = (
+            response.title == "文檔 0" and response.chunks_count >= 1 and response.embedded_chunks == embed.texts
+            and response.content_length == len("\n".join(chunks)) and store.count_documents() == 0
+            and stored["id"] == "doc0" and stored["chunks_count"] == len(chunks)
+        )
+        return {"test_name": "upload_race", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 片段去重測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_shared_embeddings(),
+            await self.test_search_unique(),
+            await self.test_delete_references(),
+            await self.test_search_parity(),
+            await self.test_upload_race()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(DedupTester().run_all_tests())
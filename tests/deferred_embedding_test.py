@@ -0,0 +1,270 @@
+"""
+延後嵌入測試腳本
+驗證延後嵌入的文檔立即可用詞彙比對搜尋且分數與向量分數可比較、背景佇列分批補上向量並更新進度，
+以及嵌入失敗、嵌入服務未返回向量或文檔刪除時的處理
+"""
+import asyncio
+import time
+from typing import List, Dict
+import sys
+import os
+
+import numpy as np
+from fastapi import HTTPException
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import embed_new_chunks
+from services.embedding_queue import EmbeddingQueue
+from utils.deadline import check_deadline, current_deadline
+from vectorstore import VectorStore
+from tests.helpers import fake_vector
+
+DIM = 16
+TOPICS = ["太陽能板的轉換效率", "咖啡豆的烘焙程度", "深海魚類的生存環境", "古代城市的排水系統",
+          "火山爆發的預測方法", "候鳥遷徙的導航能力", "半導體製程的微縮技術", "茶葉發酵的化學變化"]
+
+
+class SlowEmbedder:
+    """每段文字耗時 delay 秒的假嵌入服務，可設定為失敗"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches: List[int] = []
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.delay * len(texts))
+        if self.fail:
+            raise HTTPException(status_code=503, detail="無法連接到 Ollama")
+        self.batches.append(len(texts))
+        return [fake_vector(t, DIM) for t in texts]
+
+
+class BrokenEmbedder:
+    """返回空結果（vectors=None）或空向量的假嵌入服務，記錄呼叫次數"""
+
+    def __init__(self, vectors: bool):
+        self.vectors = vectors
+        self.calls = 0
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [[] for _ in texts] if self.vectors else []
+
+
+def chunks_for(n: int) -> List[str]:
+    return [f"第 {n} 篇第 {i} 段：關於{TOPICS[(n + i) % len(TOPICS)]}的說明與討論。" for i in range(10)]
+
+
+class DeferredEmbeddingTester:
+    """延後嵌入測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def test_lexical_fallback(self) -> Dict:
+        """延後嵌入的片段在向量完成前可以詞彙比對找到"""
+        print("\n🔍 測試詞彙比對搜尋...")
+        store = VectorStore()
+        chunks = chunks_for(0)
+        store.add_document("doc0", "文檔", "\n".join(chunks), chunks, [None] * len(chunks), defer=True)
+        indexing = store.documents["doc0"]["indexing"]
+        results = store.search(fake_vector("x", DIM), 3, query_text="咖啡豆烘焙")
+        vector_only = store.search(fake_vector("x", DIM), 3)
+        print(f"   進度: {indexing}, 詞彙比對第一名: {results[0]['content'] if results else None}")
+        passed = (
+            indexing == {"status": "pending", "pending_chunks": 10, "total_chunks": 10}
+            and results and "咖啡豆" in results[0]["content"] and results[0]["match"] == "lexical"
+            and not vector_only and store.count_chunks() == 0
+        )
+        return {"test_name": "lexical_fallback", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_lexical_ranking(self) -> Dict:
+        """詞彙比對的分數以最高的餘弦分數換算：比對一半的片段排在餘弦分數較高的向量片段之後"""
+        print("\n🔍 測試詞彙比對與向量分數合併...")
+        store = VectorStore()
+        cosines = {"向量片段甲": 0.6, "向量片段乙": 0.45, "向量片段丙": 0.35}
+        vectors = []
+        for axis, cosine in enumerate(cosines.values(), start=1):
+            vector = np.zeros(DIM)
+            vector[0], vector[axis] = cosine, np.sqrt(1 - cosine ** 2)
+            vectors.append(vector.tolist())
+        store.add_document("vec", "向量", "", list(cosines), vectors)
+        # 查詢的 4 個 bigram（咖啡、啡豆、豆烘、烘焙）中出現 2 個
+        store.add_document("lex", "延後", "", ["咖啡的香氣來自烘焙"], [None], defer=True)
+        query = np.eye(DIM)[0].tolist()
+        results = store.search(query, 4, query_text="咖啡豆烘焙")
+        order = [r["content"] for r in results]
+        lexical = results[-1]
+        print(f"   排序: {order}, 詞彙比對: score={lexical['score']:.3f}, lexical_score={lexical.get('lexical_score')}")
+        passed = (
+            order == list(cosines) + ["咖啡的香氣來自烘焙"]
+            and lexical["match"] == "lexical" and lexical["lexical_score"] == 0.5
+            and abs(lexical["score"] - 0.3) < 1e-5
+        )
+        return {"test_name": "lexical_ranking", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_background_queue(self) -> Dict:
+        """背景佇列分批補上向量，進度逐批更新，完成後改為向量搜尋"""
+        print("\n🔍 測試背景嵌入佇列...")
+        store = VectorStore()
+        embed = SlowEmbedder(delay=0.005)
+        queue = EmbeddingQueue(store=store, embed=embed, batch_size=3)
+
+        # 已存在的內容直接沿用向量，不進入佇列
+        existing = chunks_for(1)[:4]
+        store.add_document("base", "既有", "", existing, [fake_vector(c, DIM) for c in existing])
+        chunks = chunks_for(1)
+        store.add_document("doc1", "文檔", "\n".join(chunks), chunks, [None] * len(chunks), defer=True)
+        progress = [store.documents["doc1"]["indexing"]["pending_chunks"]]
+        queue.submit("doc1")
+        while store.documents["doc1"]["indexing"]["status"] == "pending":
+            await asyncio.sleep(0.005)
+            current = store.documents["doc1"]["indexing"]["pending_chunks"]
+            if current != progress[-1]:
+                progress.append(current)
+        await queue.join()
+        await queue.stop()
+
+        result = store.search(fake_vector(chunks[7], DIM), 1, query_text="無關")[0]
+        print(f"   待嵌入片段數變化: {progress}, 批次: {embed.batches}")
+        passed = (
+            progress[0] == 6 and progress[-1] == 0 and embed.batches == [3, 3]
+            and not store.pending and store.count_chunks() == 10
+            and result["content"] == chunks[7] and "match" not in result and result["document_id"] == "doc1"
+        )
+        return {"test_name": "background_queue", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_failure_and_delete(self) -> Dict:
+        """嵌入失敗時狀態為 failed 且仍可詞彙比對；處理中刪除文檔時停止"""
+        print("\n🔍 測試失敗與刪除...")
+        store = VectorStore()
+        queue = EmbeddingQueue(store=store, embed=SlowEmbedder(fail=True), batch_size=4)
+        chunks = chunks_for(2)
+        store.add_document("doc2", "文檔", "", chunks, [None] * len(chunks), defer=True)
+        queue.submit("doc2")
+        await queue.join()
+        indexing = store.documents["doc2"]["indexing"]
+        still_searchable = bool(store.search(fake_vector("x", DIM), 3, query_text="火山爆發"))
+
+        slow = EmbeddingQueue(store=store, embed=SlowEmbedder(delay=0.01), batch_size=2)
+        chunks = chunks_for(3)
+        store.add_document("doc3", "文檔", "", chunks, [None] * len(chunks), defer=True)
+        slow.submit("doc3")
+        await asyncio.sleep(0.03)
+        store.delete_document("doc3")
+        await slow.join()
+        leftovers = [c for c, _ in store.pending if c["document_id"] == "doc3"]
+        await queue.stop()
+        await slow.stop()
+
+        print(f"   失敗狀態: {indexing['status']}, 仍可搜尋: {still_searchable}, 刪除後殘留: {len(leftovers)}")
+        passed = (
+            indexing["status"] == "failed" and "Ollama" in indexing["error"] and still_searchable
+            and not leftovers and all(c["document_id"] != "doc3" for c in store.chunks)
+        )
+        return {"test_name": "failure_and_delete", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_no_progress(self) -> Dict:
+        """嵌入服務返回空結果時一輪沒有進度即標記失敗；空向量不會存入知識庫"""
+        print("\n🔍 測試沒有進度的嵌入...")
+        results = []
+        for vectors in (False, True):
+            store = VectorStore()
+            embed = BrokenEmbedder(vectors)
+            queue = EmbeddingQueue(store=store, embed=embed, batch_size=4)
+            chunks = chunks_for(4)
+            store.add_document("doc4", "文檔", "", chunks, [None] * len(chunks), defer=True)
+            queue.submit("doc4")
+            await queue.join()
+            await queue.stop()
+            results.append((embed.calls, store.documents["doc4"]["indexing"], store.count_chunks()))
+        try:
+            VectorStore().add_document("empty", "文檔", "", ["空向量的片段"], [[]])
+            rejected = False
+        except ValueError:
+            rejected = True
+        print(f"   (嵌入呼叫次數, 狀態, 向量片段數): {[(c, i['status'], n) for c, i, n in results]}, 直接寫入空向量被拒: {rejected}")
+        passed = rejected and all(
+            calls <= 2 and indexing["status"] == "failed" and indexing["pending_chunks"] == 10 and chunks == 0
+            for calls, indexing, chunks in results
+        )
+        return {"test_name": "no_progress", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_request_deadline(self) -> Dict:
+        """建立工作者的請求期限過後，之後提交的文檔仍可完成嵌入"""
+        print("\n🔍 測試不沿用請求期限...")
+        store = VectorStore()
+        embed = SlowEmbedder()
+
+        async def deadline_aware(texts: List[str]) -> List[List[float]]:
+            check_deadline()  # 與 get_embeddings 相同，超過期限時拋出 504
+            return await embed(texts)
+
+        queue = EmbeddingQueue(store=store, embed=deadline_aware, batch_size=4)
+
+        async def request(doc_id: str, n: int):
+            # 模擬 DeadlineMiddleware：請求期限只有 50 ms
+            current_deadline.set(time.monotonic() + 0.05)
+            chunks = chunks_for(n)
+            store.add_document(doc_id, "文檔", "", chunks, [None] * len(chunks), defer=True)
+            queue.submit(doc_id)
+
+        await asyncio.create_task(request("first", 4))
+        await queue.join()
+        await asyncio.sleep(0.1)
+        await asyncio.create_task(request("second", 5))
+        await queue.join()
+        await queue.stop()
+
+        statuses = [store.documents[doc_id]["indexing"]["status"] for doc_id in ("first", "second")]
+        print(f"   狀態: {statuses}")
+        passed = statuses == ["ready", "ready"] and queue.counters["failed"] == 0
+        return {"test_name": "request_deadline", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def benchmark_upload(self, chunks: int = 200, delay: float = 0.002) -> Dict:
+        """比較同步嵌入與延後嵌入的上傳耗時（假嵌入每段 delay 秒）"""
+        print("\n⏱️  上傳耗時...")
+        texts = [f"片段 {i}：{TOPICS[i % len(TOPICS)]}" for i in range(chunks)]
+        embed = SlowEmbedder(delay=delay)
+
+        store = VectorStore()
+        started = time.perf_counter()
+        store.add_document("sync", "同步", "", texts, await embed_new_chunks(store, texts, embed))
+        sync_ms = (time.perf_counter() - started) * 1000
+
+        store = VectorStore()
+        started = time.perf_counter()
+        store.add_document("deferred", "延後", "", texts, [None] * len(texts), defer=True)
+        deferred_ms = (time.perf_counter() - started) * 1000
+
+        print(f"   {chunks} 個片段: 同步嵌入 {sync_ms:.1f} ms, 延後嵌入 {deferred_ms:.1f} ms")
+        return {"test_name": "benchmark_upload", "sync_ms": round(sync_ms, 1), "deferred_ms": round(deferred_ms, 1),
+                "status": "ℹ️  INFO"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 延後嵌入測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_lexical_fallback(),
+            await self.test_lexical_ranking(),
+            await self.test_background_queue(),
+            await self.test_failure_and_delete(),
+            await self.test_no_progress(),
+            await self.test_request_deadline(),
+            await self.benchmark_upload()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(DeferredEmbeddingTester().run_all_tests())
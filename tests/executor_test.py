@@ -0,0 +1,149 @@
+"""
+執行器與向量搜尋測試腳本
+驗證 CPU 密集工作移到行程池後事件迴圈不再被阻塞，以及 NumPy 向量搜尋與原本逐一計算餘弦相似度的結果一致
+"""
+import asyncio
+import math
+import random
+import time
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import split_text
+from utils.executor import LoopLagMonitor, run_cpu_bound, run_in_process, shutdown_executors
+from vectorstore import VectorStore
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(x * x for x in b))
+    return dot / norm if norm else 0.0
+
+
+def random_store(rng: random.Random, documents: int, chunks: int, dim: int):
+    """建立隨機向量的資料庫，並返回 (資料庫, 片段 ID, 向量)"""
+    store = VectorStore()
+    ids, vectors = [], []
+    for d in range(documents):
+        embeddings = [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(chunks)]
+        store.add_document(f"doc{d}", f"文檔 {d}", "內容" * 10, [f"文檔 {d} 片段 {i}" for i in range(chunks)], embeddings)
+        ids += [f"doc{d}_{i}" for i in range(chunks)]
+        vectors += embeddings
+    return store, ids, vectors
+
+
+class ExecutorTester:
+    """執行器測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def _max_lag_during(self, work) -> float:
+        monitor = LoopLagMonitor(interval=0.005)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await work()
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+        return monitor.max_lag
+
+    async def test_loop_lag(self) -> Dict:
+        """
+        切割大型文檔時，行程池執行的事件迴圈延遲遠低於切割本身的耗時
+
+        只有一個 CPU 核心時行程池與事件迴圈輪流使用同一個核心，延遲取決於作業系統排程，
+        只檢查結果一致並回報延遲。
+        """
+        print("\n🔍 測試事件迴圈延遲...")
+        text = "\n\n".join("這是一個用來測試切割效能的句子。" * random.randint(5, 40) for _ in range(3000))
+        # 先啟動行程池，避免把建立行程的時間算進去
+        await run_in_process(split_text, "預熱")
+        outputs = {}
+
+        async def inline():
+            started = time.perf_counter()
+            outputs["inline"] = split_text(text)
+            outputs["work"] = time.perf_counter() - started
+
+        async def offloaded():
+            outputs["offloaded"] = await run_cpu_bound(split_text, text, size=len(text))
+
+        inline_lag = await self._max_lag_during(inline)
+        offloaded_lag = await self._max_lag_during(offloaded)
+        work = outputs["work"]
+        print(f"   文檔長度: {len(text)} 字, 切割耗時: {work * 1000:.1f} ms")
+        print(f"   直接執行最大延遲: {inline_lag * 1000:.1f} ms, 行程池: {offloaded_lag * 1000:.1f} ms")
+
+        same_result = outputs["offloaded"] == outputs["inline"]
+        if (os.cpu_count() or 1) == 1:
+            print("   （只有一個 CPU 核心，不比較延遲）")
+            status = "ℹ️  INFO" if same_result else "❌ FAIL"
+        else:
+            status = "✅ PASS" if same_result and offloaded_lag < work / 2 else "❌ FAIL"
+        return {"test_name": "loop_lag", "work_ms": round(work * 1000, 1), "inline_ms": round(inline_lag * 1000, 1),
+                "offloaded_ms": round(offloaded_lag * 1000, 1), "status": status}
+
+    async def test_search_parity(self, queries: int = 20) -> Dict:
+        """NumPy 搜尋（含刪除後與執行緒池路徑）與逐一計算的排序一致"""
+        print("\n🔍 測試向量搜尋一致性...")
+        rng = random.Random(3)
+        store, ids, vectors = random_store(rng, documents=60, chunks=40, dim=64)
+        store.delete_document("doc7")
+        kept = [(i, v) for i, v in zip(ids, vectors) if not i.startswith("doc7_")]
+
+        mismatches = 0
+        for _ in range(queries):
+            query = [rng.gauss(0, 1) for _ in range(64)]
+            expected = sorted(kept, key=lambda item: cosine(query, item[1]), reverse=True)[:5]
+            results = await store.asearch(query, 5)
+            if [r["id"] for r in results] != [i for i, _ in expected]:
+                mismatches += 1
+            elif any(abs(r["score"] - cosine(query, v)) > 1e-5 for r, (_, v) in zip(results, expected)):
+                mismatches += 1
+        print(f"   片段數: {store.count_chunks()}, 查詢數: {queries}, 不一致: {mismatches}")
+        return {"test_name": "search_parity", "mismatches": mismatches, "status": "✅ PASS" if not mismatches else "❌ FAIL"}
+
+    async def benchmark_search(self, chunks: int = 10000, dim: int = 384) -> Dict:
+        """比較 NumPy 搜尋與逐一計算餘弦相似度的耗時"""
+        print("\n⏱️  向量搜尋耗時基準...")
+        rng = random.Random(5)
+        store, _, vectors = random_store(rng, documents=chunks // 100, chunks=100, dim=dim)
+        query = [rng.gauss(0, 1) for _ in range(dim)]
+
+        started = time.perf_counter()
+        sorted(range(len(vectors)), key=lambda i: cosine(query, vectors[i]), reverse=True)[:5]
+        python_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for _ in range(10):
+            store.search(query, 5)
+        numpy_ms = (time.perf_counter() - started) * 100
+
+        print(f"   {chunks} 個 {dim} 維向量: 逐一計算 {python_ms:.1f} ms, NumPy {numpy_ms:.2f} ms")
+        return {"test_name": "benchmark_search", "python_ms": round(python_ms, 1), "numpy_ms": round(numpy_ms, 2), "status": "ℹ️  INFO"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 執行器與向量搜尋測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_loop_lag(),
+            await self.test_search_parity(),
+            await self.benchmark_search()
+        ]
+        shutdown_executors()
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(ExecutorTester().run_all_tests())
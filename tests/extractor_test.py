@@ -0,0 +1,172 @@
+"""
+網頁內容提取器測試腳本
+驗證 lxml 快速提取器與 BeautifulSoup 提取器的結果一致，並比較兩者在網頁上的耗時
+
+用法:
+    python tests/extractor_test.py                 # 一致性測試 + 合成網頁基準
+    python tests/extractor_test.py --pages <目錄>   # 另外以目錄中保存的 .html 網頁做一致性與基準測試
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.extractor import SoupExtractor, LxmlExtractor
+
+LONG_TEXT = "這是一段足夠長的內文，用來超過最短內容長度。" * 6
+
+PARITY_CASES = {
+    "article": f"<html><head><title> 標題 </title></head><body><nav>選單</nav><article><h2>小標</h2><p>{LONG_TEXT}</p><p>第二段 &amp; 實體</p></article></body></html>",
+    "main": f"<html><body><header><h1>站名</h1></header><main><p>{LONG_TEXT}</p></main><footer>版權</footer></body></html>",
+    "content_div": f"<html><body><div class='sidebar'>側欄</div><div class='post-content big'>{LONG_TEXT}<br>換行後</div></body></html>",
+    "paragraphs": f"<html><body><p>{LONG_TEXT}</p><p>  </p><p>最後 <b>粗體</b> 一段</p></body></html>",
+    "short_body": "<html><body><div>短內容<span>片段</span></div><p>一段</p></body></html>",
+    "removed_tail": f"<html><body><article>前<script>var x = 1;</script>後<style>p {{}}</style>尾{LONG_TEXT}</article></body></html>",
+    "comments": f"<html><body><article>甲<!-- 註解 -->乙<p>{LONG_TEXT}</p></article></body></html>",
+    "h1_title": f"<html><body><h1>  主標題 <small>副</small> </h1><p>{LONG_TEXT}</p></body></html>",
+    "title_in_header": f"<html><body><header><h1>被移除</h1></header><h1>保留</h1><p>{LONG_TEXT}</p></body></html>",
+    "xml_declaration": f"<?xml version='1.0' encoding='utf-8'?><html><body><article>{LONG_TEXT}</article></body></html>",
+    "nested_removed": f"<html><body><header><nav>內層</nav>外層</header><aside>旁</aside><main>{LONG_TEXT}</main></body></html>",
+    "no_body": "純文字，沒有任何標籤",
+    "empty": "",
+}
+
+TAGS = ["div", "p", "span", "article", "main", "section", "script", "style", "nav", "footer", "header", "aside", "b", "h1", "ul", "li"]
+CLASSES = ["", "content", "post", "sidebar", "entry-body", "menu", "article-text"]
+WORDS = ["hello", "世界", "資料", "&amp;", "&lt;tag&gt;", "  ", "\n", "新聞", "world", "內容"]
+
+
+def random_html(rng: random.Random, depth: int = 0) -> str:
+    """產生隨機巢狀的 HTML 片段"""
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        roll = rng.random()
+        if roll < 0.4 or depth > 4:
+            parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30))))
+        elif roll < 0.5:
+            parts.append(f"<!-- {rng.choice(WORDS)} -->")
+        else:
+            tag = rng.choice(TAGS)
+            cls = rng.choice(CLASSES)
+            attr = f" class='{cls}'" if cls else ""
+            parts.append(f"<{tag}{attr}>{random_html(rng, depth + 1)}</{tag}>")
+    return "".join(parts)
+
+
+def synthetic_page(paragraphs: int = 400) -> str:
+    """產生模擬新聞網站的大型網頁（大量選單、腳本與段落）"""
+    nav = "".join(f"<li><a href='/c/{i}'>分類 {i}</a></li>" for i in range(200))
+    scripts = "".join(f"<script>window.data{i} = {{\"k\": {i}}};</script>" for i in range(50))
+    body = "".join(
+        f"<p>第 {i} 段：{LONG_TEXT}<a href='/r/{i}'>相關連結</a> <!-- ad slot {i} --></p>"
+        for i in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>合成網頁</title>{scripts}<style>.a{{color:red}}</style></head>"
+        f"<body><header><nav><ul>{nav}</ul></nav></header>"
+        f"<div class='layout'><aside>{nav}</aside><div class='article-body'>{body}</div></div>"
+        f"<footer>{nav}</footer></body></html>"
+    )
+
+
+class ExtractorTester:
+    """網頁內容提取器測試器"""
+
+    def __init__(self, pages_dir: str = ""):
+        self.soup = SoupExtractor()
+        self.lxml = LxmlExtractor()
+        self.pages = self._load_pages(pages_dir)
+        self.test_results: List[Dict] = []
+
+    def _load_pages(self, pages_dir: str) -> Dict[str, str]:
+        pages = {"synthetic": synthetic_page()}
+        if pages_dir:
+            for path in sorted(Path(pages_dir).glob("*.html")):
+                pages[path.name] = path.read_text(encoding="utf-8", errors="replace")
+        return pages
+
+    def test_parity(self) -> Dict:
+        """固定案例與保存網頁的提取結果一致"""
+        print("\n🔍 測試提取結果一致性...")
+        cases = dict(PARITY_CASES, **self.pages)
+        mismatches = [name for name, html in cases.items() if self.soup.extract(html) != self.lxml.extract(html)]
+        for name in mismatches:
+            print(f"   ❌ 不一致: {name}")
+        print(f"   案例數: {len(cases)}, 不一致: {len(mismatches)}")
+        return {"test_name": "parity", "mismatches": mismatches, "status": "✅ PASS" if not mismatches else "❌ FAIL"}
+
+    def test_random_parity(self, samples: int = 500, seed: int = 7) -> Dict:
+        """隨機產生的 HTML 片段提取結果一致"""
+        print("\n🔍 測試隨機 HTML 一致性...")
+        rng = random.Random(seed)
+        mismatches = 0
+        for _ in range(samples):
+            html = f"<html><head><title>{rng.choice(WORDS)}</title></head><body>{random_html(rng)}</body></html>"
+            if self.soup.extract(html) != self.lxml.extract(html):
+                mismatches += 1
+                if mismatches == 1:
+                    print(f"   第一個不一致的輸入: {html[:200]}")
+        print(f"   樣本數: {samples}, 不一致: {mismatches}")
+        return {"test_name": "random_parity", "mismatches": mismatches, "status": "✅ PASS" if not mismatches else "❌ FAIL"}
+
+    def test_truncation_parity(self, limits=(50, 100, 500, 2000)) -> Dict:
+        """指定 max_chars 時，提早停止的 lxml 結果與完整提取後截斷相同"""
+        print("\n🔍 測試截斷一致性...")
+        cases = dict(PARITY_CASES, **self.pages)
+        mismatches = [
+            f"{name}@{limit}" for name, html in cases.items() for limit in limits
+            if self.soup.extract(html, limit) != self.lxml.extract(html, limit)
+        ]
+        for name in mismatches:
+            print(f"   ❌ 不一致: {name}")
+        print(f"   案例數: {len(cases) * len(limits)}, 不一致: {len(mismatches)}")
+        return {"test_name": "truncation_parity", "mismatches": mismatches, "status": "✅ PASS" if not mismatches else "❌ FAIL"}
+
+    def benchmark(self, repeat: int = 5) -> Dict:
+        """比較兩種提取器在每個網頁上的耗時（取最佳值）"""
+        print("\n⏱️  提取耗時基準...")
+        timings = {}
+        for name, html in self.pages.items():
+            row = {}
+            for extractor in (self.soup, self.lxml):
+                best = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    extractor.extract(html)
+                    best = min(best, time.perf_counter() - started)
+                row[extractor.name] = round(best * 1000, 2)
+            row["speedup"] = round(row["soup"] / row["lxml"], 1) if row["lxml"] else 0.0
+            timings[name] = row
+            print(f"   {name} ({len(html) // 1024} KB): soup {row['soup']} ms, lxml {row['lxml']} ms, {row['speedup']}x")
+        return {"test_name": "benchmark", "timings": timings, "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 網頁內容提取器測試")
+        print("=" * 60)
+
+        self.test_results = [
+            self.test_parity(),
+            self.test_random_parity(),
+            self.test_truncation_parity(),
+            self.benchmark()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="網頁內容提取器測試")
+    parser.add_argument("--pages", default="", help="保存的 .html 網頁目錄")
+    args = parser.parse_args()
+    ExtractorTester(args.pages).run_all_tests()
@@ -0,0 +1,190 @@
+"""
+網頁抓取快取測試腳本
+在本機啟動提供 ETag 的網站，驗證有效期內直接使用快取、過期後以條件請求重新驗證（304 沿用提取結果），
+以及磁碟快取的讀回與數量上限、同站請求間隔的狀態不會無限累積
+"""
+import asyncio
+import hashlib
+import shutil
+import tempfile
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.url_service as url_service
+from services.fetch_cache import FetchCache, CacheEntry
+from tests.helpers import QuietHandler, serve, url_of
+
+BODY = (
+    "<html><head><title>快取測試</title></head><body><article><h1>快取測試</h1>"
+    "<p>" + "這是用來測試網頁抓取快取的段落內容。" * 20 + "</p></article></body></html>"
+).encode("utf-8")
+ETAG = '"v1"'
+
+
+def start_site(max_age: int) -> ThreadingHTTPServer:
+    """
+    啟動測試網站
+
+    Args:
+        max_age: 回應的 Cache-Control max-age 秒數
+
+    Returns:
+        HTTP 服務（requests 屬性記錄每個請求的路徑與 If-None-Match 標頭）
+    """
+    class Handler(QuietHandler):
+        def do_GET(self):
+            condition = self.headers.get("If-None-Match")
+            self.server.requests.append((self.path, condition))
+            if condition == ETAG:
+                self.send_response(304)
+                self.send_header("ETag", ETAG)
+                self.send_header("Cache-Control", f"max-age={max_age}")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(BODY)))
+            self.send_header("ETag", ETAG)
+            self.send_header("Cache-Control", f"max-age={max_age}")
+            self.end_headers()
+            self.wfile.write(BODY)
+
+    return serve(Handler, requests=[])
+
+
+class FetchCacheTester:
+    """網頁抓取快取測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+        self.cache_dir = tempfile.mkdtemp(prefix="fetch_cache_test_")
+
+    def _use(self, cache: FetchCache) -> FetchCache:
+        url_service.fetch_cache = cache
+        return cache
+
+    async def test_revalidation(self) -> Dict:
+        """有效期內不送出請求；過期後送出條件請求，304 時沿用快取的提取結果"""
+        print("\n🔍 測試重新驗證...")
+        cache = self._use(FetchCache(cache_dir=""))
+        fresh_server = start_site(max_age=60)
+        url = url_of(fresh_server, "/page")
+        first, _ = await url_service.fetch_webpage(url)
+        again, _ = await url_service.fetch_webpage(url)
+
+        stale_server = start_site(max_age=0)
+        stale_url = url_of(stale_server, "/page")
+        await url_service.fetch_webpage(stale_url)
+        revalidated, html = await url_service.fetch_webpage(stale_url)
+        print(f"   有效期內請求數: {len(fresh_server.requests)}, 過期後請求: {stale_server.requests}, "
+              f"統計: {cache.stats()}")
+
+        passed = (
+            len(fresh_server.requests) == 1 and again == first
+            and stale_server.requests == [("/page", None), ("/page", ETAG)]
+            and cache.counters["revalidated"] == 1 and revalidated["title"] == first["title"]
+            and html == BODY.decode("utf-8")
+        )
+        return {"test_name": "revalidation", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_result_copies(self) -> Dict:
+        """返回的提取結果是複本：呼叫端修改結果不影響快取中的項目"""
+        print("\n🔍 測試返回結果的複本...")
+        self._use(FetchCache(cache_dir=""))
+        server = start_site(max_age=60)
+        url = url_of(server, "/page")
+        fetched, _ = await url_service.fetch_webpage(url)
+        original = fetched["content"]
+        fetched["content"] = "被呼叫端修改"
+        cached, _ = await url_service.fetch_webpage(url)
+        cached["title"] = "再次修改"
+        again, _ = await url_service.fetch_webpage(url)
+        print(f"   快取後內容未被修改: {again['content'] == original}, 標題: {again['title']}")
+        passed = again["content"] == original and again["title"] == "快取測試" and len(server.requests) == 1
+        return {"test_name": "result_copies", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_disk(self) -> Dict:
+        """新的快取實例（如重新啟動後）從磁碟讀回項目；超過上限時刪除最舊的項目且不重新掃描目錄"""
+        print("\n🔍 測試磁碟快取...")
+        server = start_site(max_age=60)
+        url = url_of(server, "/page")
+        self._use(FetchCache(cache_dir=self.cache_dir))
+        first, _ = await url_service.fetch_webpage(url)
+
+        restarted = self._use(FetchCache(cache_dir=self.cache_dir))
+        reloaded, _ = await url_service.fetch_webpage(url)
+        disk_read = restarted.counters["disk_hits"] == 1 and len(server.requests) == 1 and reloaded == first
+
+        small = FetchCache(memory_size=2, cache_dir=self.cache_dir, disk_max_entries=3)
+        for n in range(5):
+            await small.put(CacheEntry(url=f"http://example.test/{n}", html="<p>x</p>", result={"content": str(n)}))
+        # 寫入後若重新掃描目錄，手動放入的檔案會出現在索引中
+        Path(self.cache_dir, "unindexed.json").write_text("{}", encoding="utf-8")
+        await small.put(CacheEntry(url="http://example.test/5", html="<p>x</p>", result={"content": "5"}))
+        files = sorted(p.name for p in Path(self.cache_dir).glob("*.json"))
+        expected = sorted(
+            [hashlib.sha256(f"http://example.test/{n}".encode()).hexdigest() + ".json" for n in (3, 4, 5)]
+            + ["unindexed.json"]
+        )
+        oldest = await small.get("http://example.test/0")
+        stats = small.stats()
+        print(f"   重新啟動後磁碟命中: {restarted.counters['disk_hits']}, 磁碟檔案數: {len(files)}, 統計: {stats}")
+
+        passed = (
+            disk_read and files == expected and oldest is None
+            and stats["disk_entries"] == 3 and stats["disk_bytes"] > 0
+            and not list(Path(self.cache_dir).glob("*.tmp"))
+        )
+        return {"test_name": "disk", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_pacing_cleanup(self, hosts: int = 200, interval: float = 0.02) -> Dict:
+        """同一網站的請求至少間隔 interval 秒；間隔已過且沒有請求等待的網站不保留狀態"""
+        print("\n🔍 測試請求間隔的狀態清理...")
+        started = time.monotonic()
+        await asyncio.gather(*[url_service._pace("same.test", interval) for _ in range(3)])
+        paced = time.monotonic() - started
+
+        await asyncio.gather(*[url_service._pace(f"host{n}.test", interval) for n in range(hosts)])
+        peak = len(url_service._next_request)
+        await asyncio.sleep(interval * 2)
+        await url_service._pace("last.test", interval)
+        remaining_hosts = list(url_service._next_request)
+        print(f"   同站 3 個請求耗時 {paced * 1000:.0f} ms, {hosts} 個網站後的狀態數: {peak}, "
+              f"間隔過後: {remaining_hosts}, 鎖: {len(url_service._pace_locks)}")
+        passed = (
+            paced >= interval * 2 * 0.9 and peak >= hosts
+            and remaining_hosts == ["last.test"] and not url_service._pace_locks
+        )
+        return {"test_name": "pacing_cleanup", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 網頁抓取快取測試")
+        print("=" * 60)
+
+        try:
+            self.test_results = [
+                await self.test_revalidation(),
+                await self.test_result_copies(),
+                await self.test_disk(),
+                await self.test_pacing_cleanup()
+            ]
+        finally:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(FetchCacheTester().run_all_tests())
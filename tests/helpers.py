@@ -0,0 +1,46 @@
+"""
+測試共用工具
+由文字決定的假嵌入向量，以及在背景執行緒啟動的本機 HTTP 服務（供模擬 Ollama 或測試網站使用）
+"""
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Type
+
+import numpy as np
+
+
+def fake_vector(text: str, dim: int) -> List[float]:
+    """由文字決定的向量：相同文字得到相同向量，且不受字串雜湊的隨機種子（PYTHONHASHSEED）影響"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    return np.random.default_rng(seed).standard_normal(dim).tolist()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """不輸出存取紀錄的請求處理器"""
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler: Type[BaseHTTPRequestHandler], **attributes) -> ThreadingHTTPServer:
+    """
+    在背景執行緒啟動本機 HTTP 服務（port 由系統分配）
+
+    Args:
+        handler: 請求處理器類別
+        attributes: 設定在服務上的屬性（如記錄請求的列表），處理器以 self.server 存取
+
+    Returns:
+        HTTP 服務
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url_of(server: ThreadingHTTPServer, path: str = "") -> str:
+    """服務的網址"""
+    return f"http://127.0.0.1:{server.server_port}{path}"
@@ -0,0 +1,252 @@
+"""
+索引服務測試腳本
+啟動獨立的索引服務行程，驗證多個用戶端看到同一個知識庫、搜尋結果與行程內的 VectorStore 一致，
+以差異同步的用戶端與重新取得完整快照的一致、知識庫的錯誤以錯誤回應送回用戶端而不中斷連線，
+並比較 1 個與多個 worker 行程同時搜尋共享記憶體時的吞吐量
+
+用法:
+    python tests/index_server_test.py [--workers 4]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict
+
+# 添加項目根目錄到路徑
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vectorstore import VectorStore, RemoteVectorStore, MissingEmbeddingError
+from vectorstore.index_server import IndexServer
+from vectorstore.protocol import OPS, STATUS_ERROR, recv_frame
+
+DIM = 384
+
+
+def random_vectors(rng: random.Random, n: int) -> List[List[float]]:
+    return [[rng.gauss(0, 1) for _ in range(DIM)] for _ in range(n)]
+
+
+def start_server(socket_path: str) -> subprocess.Popen:
+    """啟動索引服務行程並等待 socket 建立"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "vectorstore.index_server", "--socket", socket_path],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            return process
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("索引服務未能啟動")
+
+
+def search_worker(socket_path: str, duration: float, seed: int, counts):
+    """worker 行程：在指定時間內持續搜尋"""
+    store = RemoteVectorStore(socket_path)
+    rng = random.Random(seed)
+    queries = random_vectors(rng, 20)
+    done = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        store.search(queries[done % len(queries)], 5)
+        done += 1
+    counts.append(done)
+
+
+class IndexServerTester:
+    """索引服務測試器"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.socket_path = os.path.join(tempfile.mkdtemp(), "index.sock")
+        self.test_results: List[Dict] = []
+
+    def test_shared_view(self) -> Dict:
+        """一個用戶端的新增與刪除，其他用戶端立即可見，搜尋結果與行程內資料庫一致"""
+        print("\n🔍 測試多用戶端共用知識庫...")
+        rng = random.Random(11)
+        writer, reader = RemoteVectorStore(self.socket_path), RemoteVectorStore(self.socket_path)
+        local = VectorStore()
+        writer.clear()
+        for d in range(20):
+            chunks = [f"文檔 {d} 片段 {i}" for i in range(50)]
+            embeddings = random_vectors(rng, len(chunks))
+            writer.add_document(f"doc{d}", f"文檔 {d}", "內容", chunks, embeddings)
+            local.add_document(f"doc{d}", f"文檔 {d}", "內容", chunks, embeddings)
+        writer.delete_document("doc3")
+        local.delete_document("doc3")
+
+        query = random_vectors(rng, 1)[0]
+        remote_ids = [r["id"] for r in reader.search(query, 5)]
+        local_ids = [r["id"] for r in local.search(query, 5)]
+        print(f"   讀取端文檔數: {reader.count_documents()}, 片段數: {reader.count_chunks()}")
+        print(f"   搜尋結果一致: {remote_ids == local_ids}")
+
+        try:
+            writer.add_document("bad", "維度錯誤", "內容", ["片段"], [[1.0, 2.0]])
+            dimension_checked = False
+        except ValueError:
+            dimension_checked = True
+
+        passed = (
+            reader.count_documents() == 19
+            and reader.count_chunks() == local.count_chunks()
+            and "doc3" not in reader.documents
+            and remote_ids == local_ids
+            and dimension_checked
+        )
+        return {"test_name": "shared_view", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_incremental_sync(self) -> Dict:
+        """用戶端以差異同步：新增只傳送新的片段且沿用同一個區段，各種修改後與完整快照一致，文檔內容按需取得"""
+        print("\n🔍 測試差異同步...")
+        rng = random.Random(12)
+        writer, reader = RemoteVectorStore(self.socket_path), RemoteVectorStore(self.socket_path)
+        writer.clear()
+        for d in range(20):
+            chunks = [f"同步 {d} 片段 {i}" for i in range(20)]
+            writer.add_document(f"s{d}", f"同步 {d}", "內容" * 200, chunks, random_vectors(rng, len(chunks)))
+        reader.count_chunks()
+        segment = reader._segment.name
+
+        # 新增一篇文檔：差異只包含新的文檔與片段，向量寫在同一個區段的後面
+        version = reader._snapshot.key[1]
+        writer.add_document("s20", "同步 20", "內容" * 200, ["新片段"], random_vectors(rng, 1))
+        control = reader._snapshot.key[0]
+        delta, _ = reader._call("snapshot", {"control": control, "since": version})
+        full, _ = reader._call("snapshot", {})
+        delta_bytes = len(json.dumps(delta, ensure_ascii=False).encode("utf-8"))
+        full_bytes = len(json.dumps(full, ensure_ascii=False).encode("utf-8"))
+        grown_in_place = reader.count_chunks() == 401 and reader._segment.name == segment
+
+        # 更新、共用片段、刪除、延後嵌入與補上向量、失敗記錄
+        writer.update_document("s1", "同步 1 v2", "新內容", ["同步 2 片段 0", "改過的片段"], [None, random_vectors(rng, 1)[0]])
+        writer.delete_document("s2")
+        writer.delete_document("s5")
+        writer.add_document("late", "延後", "內容", ["待嵌入 A", "待嵌入 B", "同步 3 片段 1"], [None] * 3, defer=True)
+        reader.count_chunks()
+        writer.attach_embeddings("late", ["待嵌入 A"], random_vectors(rng, 1))
+        writer.mark_indexing_failed("late", "測試失敗")
+        reader.count_chunks()
+
+        def state(store: RemoteVectorStore):
+            snapshot = store._current()
+            return snapshot.documents, snapshot.chunks, [c for c, _ in snapshot.pending], snapshot.matrix.tolist()
+
+        consistent = state(reader) == state(RemoteVectorStore(self.socket_path))
+        hashes_match = reader._snapshot.hashes == {c["hash"] for c in reader.chunks}
+
+        # 落後超過差異記錄的版本數時改取得完整快照
+        lagging = RemoteVectorStore(self.socket_path)
+        lagging.count_chunks()
+        for _ in range(300):
+            writer.mark_indexing_failed("late", "重複記錄")
+        writer.add_document("after", "之後", "內容", ["之後的片段"], random_vectors(rng, 1))
+        caught_up = state(lagging) == state(RemoteVectorStore(self.socket_path))
+
+        content = reader.get_document("s1")
+        print(f"   新增一篇文檔的差異: {delta_bytes} bytes（完整快照 {full_bytes} bytes），同一區段: {grown_in_place}")
+        print(f"   差異套用後一致: {consistent}, 落後後一致: {caught_up}, 內容按需取得: {content['content'] if content else None}")
+        passed = (
+            "deltas" in delta and len(delta["deltas"]) == 1 and delta_bytes * 20 < full_bytes
+            and grown_in_place and consistent and hashes_match and caught_up
+            and "content" not in reader.documents["s1"] and reader.documents["s1"]["preview"] == "新內容"
+            and content["content"] == "新內容" and reader.get_document("s2") is None
+            and reader.documents["late"]["indexing"]["status"] == "failed"
+        )
+        return {"test_name": "incremental_sync", "delta_bytes": delta_bytes, "full_bytes": full_bytes,
+                "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_error_frames(self) -> Dict:
+        """知識庫拋出的錯誤（含非預期的例外）以錯誤回應送回，連線維持可用；MissingEmbeddingError 在用戶端重新拋出"""
+        print("\n🔍 測試錯誤回應...")
+        client = RemoteVectorStore(self.socket_path)
+        client.clear()
+        client.add_document("base", "基準", "內容", ["已存在的片段"], random_vectors(random.Random(5), 1))
+        connection = client._sock
+        try:
+            client.add_document("bad", "缺少向量", "內容", ["已存在的片段", "沒有向量的新片段"], [None, None])
+            missing_raised = False
+        except MissingEmbeddingError:
+            missing_raised = True
+        same_connection = client._sock is connection and client.count_documents() == 1
+
+        # 行程內的服務：非預期的例外也編碼為錯誤回應
+        server = IndexServer(os.path.join(tempfile.mkdtemp(), "unused.sock"), shm_prefix="rag_test")
+        try:
+            def broken(*args, **kwargs):
+                raise ZeroDivisionError("模擬的知識庫錯誤")
+            server.store.find_near_duplicates = broken
+            frame = server.dispatch(OPS["near_duplicates"], {"content": "內容"}, b"")
+        finally:
+            server.close()
+        left, right = socket.socketpair()
+        left.sendall(frame)
+        status, result, _ = recv_frame(right)
+        left.close()
+        right.close()
+        print(f"   MissingEmbeddingError 重新拋出: {missing_raised}, 連線沿用: {same_connection}, 非預期例外的回應: {result}")
+        passed = (
+            missing_raised and same_connection
+            and status == STATUS_ERROR and result == {"type": "ZeroDivisionError", "error": "模擬的知識庫錯誤"}
+        )
+        return {"test_name": "error_frames", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def benchmark_workers(self, duration: float = 2.0) -> Dict:
+        """1 個與多個 worker 行程的搜尋吞吐量"""
+        print("\n⏱️  多 worker 搜尋吞吐量...")
+        throughput = {}
+        context = multiprocessing.get_context("spawn")
+        for workers in sorted({1, self.workers}):
+            with context.Manager() as manager:
+                counts = manager.list()
+                processes = [
+                    context.Process(target=search_worker, args=(self.socket_path, duration, i, counts))
+                    for i in range(workers)
+                ]
+                for p in processes:
+                    p.start()
+                for p in processes:
+                    p.join()
+                throughput[workers] = round(sum(counts) / duration, 1)
+            print(f"   {workers} 個 worker: {throughput[workers]} 次搜尋/秒")
+        print(f"   （CPU 核心數: {os.cpu_count()}，吞吐量隨 worker 數增加的幅度受核心數限制）")
+        return {"test_name": "benchmark_workers", "throughput": throughput, "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 索引服務測試")
+        print("=" * 60)
+
+        server = start_server(self.socket_path)
+        try:
+            self.test_results = [
+                self.test_shared_view(),
+                self.test_incremental_sync(),
+                self.test_error_frames(),
+                self.benchmark_workers()
+            ]
+        finally:
+            server.terminate()
+            server.wait()
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="索引服務測試")
+    parser.add_argument("--workers", type=int, default=4, help="吞吐量測試的 worker 行程數")
+    args = parser.parse_args()
+    IndexServerTester(args.workers).run_all_tests()
@@ -0,0 +1,138 @@
+"""
+MMR 重新排序測試腳本
+驗證向量化的 MMR 與逐一計算的參考實作結果相同、能分散重疊片段，
+並量測重新排序相對於搜尋本身的耗時
+
+用法：
+    python tests/mmr_test.py [--rows 100000] [--dim 768] [--candidates 300]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Dict
+
+import numpy as np
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstore import VectorStore
+from vectorstore.mmr import mmr_select
+from vectorstore.store import Snapshot, _normalize, search_snapshot
+
+
+def reference_mmr(vectors: np.ndarray, relevance: np.ndarray, k: int, mmr_lambda: float) -> List[int]:
+    """逐一計算的 MMR（對照用）"""
+    selected: List[int] = []
+    remaining = list(range(len(vectors)))
+    while remaining and len(selected) < k:
+        def score(i: int) -> float:
+            redundancy = max((float(vectors[i] @ vectors[j]) for j in selected), default=-1.0)
+            return mmr_lambda * float(relevance[i]) - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+class MMRTester:
+    """MMR 重新排序測試器"""
+
+    def __init__(self, rows: int, dim: int, candidates: int):
+        self.rows = rows
+        self.dim = dim
+        self.candidates = candidates
+        self.test_results: List[Dict] = []
+
+    def test_reference(self) -> Dict:
+        """向量化實作與參考實作挑選的順序相同"""
+        print("\n🔍 測試與參考實作一致...")
+        rng = np.random.default_rng(2)
+        mismatched = []
+        for mmr_lambda in (0.0, 0.3, 0.5, 0.7, 1.0):
+            vectors = _normalize(rng.standard_normal((60, 32)).astype(np.float32))
+            relevance = rng.random(60).astype(np.float32)
+            got = mmr_select(vectors, relevance, 10, mmr_lambda).tolist()
+            if got != reference_mmr(vectors, relevance, 10, mmr_lambda):
+                mismatched.append(mmr_lambda)
+        print(f"   不一致的 λ: {mismatched}")
+        return {"test_name": "reference", "status": "✅ PASS" if not mismatched else "❌ FAIL"}
+
+    def test_diversify(self) -> Dict:
+        """重疊片段佔滿一般搜尋的結果；MMR 在保留最相關片段的同時納入其他主題"""
+        print("\n🔍 測試分散重疊片段...")
+        rng = np.random.default_rng(4)
+        dim = 64
+        query = _normalize(rng.standard_normal((1, dim)).astype(np.float32))[0]
+        # 主題 0 最接近查詢且有 8 個幾乎相同的片段，其餘主題各 2 個
+        offsets = _normalize(rng.standard_normal((4, dim)).astype(np.float32)) * np.array([[0.6], [1.0], [1.0], [1.0]])
+        topics = _normalize(query + offsets)
+        vectors = [topics[0] + 0.02 * rng.standard_normal(dim) for _ in range(8)]
+        vectors += [topics[t] + 0.05 * rng.standard_normal(dim) for t in (1, 2, 3) for _ in range(2)]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        store = VectorStore(track_near_duplicates=False)
+        for i, vector in enumerate(vectors):
+            topic = 0 if i < 8 else 1 + (i - 8) // 2
+            store.add_document(f"doc{i}", f"主題{topic}", "", [f"片段 {i}"], [vector.tolist()])
+
+        def topics_of(results):
+            return {store.documents[r["document_ids"][0]]["title"] for r in results}
+
+        plain = store.search(query.tolist(), 4)
+        unchanged = store.search(query.tolist(), 4, mmr_lambda=1.0)
+        diverse = store.search(query.tolist(), 4, mmr_lambda=0.5)
+        print(f"   一般搜尋主題: {sorted(topics_of(plain))}, MMR λ=0.5 主題: {sorted(topics_of(diverse))}")
+        passed = (
+            [r["id"] for r in unchanged] == [r["id"] for r in plain]
+            and len(topics_of(plain)) == 1 and len(topics_of(diverse)) == 4
+            and diverse[0]["id"] == plain[0]["id"]
+            and all(0 < r["score"] <= 1.0001 for r in diverse)
+        )
+        return {"test_name": "diversify", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_overhead(self, queries: int = 20, top_k: int = 10) -> Dict:
+        """MMR 重新排序本身與整體搜尋的耗時"""
+        print(f"\n⏱️  耗時（{self.rows} 個 {self.dim} 維向量，候選 {self.candidates}，top_k={top_k}）...")
+        rng = np.random.default_rng(7)
+        matrix = _normalize(rng.standard_normal((self.rows, self.dim)).astype(np.float32))
+        snapshot = Snapshot(0, {}, [{"id": f"chunk_{i}"} for i in range(self.rows)], matrix)
+        probes = _normalize(rng.standard_normal((queries, self.dim)).astype(np.float32))
+
+        def timed(fn) -> float:
+            fn(probes[0])
+            started = time.perf_counter()
+            for q in probes:
+                fn(q)
+            return (time.perf_counter() - started) * 1000 / queries
+
+        plain_ms = timed(lambda q: search_snapshot(snapshot, q, top_k))
+        mmr_ms = timed(lambda q: search_snapshot(snapshot, q, top_k, mmr_lambda=0.5, mmr_candidates=self.candidates))
+        pool = matrix[:self.candidates]
+        relevance = pool @ probes[0]
+        select_ms = timed(lambda q: mmr_select(pool, relevance, top_k, 0.5))
+        print(f"   一般搜尋: {plain_ms:.2f} ms, 含 MMR 的搜尋: {mmr_ms:.2f} ms, MMR 挑選本身: {select_ms:.3f} ms")
+        return {"test_name": "overhead", "plain_ms": plain_ms, "mmr_ms": mmr_ms, "select_ms": select_ms,
+                "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 MMR 重新排序測試")
+        print("=" * 60)
+
+        self.test_results = [self.test_reference(), self.test_diversify(), self.test_overhead()]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MMR 重新排序測試")
+    parser.add_argument("--rows", type=int, default=100000, help="向量數")
+    parser.add_argument("--dim", type=int, default=768, help="向量維度")
+    parser.add_argument("--candidates", type=int, default=300, help="MMR 候選片段數")
+    args = parser.parse_args()
+    MMRTester(args.rows, args.dim, args.candidates).run_all_tests()
@@ -0,0 +1,157 @@
+"""
+模型生命週期測試腳本
+在本機啟動模擬的 Ollama 服務，驗證啟動時以 keep_alive 預熱兩個模型並記錄冷啟動耗時、
+背景定期探測並快取健康狀態，以及 /health 只讀取快取而不呼叫 Ollama
+"""
+import asyncio
+import json
+import time
+from http.server import ThreadingHTTPServer
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import OLLAMA_MODEL, EMBEDDING_MODEL, OLLAMA_KEEP_ALIVE
+from services.model_manager import ModelManager
+from utils.ollama_pool import Backend, llm_pool, embedding_pool
+from tests.helpers import QuietHandler, serve, url_of
+
+
+def start_stand_in(models: List[str]) -> ThreadingHTTPServer:
+    """
+    啟動模擬的 Ollama 服務
+
+    Args:
+        models: /api/tags 返回的模型名稱
+
+    Returns:
+        HTTP 服務（requests 屬性記錄每個請求的方法、路徑與內容）
+    """
+    class Handler(QuietHandler):
+        def _reply(self, payload: Dict):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.server.requests.append(("GET", self.path, None))
+            self._reply({"models": [{"name": name} for name in models]})
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self.server.requests.append(("POST", self.path, payload))
+            self._reply({"response": "", "done": True})
+
+    return serve(Handler, requests=[])
+
+
+def use_backends(url: str):
+    """讓 LLM 與嵌入後端池指向測試服務"""
+    llm_pool.backends = [Backend(url)]
+    embedding_pool.backends = [Backend(url)]
+
+
+class ModelManagerTester:
+    """模型生命週期測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def test_warm_up(self) -> Dict:
+        """預熱請求載入 LLM 與嵌入模型並帶上 keep_alive，冷啟動耗時依後端記錄"""
+        print("\n🔍 測試模型預熱...")
+        server = start_stand_in([OLLAMA_MODEL, f"{EMBEDDING_MODEL}:latest"])
+        url = url_of(server)
+        use_backends(url)
+        manager = ModelManager()
+        await manager.warm_up()
+
+        posts = {path: payload for method, path, payload in server.requests if method == "POST"}
+        print(f"   預熱請求: {posts}")
+        print(f"   冷啟動紀錄: {manager.cold_start}")
+        passed = (
+            posts.get("/api/generate", {}).get("model") == OLLAMA_MODEL
+            and posts.get("/api/embed", {}).get("model") == EMBEDDING_MODEL
+            and all(p.get("keep_alive") == OLLAMA_KEEP_ALIVE for p in posts.values())
+            and posts["/api/generate"].get("prompt") == ""
+            and "error" not in manager.cold_start["llm"][url] and manager.cold_start["llm"][url]["ms"] >= 0
+            and "error" not in manager.cold_start["embedding"][url]
+        )
+        return {"test_name": "warm_up", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_background_probe(self) -> Dict:
+        """背景定期探測並更新快取；模型不存在或服務無法連線時反映在狀態中，停止後不再探測"""
+        print("\n🔍 測試背景健康探測...")
+        server = start_stand_in([OLLAMA_MODEL])
+        use_backends(url_of(server))
+        manager = ModelManager(probe_interval=0.05)
+        await manager.probe()
+        missing = manager.status["embedding_status"]
+
+        manager._probe_task = asyncio.create_task(manager._probe_loop())
+        await asyncio.sleep(0.3)
+        await manager.stop()
+        probes = sum(1 for method, path, _ in server.requests if method == "GET" and path == "/api/tags")
+        await asyncio.sleep(0.15)
+        probes_after_stop = sum(1 for method, path, _ in server.requests if method == "GET") - probes
+
+        server.shutdown()
+        server.server_close()
+        await manager.probe()
+        down = manager.status
+        print(f"   嵌入模型缺少時: {missing}, 背景探測次數: {probes}, 停止後: {probes_after_stop}, "
+              f"服務停止後: {down['ollama_status']}")
+        passed = (
+            missing.startswith("missing") and probes >= 3 and probes_after_stop == 0
+            and down["ollama_status"] == "unreachable" and down["embedding_status"] == "unknown"
+            and llm_pool.backends[0].consecutive_failures >= 1
+        )
+        return {"test_name": "background_probe", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_cached_health(self, calls: int = 1000) -> Dict:
+        """/health 讀取快取的探測結果，不對 Ollama 送出任何請求"""
+        print("\n🔍 測試快取的健康檢查...")
+        import main
+        from services import model_manager
+
+        server = start_stand_in([OLLAMA_MODEL, f"{EMBEDDING_MODEL}:latest"])
+        use_backends(url_of(server))
+        await model_manager.probe()
+        before = len(server.requests)
+        started = time.perf_counter()
+        for _ in range(calls):
+            health = await main.health_check()
+        per_call_us = (time.perf_counter() - started) * 1e6 / calls
+        print(f"   {calls} 次健康檢查對 Ollama 的請求數: {len(server.requests) - before}, 平均 {per_call_us:.1f} µs")
+        passed = (
+            len(server.requests) == before and health["ollama_status"] == "healthy"
+            and health["embedding_status"] == "ready" and health["checked_at"] is not None
+        )
+        return {"test_name": "cached_health", "per_call_us": per_call_us, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 模型生命週期測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_warm_up(),
+            await self.test_background_probe(),
+            await self.test_cached_health()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(ModelManagerTester().run_all_tests())
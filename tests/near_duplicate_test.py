@@ -0,0 +1,101 @@
+"""
+近似重複文檔偵測測試腳本
+驗證修訂版文檔會被偵測、無關文檔不會誤報，且查詢耗時不隨知識庫大小線性增加
+"""
+import random
+import time
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstore import MinHashIndex, VectorStore
+
+CHARS = "的一是在不了有和人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行學法所民得經"
+
+
+def random_sentence(rng: random.Random) -> str:
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(15, 40))) + "。"
+
+
+def random_document(rng: random.Random, sentences: int = 40) -> List[str]:
+    return [random_sentence(rng) for _ in range(sentences)]
+
+
+def revise(rng: random.Random, sentences: List[str], ratio: float = 0.05) -> List[str]:
+    """修改約 ratio 比例的句子"""
+    revised = list(sentences)
+    for i in rng.sample(range(len(revised)), max(1, int(len(revised) * ratio))):
+        revised[i] = random_sentence(rng)
+    return revised
+
+
+class NearDuplicateTester:
+    """近似重複偵測測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    def test_detection(self, documents: int = 300) -> Dict:
+        """修訂版都能找到原文檔，全新的文檔不會被誤判"""
+        print("\n🔍 測試近似重複偵測...")
+        rng = random.Random(8)
+        store = VectorStore()
+        originals = {}
+        for n in range(documents):
+            sentences = random_document(rng)
+            originals[f"doc{n}"] = sentences
+            store.add_document(f"doc{n}", f"文檔 {n}", "".join(sentences), [], [])
+
+        found = sum(
+            1 for doc_id, sentences in list(originals.items())[:100]
+            if any(d["document_id"] == doc_id for d in store.find_near_duplicates("".join(revise(rng, sentences))))
+        )
+        false_positives = sum(
+            1 for _ in range(100) if store.find_near_duplicates("".join(random_document(rng)))
+        )
+        store.delete_document("doc0")
+        removed = not store.find_near_duplicates("".join(originals["doc0"]))
+
+        print(f"   修訂版偵測: {found}/100, 誤報: {false_positives}/100, 刪除後不再回報: {removed}")
+        passed = found >= 95 and false_positives == 0 and removed
+        return {"test_name": "detection", "found": found, "false_positives": false_positives,
+                "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def benchmark_query(self, sizes=(1000, 10000), queries: int = 200) -> Dict:
+        """不同知識庫大小下的查詢耗時（只比對 LSH 候選，不掃描全部文檔）"""
+        print("\n⏱️  查詢耗時與知識庫大小...")
+        rng = random.Random(9)
+        index = MinHashIndex()
+        timings = {}
+        added = 0
+        for size in sizes:
+            while added < size:
+                index.add(f"doc{added}", index.signature("".join(random_document(rng, 10))))
+                added += 1
+            signatures = [index.signature("".join(random_document(rng, 10))) for _ in range(queries)]
+            started = time.perf_counter()
+            for signature in signatures:
+                index.query(signature)
+            timings[size] = (time.perf_counter() - started) * 1000 / queries
+            print(f"   {size} 份文檔: 每次查詢 {timings[size]:.3f} ms")
+        return {"test_name": "benchmark_query", "ms": {k: round(v, 3) for k, v in timings.items()}, "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 近似重複文檔偵測測試")
+        print("=" * 60)
+
+        self.test_results = [self.test_detection(), self.benchmark_query()]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    NearDuplicateTester().run_all_tests()
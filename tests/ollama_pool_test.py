@@ -0,0 +1,165 @@
+"""
+Ollama 多後端路由測試腳本
+在本機啟動多個模擬 Ollama 的 HTTP 服務，驗證負載分配、故障剔除、對沖請求與自適應併發限制
+"""
+import asyncio
+import json
+import time
+from http.server import ThreadingHTTPServer
+from typing import List, Dict
+from fastapi import HTTPException
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.concurrency import AdaptiveLimiter
+from utils.ollama_pool import OllamaPool
+from tests.helpers import QuietHandler, serve, url_of
+
+
+def start_stand_in(delay: float = 0.0, status: int = 200) -> ThreadingHTTPServer:
+    """
+    啟動模擬的 Ollama 服務
+
+    Args:
+        delay: 每個請求的回應延遲秒數
+        status: 回應的 HTTP 狀態碼
+
+    Returns:
+        HTTP 服務（port 由系統分配）
+    """
+    class Handler(QuietHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            body = json.dumps({"response": f"port {self.server.server_port}", "done": True}).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except BrokenPipeError:
+                # 對沖請求勝出後，另一個請求會被取消
+                pass
+
+    return serve(Handler)
+
+
+class OllamaPoolTester:
+    """多後端路由測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def test_least_outstanding(self, requests: int = 30) -> Dict:
+        """同時送出多個請求，檢查是否平均分配到各後端"""
+        print("\n🔍 測試最少未完成請求分配...")
+        servers = [start_stand_in(delay=0.05) for _ in range(3)]
+        # 併發上限放寬到請求數，只觀察後端選擇
+        limiter = AdaptiveLimiter("test", initial=requests, max_limit=requests)
+        pool = OllamaPool("test", [url_of(s) for s in servers], limiter=limiter)
+
+        await asyncio.gather(*[pool.post("/api/generate", {}, timeout=5.0) for _ in range(requests)])
+        counts = [b.requests for b in pool.backends]
+        print(f"   各後端請求數: {counts}")
+
+        passed = max(counts) - min(counts) <= 2
+        return {"test_name": "least_outstanding", "counts": counts, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_ejection(self, requests: int = 10) -> Dict:
+        """失敗的後端在連續錯誤後被剔除，無法連線的後端自動改送其他後端"""
+        print("\n🔍 測試故障剔除與連線失敗轉送...")
+        healthy = start_stand_in()
+        failing = start_stand_in(status=500)
+        pool = OllamaPool("test", [url_of(failing), url_of(healthy), "http://127.0.0.1:9"])
+
+        statuses = []
+        for _ in range(requests):
+            response = await pool.post("/api/generate", {}, timeout=5.0)
+            statuses.append(response.status_code)
+        failing_backend, healthy_backend, dead_backend = pool.backends
+        print(f"   回應狀態: {statuses}")
+        print(f"   故障後端請求數: {failing_backend.requests}, 健康: {failing_backend.healthy}")
+        print(f"   無法連線後端健康: {dead_backend.healthy}")
+
+        passed = (
+            not failing_backend.healthy
+            and not dead_backend.healthy
+            and statuses[-5:] == [200] * 5
+            and healthy_backend.requests >= requests - 3
+        )
+        return {"test_name": "ejection", "statuses": statuses, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_hedging(self) -> Dict:
+        """主後端過慢時，對沖請求由第二個後端先返回"""
+        print("\n🔍 測試對沖請求...")
+        slow = start_stand_in(delay=1.0)
+        fast = start_stand_in(delay=0.0)
+        pool = OllamaPool("test", [url_of(slow), url_of(fast)], hedge_after=0.1)
+        # 讓慢的後端先被選中
+        pool.backends[1].outstanding = 1
+
+        started = time.monotonic()
+        response = await pool.post("/api/generate", {}, timeout=5.0)
+        elapsed = time.monotonic() - started
+        pool.backends[1].outstanding -= 1
+        print(f"   回應來源: {response.json()['response']}, 耗時 {elapsed * 1000:.0f} ms")
+
+        passed = response.json()["response"] == f"port {fast.server_port}" and elapsed < 0.5
+        return {"test_name": "hedging", "elapsed_ms": round(elapsed * 1000), "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_adaptive_limit(self, clients: int = 40, rounds: int = 20) -> Dict:
+        """後端延遲隨併發增加時，自適應上限收斂在延遲開始上升的位置，超出的請求以 429 拒絕"""
+        print("\n🔍 測試自適應併發限制...")
+        limiter = AdaptiveLimiter("test", initial=1, max_limit=64, max_queue=clients // 2, max_wait=1.0)
+        state = {"inflight": 0, "rejected": 0}
+
+        async def backend():
+            # 模擬 Ollama：超過 6 個併發後延遲線性上升
+            state["inflight"] += 1
+            try:
+                await asyncio.sleep(0.02 * max(1.0, state["inflight"] / 6))
+            finally:
+                state["inflight"] -= 1
+
+        async def client():
+            for _ in range(rounds):
+                try:
+                    async with limiter.slot():
+                        await backend()
+                except HTTPException as e:
+                    assert e.status_code == 429 and "Retry-After" in e.headers
+                    state["rejected"] += 1
+                    await asyncio.sleep(0.05)
+
+        await asyncio.gather(*[client() for _ in range(clients)])
+        stats = limiter.stats()
+        print(f"   收斂上限: {stats['limit']}, 拒絕: {state['rejected']}, 延遲: {stats['recent_latency_ms']} ms")
+
+        passed = 3 <= stats["limit"] <= 16
+        return {"test_name": "adaptive_limit", "limit": stats["limit"], "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 Ollama 多後端路由測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_least_outstanding(),
+            await self.test_ejection(),
+            await self.test_hedging(),
+            await self.test_adaptive_limit()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(OllamaPoolTester().run_all_tests())
@@ -0,0 +1,131 @@
+"""
+文檔質心篩選測試腳本
+驗證新增、更新與刪除後維護的質心索引與重新建立的一致，
+並量測不同篩選文檔數（M）相對於搜尋所有片段的召回率與耗時
+
+用法：
+    python tests/prefilter_test.py [--docs 2000] [--chunks 50] [--dim 128]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Dict
+
+import numpy as np
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstore import VectorStore
+from vectorstore.centroids import DocumentIndex
+from vectorstore.store import _normalize, search_snapshot
+
+PREFILTER_COUNTS = (5, 10, 20, 50, 100)
+
+
+def clustered_corpus(docs: int, chunks: int, dim: int, seed: int = 3):
+    """每個文檔的片段分布在各自的主題向量附近，主題之間部分重疊"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((docs // 4 + 1, dim)).astype(np.float32)
+    corpus = []
+    for n in range(docs):
+        center = topics[n % len(topics)] + 0.6 * rng.standard_normal(dim).astype(np.float32)
+        vectors = center + 1.5 * rng.standard_normal((chunks, dim)).astype(np.float32)
+        corpus.append((f"doc{n}", [f"文檔 {n} 片段 {i}" for i in range(chunks)], vectors))
+    return corpus, rng
+
+
+def build_store(corpus, prefilter: int = 0) -> VectorStore:
+    store = VectorStore(track_near_duplicates=False, prefilter=prefilter)
+    for doc_id, texts, vectors in corpus:
+        store.add_document(doc_id, doc_id, "\n".join(texts), texts, vectors.tolist())
+    return store
+
+
+class PrefilterTester:
+    """文檔質心篩選測試器"""
+
+    def __init__(self, docs: int, chunks: int, dim: int):
+        self.docs = docs
+        self.chunks = chunks
+        self.dim = dim
+        self.test_results: List[Dict] = []
+
+    def test_maintenance(self) -> Dict:
+        """新增、更新、刪除（含共用片段）後的質心索引與依片段重新建立的相同"""
+        print("\n🔍 測試質心索引維護...")
+        corpus, rng = clustered_corpus(40, 8, 16)
+        store = build_store(corpus)
+        shared = corpus[0][1][:3]
+        store.add_document("copy", "副本", "", shared + ["獨有片段"], [None] * 3 + [rng.standard_normal(16).tolist()])
+        store.update_document("doc1", "doc1", "", corpus[1][1][4:], [None] * 4)
+        for doc_id in ("doc0", "doc5", "doc9"):
+            store.delete_document(doc_id)
+        store.add_document("late", "延後", "", ["尚未嵌入"], [None], defer=True)
+
+        snapshot = store.snapshot()
+        rebuilt = DocumentIndex.build(snapshot.matrix, snapshot.chunks)
+        index = snapshot.doc_index
+        mismatched = [
+            doc_id for doc_id in rebuilt.doc_ids
+            if not np.array_equal(index.document_rows(doc_id), rebuilt.document_rows(doc_id))
+            or not np.allclose(index.centroids[index.doc_ids.index(doc_id)],
+                               rebuilt.centroids[rebuilt.doc_ids.index(doc_id)], atol=1e-6)
+        ]
+        print(f"   文檔數: {len(index)}（重建 {len(rebuilt)}）, 不一致: {mismatched}")
+        passed = (
+            sorted(index.doc_ids) == sorted(rebuilt.doc_ids) and not mismatched
+            and "late" not in index.doc_ids and len(index.document_rows("copy")) == 4
+        )
+        return {"test_name": "maintenance", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_recall(self, queries: int = 100, top_k: int = 10) -> Dict:
+        """各篩選文檔數相對於搜尋所有片段的召回率與單次搜尋耗時"""
+        print(f"\n⏱️  召回率（{self.docs} 篇 × {self.chunks} 個片段，{self.dim} 維，top_k={top_k}）...")
+        corpus, rng = clustered_corpus(self.docs, self.chunks, self.dim)
+        store = build_store(corpus)
+        snapshot = store.snapshot()
+        # 查詢為某個片段加上雜訊，模擬針對少數文檔的問題
+        probes = _normalize(snapshot.matrix[rng.integers(0, len(snapshot.chunks), queries)]
+                            + 0.1 * rng.standard_normal((queries, self.dim)).astype(np.float32))
+
+        def run(prefilter: int):
+            started = time.perf_counter()
+            results = [search_snapshot(snapshot, q, top_k, prefilter=prefilter, prefilter_min_chunks=0) for q in probes]
+            return results, (time.perf_counter() - started) * 1000 / queries
+
+        exact, exact_ms = run(0)
+        print(f"   搜尋所有片段: {exact_ms:.2f} ms")
+        recalls = {}
+        for prefilter in PREFILTER_COUNTS + (self.docs,):
+            results, ms = run(prefilter)
+            recalls[prefilter] = float(np.mean([
+                len({r["id"] for r in got} & {r["id"] for r in want}) / len(want) for got, want in zip(results, exact)
+            ]))
+            print(f"   M={prefilter}: 召回率 {recalls[prefilter]:.3f}, {ms:.2f} ms（{exact_ms / ms:.1f}x）")
+
+        passed = recalls[self.docs] == 1.0 and recalls[max(PREFILTER_COUNTS)] >= 0.9
+        return {"test_name": "recall", "recall": recalls, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 文檔質心篩選測試")
+        print("=" * 60)
+
+        self.test_results = [self.test_maintenance(), self.test_recall()]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="文檔質心篩選測試")
+    parser.add_argument("--docs", type=int, default=2000, help="文檔數")
+    parser.add_argument("--chunks", type=int, default=50, help="每個文檔的片段數")
+    parser.add_argument("--dim", type=int, default=128, help="向量維度")
+    args = parser.parse_args()
+    PrefilterTester(args.docs, args.chunks, args.dim).run_all_tests()
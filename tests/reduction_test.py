@@ -0,0 +1,146 @@
+"""
+降維粗搜尋測試腳本
+量測降維粗搜尋加完整向量重新計分相對於搜尋所有片段的召回率與耗時，
+並驗證背景擬合、擬合後新增與刪除片段時降維副本與矩陣保持對應
+
+用法：
+    python tests/reduction_test.py [--rows 200000] [--dim 768]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Dict
+
+import numpy as np
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstore import VectorStore
+from vectorstore.store import Snapshot, _normalize, search_snapshot
+from vectorstore.reduction import ReducedIndex
+
+SETTINGS = (("pca", 64), ("pca", 128), ("random", 128))
+
+
+def embedding_like(rows: int, dim: int, seed: int = 5, latent: int = 48) -> np.ndarray:
+    """模擬嵌入向量：大部分變異集中在少數方向，再加上各向同性的雜訊"""
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((latent, dim)).astype(np.float32)
+    scales = np.linspace(3.0, 0.5, latent, dtype=np.float32)
+    vectors = (rng.standard_normal((rows, latent)).astype(np.float32) * scales) @ basis
+    vectors += 2.0 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return _normalize(vectors)
+
+
+def add_rows(store: VectorStore, vectors: np.ndarray, start: int, per_doc: int = 100):
+    for offset in range(0, len(vectors), per_doc):
+        block = vectors[offset:offset + per_doc]
+        doc_id = f"doc{start + offset}"
+        texts = [f"{doc_id} 片段 {i}" for i in range(len(block))]
+        store.add_document(doc_id, doc_id, "", texts, block.tolist())
+
+
+def aligned(snapshot: Snapshot) -> bool:
+    """降維副本的每一列都對應矩陣同一列的投影"""
+    reduced = snapshot.reduced
+    expected = snapshot.matrix[:reduced.rows] @ reduced.components - reduced.mean @ reduced.components
+    return np.allclose(reduced.matrix, expected, atol=1e-4)
+
+
+class ReductionTester:
+    """降維粗搜尋測試器"""
+
+    def __init__(self, rows: int, dim: int):
+        self.rows = rows
+        self.dim = dim
+        self.test_results: List[Dict] = []
+
+    def test_recall(self, queries: int = 50, top_k: int = 10, candidates: int = 200) -> Dict:
+        """各降維設定相對於搜尋所有片段的 recall@k 與單次搜尋耗時"""
+        print(f"\n⏱️  召回率（{self.rows} 個 {self.dim} 維向量，候選 {candidates}，top_k={top_k}）...")
+        matrix = embedding_like(self.rows, self.dim)
+        chunks = [{"id": f"chunk_{i}"} for i in range(self.rows)]
+        rng = np.random.default_rng(1)
+        probes = _normalize(matrix[rng.integers(0, self.rows, queries)]
+                            + 0.02 * rng.standard_normal((queries, self.dim)).astype(np.float32))
+
+        def run(snapshot: Snapshot, rerank: int):
+            search_snapshot(snapshot, probes[0], top_k, rerank_candidates=rerank)
+            started = time.perf_counter()
+            results = [search_snapshot(snapshot, q, top_k, rerank_candidates=rerank) for q in probes]
+            return results, (time.perf_counter() - started) * 1000 / queries
+
+        exact, exact_ms = run(Snapshot(0, {}, chunks, matrix), 0)
+        print(f"   搜尋所有片段: {exact_ms:.2f} ms")
+        recalls = {}
+        for method, dims in SETTINGS:
+            started = time.perf_counter()
+            reduced = ReducedIndex.fit(matrix, dims, method)
+            fit_ms = (time.perf_counter() - started) * 1000
+            results, ms = run(Snapshot(0, {}, chunks, matrix, reduced=reduced), candidates)
+            recall = float(np.mean([
+                len({r["id"] for r in got} & {r["id"] for r in want}) / top_k for got, want in zip(results, exact)
+            ]))
+            recalls[f"{method}-{dims}"] = recall
+            print(f"   {method} {dims} 維: 召回率 {recall:.3f}, {ms:.2f} ms（{exact_ms / ms:.1f}x）, 擬合 {fit_ms:.0f} ms")
+
+        passed = recalls["pca-128"] >= 0.95
+        return {"test_name": "recall", "recall": recalls, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_background_refit(self) -> Dict:
+        """片段數足夠後在背景擬合；新增的片段以完整向量搜尋，累積足夠後重新擬合；刪除後仍保持對應"""
+        print("\n🔍 測試背景擬合...")
+        vectors = embedding_like(6000, 96, seed=9)
+        store = VectorStore(track_near_duplicates=False, reduced_dims=16, rerank_candidates=50,
+                            reduction_min_chunks=2000, refit_growth=0.2)
+        add_rows(store, vectors[:1000], 0)
+        before = store.snapshot().reduced
+        add_rows(store, vectors[1000:2500], 1000)
+        store._refit_future.result()
+        first = store.snapshot().reduced.rows
+
+        # 尚未達到重新擬合門檻的新片段：仍可以完整向量找到
+        add_rows(store, vectors[2500:2700], 2500)
+        tail_hit = store.search(vectors[2650].tolist(), 1)[0]["id"] == "doc2600_50"
+        pending_rows = store.snapshot().reduced.rows
+
+        add_rows(store, vectors[2700:4000], 2700)
+        store._refit_future.result()
+        second = store.snapshot().reduced.rows
+
+        # 擬合的是開始擬合時的快照，之後新增的列留待下次
+        store.delete_document("doc100")
+        store.delete_document("doc3900")
+        snapshot = store.snapshot()
+        expected = second - 100 - (100 if second > 3900 else 0)
+        print(f"   擬合前: {before}, 第一次擬合列數: {first}, 新增後: {pending_rows}, 重新擬合: {second}, "
+              f"刪除後: {snapshot.reduced.rows} / {len(snapshot.chunks)}")
+        passed = (
+            before is None and first >= 2000 and tail_hit and pending_rows < 2700
+            and second > first and snapshot.reduced.rows == expected and len(snapshot.chunks) == 3800
+            and aligned(snapshot)
+        )
+        return {"test_name": "background_refit", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 降維粗搜尋測試")
+        print("=" * 60)
+
+        self.test_results = [self.test_background_refit(), self.test_recall()]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="降維粗搜尋測試")
+    parser.add_argument("--rows", type=int, default=200000, help="向量數")
+    parser.add_argument("--dim", type=int, default=768, help="向量維度")
+    args = parser.parse_args()
+    ReductionTester(args.rows, args.dim).run_all_tests()
@@ -0,0 +1,153 @@
+"""
+LLM 排程測試腳本
+以模擬的生成耗時驗證：大量背景摘要請求（/api/url/summary）湧入時互動查詢的等待時間 p99 仍有上限、
+各端點依權重分配名額、同一端點內各用戶端輪流取得名額，以及請求期限先到時返回 504
+
+用法：
+    python tests/scheduler_test.py [--service-ms 20] [--background 60]
+"""
+import argparse
+import asyncio
+import time
+from typing import List, Dict, Optional
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+from llm.scheduler import LLMScheduler, _percentile
+from utils.deadline import current_deadline
+
+INTERACTIVE = "/api/rag/query"
+BACKGROUND = "/api/url/summary"
+WEIGHTS = {INTERACTIVE: 8, BACKGROUND: 1}
+
+
+class SchedulerTester:
+    """LLM 排程測試器"""
+
+    def __init__(self, service_ms: float, background: int):
+        self.service = service_ms / 1000
+        self.background = background
+        self.test_results: List[Dict] = []
+
+    async def _job(self, scheduler: LLMScheduler, endpoint: str, client_id: str,
+                   order: Optional[List] = None, service: Optional[float] = None) -> float:
+        """排隊取得名額後模擬一次生成，返回等待秒數"""
+        started = time.monotonic()
+        async with scheduler.slot(endpoint, client_id):
+            waited = time.monotonic() - started
+            if order is not None:
+                order.append((endpoint, client_id))
+            await asyncio.sleep(self.service if service is None else service)
+        return waited
+
+    async def _interactive_waits(self, fifo: bool, interactive: int = 20) -> List[float]:
+        """
+        背景請求一次湧入後，每隔一段時間送出互動查詢，返回互動查詢的等待時間
+
+        fifo 為 True 時互動查詢與背景請求共用同一個端點與用戶端，相當於沒有排程的單一佇列。
+        """
+        scheduler = LLMScheduler(max_concurrency=2, weights=WEIGHTS, max_queue=1000, max_wait=60)
+        flood = [asyncio.create_task(self._job(scheduler, BACKGROUND, "batch")) for _ in range(self.background)]
+        queries = []
+        for n in range(interactive):
+            await asyncio.sleep(self.service * 1.5)
+            endpoint, client_id = (BACKGROUND, "batch") if fifo else (INTERACTIVE, f"user{n % 4}")
+            queries.append(asyncio.create_task(self._job(scheduler, endpoint, client_id)))
+        waits = await asyncio.gather(*queries)
+        await asyncio.gather(*flood)
+        return waits
+
+    async def test_interactive_latency(self) -> Dict:
+        """背景請求佔滿佇列時，互動查詢的等待 p99 不超過約一次生成的耗時；單一佇列時則排在所有背景請求之後"""
+        print(f"\n🔍 測試背景負載下的互動延遲（{self.background} 個背景請求，每次生成 {self.service * 1000:.0f} ms）...")
+        weighted = await self._interactive_waits(fifo=False)
+        fifo = await self._interactive_waits(fifo=True)
+        weighted_p99 = _percentile(weighted, 99) * 1000
+        fifo_p99 = _percentile(fifo, 99) * 1000
+        print(f"   互動等待 p99: 排程 {weighted_p99:.1f} ms, 單一佇列 {fifo_p99:.1f} ms")
+        passed = weighted_p99 <= self.service * 1000 * 3 and weighted_p99 * 3 < fifo_p99
+        return {"test_name": "interactive_latency", "weighted_p99_ms": weighted_p99, "fifo_p99_ms": fifo_p99,
+                "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def _dispatch_order(self, requests: List[tuple]) -> List[tuple]:
+        """在名額被佔用時排入所有請求，釋放後返回出隊順序（併發上限 1）"""
+        scheduler = LLMScheduler(max_concurrency=1, weights=WEIGHTS, max_queue=1000, max_wait=60)
+        order: List[tuple] = []
+        await scheduler.acquire("hold", "hold")
+        tasks = [asyncio.create_task(self._job(scheduler, e, c, order, service=0)) for e, c in requests]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    async def test_fairness(self) -> Dict:
+        """佇列壅塞時各端點依權重取得名額；同一端點內晚到的用戶端不必等先到者的請求全部完成"""
+        print("\n🔍 測試權重與用戶端公平性...")
+        order = await self._dispatch_order(
+            [(BACKGROUND, "batch")] * 90 + [(INTERACTIVE, "user")] * 90
+        )
+        first = order[:45]
+        interactive_share = sum(e == INTERACTIVE for e, _ in first) / len(first)
+
+        order = await self._dispatch_order(
+            [(INTERACTIVE, "heavy")] * 30 + [(INTERACTIVE, "light")] * 10
+        )
+        light_done = max(i for i, (_, c) in enumerate(order) if c == "light") + 1
+        print(f"   前 45 個名額中互動查詢佔比: {interactive_share:.2f}（權重 8:1 預期 0.89）, "
+              f"晚到的用戶端 10 個請求在第 {light_done} 個名額前完成")
+        passed = abs(interactive_share - 8 / 9) < 0.05 and light_done <= 20
+        return {"test_name": "fairness", "interactive_share": interactive_share, "light_done": light_done,
+                "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_deadline_status(self) -> Dict:
+        """排隊等候超過上限返回 429；請求期限先到則返回 504，且不佔用名額"""
+        print("\n🔍 測試排隊逾時的狀態碼...")
+        scheduler = LLMScheduler(max_concurrency=1, weights=WEIGHTS, max_wait=0.05)
+        await scheduler.acquire(INTERACTIVE, "hold")
+        statuses = []
+        for deadline in (None, 0.05, -1):
+            scheduler.max_wait = 0.05 if deadline is None else 5
+            token = current_deadline.set(None if deadline is None else time.monotonic() + deadline)
+            try:
+                await scheduler.acquire(INTERACTIVE, "user")
+                statuses.append(200)
+            except HTTPException as e:
+                statuses.append(e.status_code)
+            finally:
+                current_deadline.reset(token)
+        scheduler.release()
+        stats = scheduler.stats()
+        print(f"   等候上限 / 請求期限 / 已過期: {statuses}, 統計: active={stats['active']}, rejected={stats['rejected']}")
+        passed = statuses == [429, 504, 504] and stats["active"] == 0 and stats["rejected"] == 1 \
+            and stats["endpoints"][INTERACTIVE]["queued"] == 0
+        return {"test_name": "deadline_status", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 LLM 排程測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_interactive_latency(),
+            await self.test_fairness(),
+            await self.test_deadline_status()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 排程測試")
+    parser.add_argument("--service-ms", type=float, default=20, help="模擬每次生成的耗時（毫秒）")
+    parser.add_argument("--background", type=int, default=60, help="一次湧入的背景請求數")
+    args = parser.parse_args()
+    asyncio.run(SchedulerTester(args.service_ms, args.background).run_all_tests())
@@ -0,0 +1,102 @@
+"""
+分片向量搜尋測試腳本
+驗證分片平行掃描與單一掃描的結果完全一致，並量測不同分片數的搜尋耗時
+
+用法：
+    python tests/shard_search_test.py [--rows 500000] [--dim 128]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+# 每個分片單執行緒計算，加速比才反映分片數（須在載入 NumPy 前設定）
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+import numpy as np
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstore.store import _normalize, _top_k
+
+SHARD_COUNTS = (1, 2, 4, 8)
+
+
+def random_index(rows: int, dim: int, seed: int = 7):
+    """建立隨機的正規化矩陣與對應片段；部分向量重複，以驗證同分時的排序"""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dim), dtype=np.float32)
+    matrix[rows // 2::rows // 7] = matrix[:len(matrix[rows // 2::rows // 7])]
+    chunks = [{"id": f"chunk_{i}"} for i in range(rows)]
+    return _normalize(matrix), chunks, rng
+
+
+class ShardSearchTester:
+    """分片搜尋測試器"""
+
+    def __init__(self, rows: int, dim: int):
+        self.rows = rows
+        self.dim = dim
+        self.pool = ThreadPoolExecutor(max_workers=max(SHARD_COUNTS))
+        self.test_results: List[Dict] = []
+
+    def test_parity(self, queries: int = 20, top_k: int = 10) -> Dict:
+        """各分片數的結果與分數與單一掃描完全相同（含跨分片的同分向量）"""
+        print("\n🔍 測試分片搜尋一致性...")
+        matrix, chunks, rng = random_index(20000, 32)
+        # 以重複的向量作為查詢，前幾名必定出現跨分片的同分
+        probes = [matrix[i] for i in range(queries // 2)] + [
+            _normalize(rng.standard_normal((1, 32), dtype=np.float32))[0] for _ in range(queries - queries // 2)
+        ]
+
+        mismatches = 0
+        for query in probes:
+            expected = _top_k(matrix, chunks, query, top_k)
+            for shards in SHARD_COUNTS[1:]:
+                results = _top_k(matrix, chunks, query, top_k, shards, self.pool, min_rows=1000)
+                if [(r["id"], r["score"]) for r in results] != [(r["id"], r["score"]) for r in expected]:
+                    mismatches += 1
+        print(f"   查詢數: {queries}, 分片數: {SHARD_COUNTS[1:]}, 不一致: {mismatches}")
+        return {"test_name": "parity", "mismatches": mismatches, "status": "✅ PASS" if not mismatches else "❌ FAIL"}
+
+    def benchmark(self, repeats: int = 10) -> Dict:
+        """量測各分片數的單次搜尋耗時與加速比"""
+        print(f"\n⏱️  分片搜尋基準（{self.rows} 個 {self.dim} 維向量，CPU 核心數 {os.cpu_count()}）...")
+        matrix, chunks, rng = random_index(self.rows, self.dim)
+        query = _normalize(rng.standard_normal((1, self.dim), dtype=np.float32))[0]
+
+        timings = {}
+        for shards in SHARD_COUNTS:
+            _top_k(matrix, chunks, query, 10, shards, self.pool, min_rows=1)
+            started = time.perf_counter()
+            for _ in range(repeats):
+                _top_k(matrix, chunks, query, 10, shards, self.pool, min_rows=1)
+            timings[shards] = (time.perf_counter() - started) * 1000 / repeats
+            print(f"   {shards} 個分片: {timings[shards]:.2f} ms（加速 {timings[1] / timings[shards]:.2f}x）")
+        return {"test_name": "benchmark", "ms": {k: round(v, 2) for k, v in timings.items()}, "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 分片向量搜尋測試")
+        print("=" * 60)
+
+        self.test_results = [self.test_parity(), self.benchmark()]
+        self.pool.shutdown()
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分片向量搜尋測試")
+    parser.add_argument("--rows", type=int, default=500000, help="基準測試的向量數")
+    parser.add_argument("--dim", type=int, default=128, help="向量維度")
+    args = parser.parse_args()
+    ShardSearchTester(args.rows, args.dim).run_all_tests()
@@ -0,0 +1,159 @@
+"""
+知識庫快照測試腳本
+驗證寫入（新增、刪除）與搜尋同時進行時，搜尋結果的片段與分數始終一致，
+並量測大量寫入期間的搜尋延遲
+"""
+import random
+import threading
+import time
+from typing import List, Dict
+import sys
+import os
+
+import numpy as np
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstore import VectorStore
+
+DIM = 64
+
+
+def doc_vector(n: int) -> np.ndarray:
+    """每個文檔使用固定的向量，可由文檔編號重建"""
+    return np.random.default_rng(n).standard_normal(DIM, dtype=np.float32)
+
+
+def add_doc(store: VectorStore, n: int, chunks: int = 20):
+    vector = doc_vector(n)
+    store.add_document(f"doc{n}", f"文檔 {n}", "內容", [f"doc{n} 片段 {i}" for i in range(chunks)], np.tile(vector, (chunks, 1)))
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class SnapshotTester:
+    """快照測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    def _writer(self, store: VectorStore, stop: threading.Event, start: int):
+        """持續新增文檔並刪除較舊的文檔"""
+        rng = random.Random(1)
+        n = start
+        while not stop.is_set():
+            add_doc(store, n)
+            if rng.random() < 0.5:
+                store.delete_document(f"doc{rng.randrange(n)}")
+            n += 1
+
+    def test_consistency(self, seconds: float = 2.0, readers: int = 3) -> Dict:
+        """以某文檔的向量查詢時，分數為 1 的片段必定屬於該文檔（矩陣與片段來自同一版本）"""
+        print("\n🔍 測試寫入期間的搜尋一致性...")
+        store = VectorStore()
+        for n in range(200):
+            add_doc(store, n)
+
+        stop = threading.Event()
+        errors = []
+        searches = [0]
+
+        def reader(seed: int):
+            rng = random.Random(seed)
+            while not stop.is_set():
+                n = rng.randrange(200)
+                for result in store.search(doc_vector(n).tolist(), 5):
+                    if (result["score"] > 0.999) != (result["document_id"] == f"doc{n}"):
+                        errors.append((n, result["document_id"], result["score"]))
+                searches[0] += 1
+
+        threads = [threading.Thread(target=self._writer, args=(store, stop, 200))]
+        threads += [threading.Thread(target=reader, args=(seed,)) for seed in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        print(f"   搜尋次數: {searches[0]}, 最終版本: {store.version}, 不一致: {len(errors)}")
+        passed = not errors and searches[0] > 0
+        return {"test_name": "consistency", "searches": searches[0], "errors": len(errors),
+                "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def test_snapshot_isolation(self) -> Dict:
+        """已取得的快照不受之後的新增、刪除與清空影響"""
+        print("\n🔍 測試快照隔離...")
+        store = VectorStore()
+        for n in range(10):
+            add_doc(store, n, chunks=3)
+        snapshot = store.snapshot()
+        before = snapshot.matrix.copy()
+
+        for n in range(10, 2000):
+            add_doc(store, n, chunks=3)
+        store.delete_document("doc0")
+        store.clear()
+
+        passed = (
+            len(snapshot.chunks) == 30 and len(snapshot.documents) == 10
+            and np.array_equal(snapshot.matrix, before) and not snapshot.matrix.flags.writeable
+            and store.count_chunks() == 0
+        )
+        print(f"   快照片段數: {len(snapshot.chunks)}, 向量未改變: {np.array_equal(snapshot.matrix, before)}")
+        return {"test_name": "snapshot_isolation", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    def benchmark_latency(self, documents: int = 2000, seconds: float = 2.0) -> Dict:
+        """比較無寫入與大量寫入期間的搜尋延遲"""
+        print("\n⏱️  寫入期間的搜尋延遲...")
+        store = VectorStore()
+        for n in range(documents):
+            add_doc(store, n)
+        query = doc_vector(0).tolist()
+
+        def measure() -> List[float]:
+            samples = []
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                store.search(query, 5)
+                samples.append((time.perf_counter() - started) * 1000)
+            return samples
+
+        idle = measure()
+        stop = threading.Event()
+        writer = threading.Thread(target=self._writer, args=(store, stop, documents))
+        writer.start()
+        busy = measure()
+        stop.set()
+        writer.join()
+
+        print(f"   片段數: {documents * 20}, 無寫入 p50/p99: {_percentile(idle, 50):.2f}/{_percentile(idle, 99):.2f} ms")
+        print(f"   寫入期間 p50/p99: {_percentile(busy, 50):.2f}/{_percentile(busy, 99):.2f} ms（版本 {store.version}）")
+        return {"test_name": "benchmark_latency", "idle_p99_ms": round(_percentile(idle, 99), 2),
+                "busy_p99_ms": round(_percentile(busy, 99), 2), "status": "ℹ️  INFO"}
+
+    def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 知識庫快照測試")
+        print("=" * 60)
+
+        self.test_results = [
+            self.test_consistency(),
+            self.test_snapshot_isolation(),
+            self.benchmark_latency()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    SnapshotTester().run_all_tests()
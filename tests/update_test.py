@@ -0,0 +1,243 @@
+"""
+文檔更新測試腳本
+驗證更新文檔時只為修改過的片段生成嵌入向量，更新後的搜尋結果與重新建立的知識庫一致，
+以及更新後文檔立即被刪除時返回 404
+"""
+import asyncio
+import functools
+import random
+from typing import List, Dict
+import sys
+import os
+
+from fastapi import HTTPException
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routes.documents as documents_route
+from ingest import split_text, embed_new_chunks, embed_and_store
+from models import DocumentUpdateRequest
+from vectorstore import VectorStore, MissingEmbeddingError
+from tests.helpers import fake_vector
+
+DIM = 32
+CHARS = "的一是在不了有和人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行學法所民得經"
+
+
+class RacingStore(VectorStore):
+    """更新後立即刪除文檔，模擬更新返回前另一個請求刪除了它"""
+
+    def update_document(self, doc_id, *args, **kwargs):
+        changes = super().update_document(doc_id, *args, **kwargs)
+        self.delete_document(doc_id)
+        return changes
+
+
+class CountingEmbedder:
+    """記錄實際送去生成嵌入向量的文字數"""
+
+    def __init__(self):
+        self.texts = 0
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        self.texts += len(texts)
+        return [fake_vector(t, DIM) for t in texts]
+
+
+def paragraph(rng: random.Random) -> str:
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(300, 450))) + "。"
+
+
+class UpdateTester:
+    """文檔更新測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+
+    async def _write(self, store: VectorStore, embed: CountingEmbedder, doc_id: str, content: str, update: bool = False):
+        chunks = split_text(content)
+        embeddings = await embed_new_chunks(store, chunks, embed)
+        if update:
+            return store.update_document(doc_id, f"{doc_id} v2", content, chunks, embeddings)
+        store.add_document(doc_id, doc_id, content, chunks, embeddings)
+
+    async def test_incremental(self) -> Dict:
+        """修改一個段落只重新生成一個片段的向量，文檔 ID 與建立時間不變"""
+        print("\n🔍 測試增量更新...")
+        rng = random.Random(2)
+        store = VectorStore()
+        embed = CountingEmbedder()
+        paragraphs = [paragraph(rng) for _ in range(30)]
+        await self._write(store, embed, "doc", "\n\n".join(paragraphs))
+        created_at = store.documents["doc"]["created_at"]
+        before = embed.texts
+
+        old = paragraphs[10]
+        paragraphs[10] = paragraph(rng)
+        changes = await self._write(store, embed, "doc", "\n\n".join(paragraphs), update=True)
+        embedded = embed.texts - before
+
+        contents = {c["content"] for c in store.chunks}
+        doc = store.documents["doc"]
+        print(f"   片段數: {doc['chunks_count']}, 重新生成: {embedded}, 變化: {changes}")
+        passed = (
+            embedded == 1 and changes == {"kept": 29, "added": 1, "removed": 1}
+            and old not in contents and paragraphs[10] in contents and store.count_chunks() == 30
+            and doc["created_at"] == created_at and doc["title"] == "doc v2" and "updated_at" in doc
+            and all(c["title"] == "doc v2" for c in store.chunks)
+        )
+        return {"test_name": "incremental", "embedded": embedded, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_shared_chunks(self) -> Dict:
+        """更新一份文檔不影響其他文檔仍引用的共用片段"""
+        print("\n🔍 測試共用片段的更新...")
+        rng = random.Random(3)
+        store = VectorStore()
+        embed = CountingEmbedder()
+        shared = paragraph(rng)
+        await self._write(store, embed, "a", "\n\n".join([shared, paragraph(rng)]))
+        await self._write(store, embed, "b", "\n\n".join([shared, paragraph(rng)]))
+
+        # a 移除共用段落後，b 仍可搜尋到，且片段來源改為 b
+        await self._write(store, embed, "a", paragraph(rng), update=True)
+        result = store.search(fake_vector(shared, DIM), 1)[0]
+        passed = result["content"] == shared and result["document_id"] == "b" and result["document_ids"] == ["b"]
+        print(f"   共用片段來源: {result['document_id']}, 引用: {result['document_ids']}")
+        return {"test_name": "shared_chunks", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_rebuild_parity(self, rounds: int = 20, queries: int = 10) -> Dict:
+        """多次隨機更新後，搜尋結果與用最終內容重新建立的知識庫一致"""
+        print("\n🔍 測試更新後與重建的一致性...")
+        rng = random.Random(4)
+        store = VectorStore()
+        embed = CountingEmbedder()
+        docs = {f"doc{n}": [paragraph(rng) for _ in range(rng.randint(2, 8))] for n in range(10)}
+        for doc_id, paragraphs in docs.items():
+            await self._write(store, embed, doc_id, "\n\n".join(paragraphs))
+
+        for _ in range(rounds):
+            doc_id = rng.choice(list(docs))
+            paragraphs = docs[doc_id]
+            action = rng.random()
+            if action < 0.4:
+                paragraphs[rng.randrange(len(paragraphs))] = paragraph(rng)
+            elif action < 0.7:
+                paragraphs.insert(rng.randrange(len(paragraphs) + 1), paragraph(rng))
+            elif len(paragraphs) > 1:
+                paragraphs.pop(rng.randrange(len(paragraphs)))
+            else:
+                # 改成與其他文檔相同的段落
+                paragraphs.append(rng.choice(docs[rng.choice(list(docs))]))
+            await self._write(store, embed, doc_id, "\n\n".join(paragraphs), update=True)
+
+        rebuilt = VectorStore()
+        for doc_id, paragraphs in docs.items():
+            await self._write(rebuilt, CountingEmbedder(), doc_id, "\n\n".join(paragraphs))
+
+        mismatches = 0
+        for _ in range(queries):
+            query = [rng.gauss(0, 1) for _ in range(DIM)]
+            got = [(r["content"], round(r["score"], 5)) for r in store.search(query, 5)]
+            expected = [(r["content"], round(r["score"], 5)) for r in rebuilt.search(query, 5)]
+            if got != expected:
+                mismatches += 1
+        rows_match = store.count_chunks() == rebuilt.count_chunks() == store.matrix.shape[0]
+        print(f"   片段數: {store.count_chunks()} / 重建 {rebuilt.count_chunks()}, 不一致: {mismatches}")
+        passed = not mismatches and rows_match
+        return {"test_name": "rebuild_parity", "mismatches": mismatches, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_concurrent_delete(self) -> Dict:
+        """生成嵌入期間沿用的片段被刪除時，補上向量後重試；重試時再次被刪除則拋出 MissingEmbeddingError"""
+        print("\n🔍 測試生成嵌入期間的並行刪除...")
+        rng = random.Random(5)
+        store = VectorStore()
+        embed = CountingEmbedder()
+        shared = paragraph(rng)
+        for doc_id in ("a", "b", "c"):
+            await self._write(store, embed, doc_id, "\n\n".join([shared, paragraph(rng)]))
+        await self._write(store, embed, "d", paragraph(rng))
+        other = paragraph(rng)
+        await self._write(store, embed, "x", other)
+
+        async def deleting(texts: List[str], victims: List[List[str]]) -> List[List[float]]:
+            # 模擬另一個請求在嵌入生成期間刪除引用共用片段的文檔（每次呼叫刪除一組）
+            for doc_id in (victims.pop(0) if victims else []):
+                store.delete_document(doc_id)
+            return await embed(texts)
+
+        content = "\n\n".join([shared, paragraph(rng)])
+        chunks = split_text(content)
+        victims = [["a", "b", "c"]]
+        await embed_and_store(store, chunks, lambda e: store.add_document("new", "new", content, chunks, e),
+                              lambda texts: deleting(texts, victims))
+        added = store.search(fake_vector(shared, DIM), 1)[0]
+
+        updated = "\n\n".join([paragraph(rng), shared])
+        chunks = split_text(updated)
+        victims = [["new"]]
+        _, changes = await embed_and_store(store, chunks, lambda e: store.update_document("d", "d", updated, chunks, e),
+                                           lambda texts: deleting(texts, victims))
+        retried = store.search(fake_vector(shared, DIM), 1)[0]
+
+        # 重試生成嵌入期間另一個沿用的片段也被刪除
+        chunks = split_text("\n\n".join([shared, other, paragraph(rng)]))
+        victims = [["d"], ["x"]]
+        try:
+            await embed_and_store(store, chunks, lambda e: store.add_document("late", "late", "", chunks, e),
+                                  lambda texts: deleting(texts, victims))
+            conflict = False
+        except MissingEmbeddingError:
+            conflict = "late" not in store.documents
+
+        print(f"   新增後共用片段來源: {added['document_ids']}, 更新後: {retried['document_ids']}, 再次刪除時拋出: {conflict}")
+        passed = (
+            added["content"] == shared and added["document_ids"] == ["new"]
+            and retried["content"] == shared and retried["document_ids"] == ["d"] and changes["added"] >= 1
+            and conflict and store.count_chunks() == store.matrix.shape[0]
+        )
+        return {"test_name": "concurrent_delete", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_update_race(self) -> Dict:
+        """更新寫入後到返回前文檔被刪除時，PUT 返回 404 而不是 500"""
+        print("\n🔍 測試更新後的並行刪除...")
+        rng = random.Random(6)
+        store = RacingStore()
+        embed = CountingEmbedder()
+        await self._write(store, embed, "d", paragraph(rng))
+        original = (documents_route.vector_store, documents_route.embed_and_store)
+        documents_route.vector_store = store
+        documents_route.embed_and_store = functools.partial(embed_and_store, embed=embed)
+        try:
+            await documents_route.update_document("d", DocumentUpdateRequest(content=paragraph(rng)))
+            status = 200
+        except HTTPException as e:
+            status = e.status_code
+        finally:
+            documents_route.vector_store, documents_route.embed_and_store = original
+        print(f"   狀態碼: {status}, 知識庫文檔數: {store.count_documents()}")
+        passed = status == 404 and store.count_documents() == 0
+        return {"test_name": "update_race", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 文檔更新測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_incremental(),
+            await self.test_shared_chunks(),
+            await self.test_rebuild_parity(),
+            await self.test_concurrent_delete(),
+            await self.test_update_race()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(UpdateTester().run_all_tests())
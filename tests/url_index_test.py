@@ -0,0 +1,117 @@
+"""
+網頁索引快取測試腳本
+以替換的抓取與嵌入函數驗證同一網址只建立一次索引、內容未變時沿用嵌入向量，
+以及抓取或嵌入失敗後不保留該網址的鎖
+"""
+import asyncio
+import random
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+import services.url_index as url_index
+from services.url_index import URLIndexCache
+
+
+class FakeSite:
+    """模擬網頁抓取與嵌入生成，記錄呼叫次數"""
+
+    def __init__(self):
+        self.pages: Dict[str, str] = {}
+        self.fetches = 0
+        self.embedded = 0
+        self.delay = 0.0
+
+    async def fetch(self, url: str) -> Dict[str, str]:
+        self.fetches += 1
+        await asyncio.sleep(self.delay)
+        if url not in self.pages:
+            raise HTTPException(status_code=502, detail=f"無法抓取網頁: {url}")
+        return {"title": url, "content": self.pages[url]}
+
+    async def embed(self, store, chunks: List[str]) -> List[List[float]]:
+        self.embedded += len(chunks)
+        rng = random.Random(len(chunks))
+        return [[rng.random() for _ in range(8)] for _ in chunks]
+
+
+class URLIndexTester:
+    """網頁索引快取測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+        self.site = FakeSite()
+        url_index.fetch_webpage_content = self.site.fetch
+        url_index.embed_new_chunks = self.site.embed
+
+    async def test_single_build(self) -> Dict:
+        """同時查詢同一網址只抓取一次；過期後內容未變則不重新嵌入"""
+        print("\n🔍 測試同一網址只建立一次索引...")
+        cache = URLIndexCache(ttl=60)
+        self.site.pages["http://a.test"] = "第一段內容。" * 50
+        self.site.delay = 0.05
+        fetches, embedded = self.site.fetches, self.site.embedded
+        pages = await asyncio.gather(*(cache.get("http://a.test") for _ in range(5)))
+        concurrent_fetches = self.site.fetches - fetches
+        first_embedded = self.site.embedded - embedded
+
+        cache.ttl = 0
+        again = await cache.get("http://a.test")
+        print(f"   並行查詢抓取次數: {concurrent_fetches}, 過期後重新嵌入的片段數: "
+              f"{self.site.embedded - embedded - first_embedded}")
+        passed = (
+            concurrent_fetches == 1 and all(p is pages[0] for p in pages) and first_embedded > 0
+            and again is pages[0] and self.site.embedded - embedded == first_embedded
+        )
+        return {"test_name": "single_build", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_failure_releases_lock(self) -> Dict:
+        """抓取失敗的網址不留下鎖；有其他請求等待時保留鎖直到最後一個請求結束"""
+        print("\n🔍 測試失敗後釋放鎖...")
+        cache = URLIndexCache()
+        self.site.delay = 0.02
+        errors = 0
+        for n in range(100):
+            try:
+                await cache.get(f"http://missing.test/{n}")
+            except HTTPException:
+                errors += 1
+        after_sequential = len(cache._locks)
+
+        results = await asyncio.gather(*(cache.get("http://missing.test/shared") for _ in range(3)),
+                                       return_exceptions=True)
+        shared_fetches = self.site.fetches
+        self.site.pages["http://b.test"] = "第二段內容。" * 50
+        await cache.get("http://b.test")
+        print(f"   失敗 {errors} 次後的鎖數: {after_sequential}, 並行失敗後的鎖: {sorted(cache._locks)}")
+        passed = (
+            errors == 100 and after_sequential == 0
+            and all(isinstance(r, HTTPException) for r in results) and shared_fetches > 0
+            and list(cache._locks) == ["http://b.test"] and not cache._users
+        )
+        return {"test_name": "failure_releases_lock", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 網頁索引快取測試")
+        print("=" * 60)
+
+        self.test_results = [
+            await self.test_single_build(),
+            await self.test_failure_releases_lock()
+        ]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(URLIndexTester().run_all_tests())
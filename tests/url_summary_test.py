@@ -0,0 +1,134 @@
+"""
+多網址摘要測試腳本
+在本機啟動兩個網站並以模擬的摘要函數驗證：多個網址同時抓取與摘要、同一網站的並行抓取數不超過上限、
+彙整格式維持原樣，以及 NDJSON 串流在每個網址完成時立即輸出結果
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import List, Dict
+import sys
+import os
+
+# 添加項目根目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routes.url as url_routes
+import services.url_service as url_service
+from config import URL_FETCH_PER_HOST
+from models import URLSummaryRequest
+from services.fetch_cache import FetchCache
+from tests.helpers import QuietHandler, serve, url_of
+
+SUMMARY_DELAY = 0.1
+
+
+def page(path: str) -> bytes:
+    return (
+        f"<html><head><title>{path}</title></head><body><article><h1>{path}</h1>"
+        "<p>" + "這是用來測試多網址摘要的段落內容。" * 10 + "</p></article></body></html>"
+    ).encode("utf-8")
+
+
+def start_site(delay: float) -> ThreadingHTTPServer:
+    """
+    啟動測試網站，/missing 返回 404，/slow 額外延遲
+
+    Returns:
+        HTTP 服務（peak 屬性記錄同時處理的最大請求數）
+    """
+    class Handler(QuietHandler):
+        def do_GET(self):
+            with self.server.lock:
+                self.server.active += 1
+                self.server.peak = max(self.server.peak, self.server.active)
+            try:
+                time.sleep(delay * (5 if self.path.startswith("/slow") else 1))
+                if self.path.startswith("/missing"):
+                    self.send_error(404)
+                    return
+                body = page(self.path)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with self.server.lock:
+                    self.server.active -= 1
+
+    return serve(Handler, lock=threading.Lock(), active=0, peak=0)
+
+
+class URLSummaryTester:
+    """多網址摘要測試器"""
+
+    def __init__(self):
+        self.test_results: List[Dict] = []
+        url_service.fetch_cache = FetchCache(cache_dir="")
+        url_routes.generate_summary = self._summarize
+
+    async def _summarize(self, content: str, max_length: int = 200, language: str = "zh-TW") -> str:
+        await asyncio.sleep(SUMMARY_DELAY)
+        return content[:20]
+
+    async def test_concurrency(self, per_site: int = 6, delay: float = 0.1) -> Dict:
+        """兩個網站的網址同時處理，同一網站的並行抓取數不超過上限，結果依請求順序彙整"""
+        print("\n🔍 測試並行摘要...")
+        sites = [start_site(delay), start_site(delay)]
+        urls = [url_of(s, f"/page{i}") for i in range(per_site) for s in sites]
+        started = time.monotonic()
+        response = await url_routes.url_summary(URLSummaryRequest(url=urls))
+        elapsed = time.monotonic() - started
+        sequential = len(urls) * (delay + SUMMARY_DELAY)
+        peaks = [s.peak for s in sites]
+        print(f"   {len(urls)} 個網址耗時 {elapsed:.2f} 秒（依序處理約 {sequential:.2f} 秒）, "
+              f"各網站同時抓取數上限: {peaks}（設定 {URL_FETCH_PER_HOST}）")
+        passed = (
+            response["success_count"] == len(urls) and response["error_count"] == 0
+            and [r["url"] for r in response["results"]] == urls and response["errors"] is None
+            and all(1 < p <= URL_FETCH_PER_HOST for p in peaks) and elapsed < sequential / 2
+        )
+        return {"test_name": "concurrency", "elapsed": elapsed, "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def test_stream(self, delay: float = 0.05) -> Dict:
+        """串流依完成順序輸出：快的網址先出現，失敗的網址回報錯誤，最後一行為統計"""
+        print("\n🔍 測試 NDJSON 串流...")
+        site = start_site(delay)
+        urls = [url_of(site, "/slow"), url_of(site, "/fast"), url_of(site, "/missing")]
+        response = await url_routes.url_summary(URLSummaryRequest(url=urls, stream=True))
+        started = time.monotonic()
+        lines = []
+        async for line in response.body_iterator:
+            lines.append((time.monotonic() - started, json.loads(line)))
+        order = [item.get("url", item.get("type")) for _, item in lines]
+        statuses = {item["url"]: item["status"] for _, item in lines if "url" in item}
+        summary = lines[-1][1]
+        print(f"   輸出順序: {[o.rsplit('/', 1)[-1] for o in order]}, 首行 {lines[0][0] * 1000:.0f} ms, "
+              f"末行 {lines[-1][0] * 1000:.0f} ms")
+        passed = (
+            response.media_type == "application/x-ndjson" and order[-2] == urls[0] and order[-1] == "summary"
+            and statuses == {urls[0]: "success", urls[1]: "success", urls[2]: "error"}
+            and summary["success_count"] == 2 and summary["error_count"] == 1
+            and lines[0][0] < lines[-2][0] - delay
+        )
+        return {"test_name": "stream", "status": "✅ PASS" if passed else "❌ FAIL"}
+
+    async def run_all_tests(self):
+        """執行所有測試"""
+        print("=" * 60)
+        print("🚀 多網址摘要測試")
+        print("=" * 60)
+
+        self.test_results = [await self.test_concurrency(), await self.test_stream()]
+
+        print("\n" + "=" * 60)
+        for result in self.test_results:
+            print(f"{result['status']} {result['test_name']}")
+        return self.test_results
+
+
+if __name__ == "__main__":
+    asyncio.run(URLSummaryTester().run_all_tests())
@@ -0,0 +1,224 @@
+"""
+自適應併發限制模組
+以 AIMD（加性增加、乘性減少）依觀察到的延遲調整對外請求的併發上限：
+- 延遲接近基準時逐步放寬上限
+- 延遲明顯升高、逾時或後端錯誤時將上限減半
+- 超出上限的請求排隊等候，佇列已滿或等候過久時提早以 429 拒絕
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+from fastapi import HTTPException
+
+from config import LIMITER_MIN, LIMITER_MAX_QUEUE, LIMITER_MAX_WAIT, LIMITER_LATENCY_TOLERANCE
+from utils.deadline import remaining, deadline_exceeded
+
+FAST_SMOOTHING = 0.3  # 短期延遲 EWMA 係數
+BASELINE_DRIFT = 0.001  # 基準延遲向上漂移的速度（每個樣本）
+DECREASE_FACTOR = 0.5  # 乘性減少的倍率
+
+
+class AdaptiveLimiter:
+    """AIMD 自適應併發限制器"""
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        max_limit: int,
+        min_limit: int = LIMITER_MIN,
+        max_queue: int = LIMITER_MAX_QUEUE,
+        max_wait: float = LIMITER_MAX_WAIT,
+        tolerance: float = LIMITER_LATENCY_TOLERANCE
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.tolerance = tolerance
+        self.inflight = 0
+        self.baseline_latency = None
+        self.recent_latency = None
+        self._last_decrease = 0.0
+        self._waiters: deque = deque()
+        self.rejected = 0
+        self.completed = 0
+
+    @property
+    def capacity(self) -> int:
+        """目前允許的併發數"""
+        return max(self.min_limit, int(self.limit))
+
+    def _retry_after(self) -> int:
+        """估算用戶端應等待的秒數"""
+        latency = self.recent_latency or 1.0
+        return max(1, math.ceil(latency * (len(self._waiters) + 1) / self.capacity))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Ollama 負載過高（{self.name}: {reason}），請稍後再試",
+            headers={"Retry-After": str(self._retry_after())}
+        )
+
+    def _wake(self):
+        while self._waiters and self.inflight < self.capacity:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    async def acquire(self):
+        """
+        取得執行名額
+
+        Raises:
+            HTTPException: 佇列已滿或等候超過上限時返回 429；請求期限先到時返回 504
+        """
+        if self.inflight < self.capacity and not self._waiters:
+            self.inflight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject("佇列已滿")
+
+        future = asyncio.get_running_loop().create_future()
+        timeout = remaining(self.max_wait)
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                return
+            self._discard(future)
+            if timeout < self.max_wait:
+                # 逾時的是請求期限而非等候上限，重試也來不及
+                raise deadline_exceeded()
+            self._reject("等候逾時")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._discard(future)
+            raise
+
+    def _discard(self, future: asyncio.Future):
+        future.cancel()
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def release(self):
+        """歸還執行名額"""
+        self.inflight -= 1
+        self._wake()
+
+    def record(self, latency: float, ok: bool = True):
+        """
+        記錄一次請求結果並調整上限
+
+        Args:
+            latency: 請求耗時（秒）
+            ok: 請求是否成功（逾時或後端錯誤為 False）
+        """
+        self.completed += 1
+        if not ok:
+            self._decrease()
+            return
+
+        if self.baseline_latency is None:
+            self.baseline_latency = latency
+            self.recent_latency = latency
+        else:
+            self.recent_latency += FAST_SMOOTHING * (latency - self.recent_latency)
+            if latency < self.baseline_latency:
+                self.baseline_latency = latency
+            else:
+                self.baseline_latency += BASELINE_DRIFT * (latency - self.baseline_latency)
+
+        if self.recent_latency > self.baseline_latency * self.tolerance:
+            self._decrease()
+        elif self.inflight >= self.capacity - 1:
+            # 只有名額接近用滿時才放寬，避免閒置時上限無限增長
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def _decrease(self):
+        # 一個延遲週期內只減少一次，避免同一波壅塞讓上限驟降到底
+        now = time.monotonic()
+        if now - self._last_decrease < (self.recent_latency or 0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        取得名額並在結束時依耗時與結果調整上限
+
+        呼叫端可將 yield 的 outcome["ok"] 設為 False 表示後端錯誤；
+        發生例外視為失敗，被取消的請求不列入統計。
+        """
+        await self.acquire()
+        started = time.monotonic()
+        outcome = {"ok": True}
+        try:
+            yield outcome
+        except asyncio.CancelledError:
+            outcome["ok"] = None
+            raise
+        except Exception:
+            outcome["ok"] = False
+            raise
+        finally:
+            self.release()
+            if outcome["ok"] is not None:
+                self.record(time.monotonic() - started, outcome["ok"])
+
+    def stats(self) -> Dict:
+        """返回限制器狀態"""
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "baseline_latency_ms": round(self.baseline_latency * 1000, 1) if self.baseline_latency is not None else None,
+            "recent_latency_ms": round(self.recent_latency * 1000, 1) if self.recent_latency is not None else None
+        }
+
+
+class KeyedSemaphore:
+    """依鍵（如網站主機）分別限制併發數，閒置的鍵會自動移除"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        """取得該鍵的名額"""
+        semaphore, users = self._semaphores.get(key, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit)
+        self._semaphores[key] = (semaphore, users + 1)
+        try:
+            async with semaphore:
+                yield
+        finally:
+            semaphore, users = self._semaphores[key]
+            if users <= 1:
+                del self._semaphores[key]
+            else:
+                self._semaphores[key] = (semaphore, users - 1)
+
+    def active_keys(self) -> int:
+        """返回目前使用中的鍵數量"""
+        return len(self._semaphores)
@@ -0,0 +1,119 @@
+"""
+請求期限模組
+為每個請求設定端到端的期限，下游的嵌入、檢索、LLM 與網頁抓取依剩餘時間縮短各自的超時；
+用戶端中斷連線時立即放棄處理中的工作
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import HTTPException
+
+from config import REQUEST_TIMEOUT, REQUEST_TIMEOUT_HEADER
+
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+def deadline_exceeded() -> HTTPException:
+    """請求已超過期限的 504 錯誤"""
+    return HTTPException(status_code=504, detail="請求已超過處理期限")
+
+
+def remaining(default: float) -> float:
+    """
+    計算下游操作可用的超時秒數
+
+    Args:
+        default: 該操作原本的超時秒數
+
+    Returns:
+        原本超時與請求剩餘時間中較小者；未設定期限時返回原本超時
+
+    Raises:
+        HTTPException: 請求已超過期限時返回 504
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise deadline_exceeded()
+    return min(default, left)
+
+
+def check_deadline():
+    """請求已超過期限時拋出 504"""
+    remaining(float("inf"))
+
+
+def _parse_timeout(headers) -> float:
+    for name, value in headers:
+        if name.decode("latin-1").lower() == REQUEST_TIMEOUT_HEADER.lower():
+            try:
+                timeout = float(value.decode("latin-1"))
+            except ValueError:
+                break
+            if timeout > 0:
+                return min(timeout, REQUEST_TIMEOUT)
+    return REQUEST_TIMEOUT
+
+
+class DeadlineMiddleware:
+    """
+    設定請求期限並在用戶端中斷時取消處理的 ASGI 中介層
+
+    期限取自請求標頭（秒，不超過 REQUEST_TIMEOUT），未提供時使用 REQUEST_TIMEOUT。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_deadline.set(time.monotonic() + _parse_timeout(scope.get("headers", [])))
+        body_received = asyncio.Event()
+        disconnected = asyncio.Event()
+        response_sent = False
+
+        async def wrapped_receive():
+            # 請求內容讀完後，連線中斷事件改由監看任務接收並轉交
+            if body_received.is_set():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_received.set()
+            return message
+
+        async def wrapped_send(message):
+            nonlocal response_sent
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_sent = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, wrapped_receive, wrapped_send))
+
+        async def watch_disconnect():
+            await body_received.wait()
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                if not response_sent and not app_task.done():
+                    app_task.cancel()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            # 用戶端已離開，不需要回應
+            if not disconnected.is_set():
+                raise
+        finally:
+            watcher.cancel()
+            current_deadline.reset(token)
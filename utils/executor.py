@@ -0,0 +1,159 @@
+"""
+執行器模組
+將 CPU 密集或阻塞的工作移出事件迴圈：
+- 執行緒池：會釋放 GIL 的 NumPy 運算與檔案 I/O
+- 行程池：純 Python 的解析與切割（小型輸入直接執行，避免序列化成本高於工作本身）
+並定期量測事件迴圈延遲，讓阻塞事件迴圈的回歸可以被觀察到
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, TypeVar
+
+from config import THREAD_POOL_WORKERS, PROCESS_POOL_WORKERS, CPU_OFFLOAD_MIN_CHARS, LOOP_LAG_INTERVAL, VECTOR_SEARCH_SHARDS
+from utils.debug_logger import logger
+
+T = TypeVar("T")
+
+LAG_SAMPLES = 600  # 保留的事件迴圈延遲樣本數
+
+thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix="rag-worker")
+# 分片搜尋專用：搜尋本身可能已在 thread_pool 中執行，等待同一個池的工作可能互相卡住
+search_pool = ThreadPoolExecutor(max_workers=max(1, VECTOR_SEARCH_SHARDS), thread_name_prefix="rag-search")
+_process_pool: Optional[ProcessPoolExecutor] = None
+counters = {"thread": 0, "process": 0, "inline": 0, "process_failures": 0}
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """延遲建立行程池（PROCESS_POOL_WORKERS 為 0 時停用）"""
+    global _process_pool
+    if PROCESS_POOL_WORKERS <= 0:
+        return None
+    if _process_pool is None:
+        # spawn 不複製父行程的事件迴圈與執行緒狀態，各平台行為一致
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+async def run_in_thread(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    在執行緒池執行函數（保留目前的 contextvars，如請求期限）
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    counters["thread"] += 1
+    return await loop.run_in_executor(thread_pool, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def run_in_process(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    在行程池執行函數（函數與參數須可序列化）；行程池停用或損壞時改用執行緒池
+    """
+    pool = _get_process_pool()
+    if pool is None:
+        return await run_in_thread(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    counters["process"] += 1
+    try:
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+    except BrokenProcessPool:
+        global _process_pool
+        counters["process_failures"] += 1
+        logger.warning("Process pool broken, recreating and falling back to thread pool")
+        if _process_pool is pool:
+            _process_pool = None
+        return await run_in_thread(func, *args, **kwargs)
+
+
+async def run_cpu_bound(func: Callable[..., T], *args, size: int, **kwargs) -> T:
+    """
+    執行純 Python 的 CPU 密集工作：輸入大小達 CPU_OFFLOAD_MIN_CHARS 時送到行程池，否則直接執行
+
+    Args:
+        func: 模組層級的函數
+        size: 輸入大小（字數），用於決定是否值得移出事件迴圈
+    """
+    if size < CPU_OFFLOAD_MIN_CHARS:
+        counters["inline"] += 1
+        return func(*args, **kwargs)
+    return await run_in_process(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """關閉執行緒池與行程池"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def executor_stats() -> Dict:
+    """返回執行器統計"""
+    return {
+        "thread_workers": THREAD_POOL_WORKERS,
+        "process_workers": PROCESS_POOL_WORKERS,
+        "search_shards": VECTOR_SEARCH_SHARDS,
+        "offload_min_chars": CPU_OFFLOAD_MIN_CHARS,
+        **counters
+    }
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class LoopLagMonitor:
+    """事件迴圈延遲監測：定期休眠並記錄實際喚醒比預期晚了多久"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=LAG_SAMPLES)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self) -> Dict:
+        """返回事件迴圈延遲統計（毫秒）"""
+        samples = list(self.samples)
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "lag_ms_current": round(samples[-1] * 1000, 2) if samples else 0.0,
+            "lag_ms_p50": round(_percentile(samples, 50) * 1000, 2),
+            "lag_ms_p99": round(_percentile(samples, 99) * 1000, 2),
+            "lag_ms_max": round(self.max_lag * 1000, 2)
+        }
+
+
+# 全局事件迴圈延遲監測實例
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,40 @@
+"""
+共用 HTTP 用戶端
+建立 httpx.AsyncClient 需載入 SSL 設定，會阻塞事件迴圈數十毫秒；
+每個事件迴圈依用途共用一個用戶端並重複使用連線
+"""
+import asyncio
+from typing import Dict, Tuple
+
+import httpx
+
+_clients: Dict[Tuple[str, int], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+
+def get_http_client(name: str, **kwargs) -> httpx.AsyncClient:
+    """
+    取得目前事件迴圈中指定用途的共用用戶端
+
+    Args:
+        name: 用途名稱（如 url_fetch、ollama）
+        **kwargs: 首次建立時傳給 httpx.AsyncClient 的參數
+
+    Returns:
+        共用的 HTTP 用戶端（超時請於每個請求指定）
+    """
+    loop = asyncio.get_running_loop()
+    key = (name, id(loop))
+    entry = _clients.get(key)
+    if entry is None or entry[0] is not loop or entry[1].is_closed:
+        entry = (loop, httpx.AsyncClient(**kwargs))
+        _clients[key] = entry
+    return entry[1]
+
+
+async def close_http_clients():
+    """關閉目前事件迴圈的所有共用用戶端"""
+    loop = asyncio.get_running_loop()
+    for key, (client_loop, client) in list(_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+            del _clients[key]
@@ -0,0 +1,204 @@
+"""
+Ollama 多後端路由模組
+在多個 Ollama 實例之間分配請求：
+- 優先選擇未完成請求最少的後端
+- 連續失敗的後端暫時剔除，期滿或探測成功後恢復
+- 可選的對沖請求：主請求超過門檻仍未完成時，向第二個後端送出相同請求，取先完成者
+- 整個後端池共用一個自適應併發限制器，避免流量尖峰壓垮 Ollama
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from config import (
+    OLLAMA_LLM_URLS, OLLAMA_EMBEDDING_URLS,
+    OLLAMA_LLM_HEDGE_AFTER, OLLAMA_EMBEDDING_HEDGE_AFTER,
+    OLLAMA_EJECT_FAILURES, OLLAMA_EJECT_SECONDS,
+    LLM_LIMITER_INITIAL, LLM_LIMITER_MAX, EMBEDDING_LIMITER_INITIAL, EMBEDDING_LIMITER_MAX
+)
+from utils.concurrency import AdaptiveLimiter
+from utils.http_client import get_http_client
+
+LATENCY_SMOOTHING = 0.2  # 延遲 EWMA 的平滑係數
+
+
+class Backend:
+    """單一 Ollama 後端的狀態"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+        self.hedged = 0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def record_success(self, latency: float):
+        self.mark_healthy()
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += LATENCY_SMOOTHING * (latency - self.latency_ewma)
+
+    def mark_healthy(self):
+        """健康探測成功時恢復被剔除的後端"""
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def record_failure(self):
+        self.errors += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= OLLAMA_EJECT_FAILURES:
+            self.ejected_until = time.monotonic() + OLLAMA_EJECT_SECONDS
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None
+        }
+
+
+class OllamaPool:
+    """一組提供相同模型的 Ollama 後端"""
+
+    def __init__(self, name: str, urls: List[str], hedge_after: float = 0.0, limiter: Optional[AdaptiveLimiter] = None):
+        self.name = name
+        self.backends = [Backend(url) for url in urls]
+        self.hedge_after = hedge_after
+        self.limiter = limiter or AdaptiveLimiter(name, initial=len(urls), max_limit=len(urls) * 8)
+
+    def pick(self, exclude: tuple = ()) -> Optional[Backend]:
+        """
+        選出未完成請求最少的健康後端
+
+        Args:
+            exclude: 不考慮的後端
+
+        Returns:
+            選中的後端；全部被剔除時返回最早恢復的後端，沒有可用後端時返回 None
+        """
+        candidates = [b for b in self.backends if b not in exclude]
+        if not candidates:
+            return None
+        healthy = [b for b in candidates if b.healthy]
+        if not healthy:
+            return min(candidates, key=lambda b: b.ejected_until)
+        return min(healthy, key=lambda b: (b.outstanding, b.latency_ewma or 0.0))
+
+    async def _send(self, backend: Backend, path: str, payload: Dict, timeout: float) -> httpx.Response:
+        backend.outstanding += 1
+        backend.requests += 1
+        started = time.monotonic()
+        try:
+            response = await get_http_client("ollama").post(f"{backend.url}{path}", json=payload, timeout=timeout)
+        except (httpx.TransportError, httpx.TimeoutException):
+            backend.record_failure()
+            raise
+        finally:
+            backend.outstanding -= 1
+
+        if response.status_code >= 500:
+            backend.record_failure()
+        else:
+            backend.record_success(time.monotonic() - started)
+        return response
+
+    async def _send_hedged(self, primary: Backend, path: str, payload: Dict, timeout: float) -> httpx.Response:
+        """主請求超過門檻未完成時，對第二個後端送出對沖請求"""
+        first = asyncio.create_task(self._send(primary, path, payload, timeout))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        secondary = self.pick(exclude=(primary,))
+        if done or secondary is None or not secondary.healthy:
+            return await first
+
+        secondary.hedged += 1
+        second = asyncio.create_task(self._send(secondary, path, payload, timeout))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        failed_response: Optional[httpx.Response] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif task.result().status_code >= 500:
+                        failed_response = task.result()
+                    else:
+                        return task.result()
+            if failed_response is not None:
+                return failed_response
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post(self, path: str, payload: Dict, timeout: float) -> httpx.Response:
+        """
+        送出 POST 請求；連線失敗時改送其他後端
+
+        Args:
+            path: API 路徑（如 /api/generate）
+            payload: JSON 內容
+            timeout: 超時秒數
+
+        Returns:
+            HTTP 回應
+
+        Raises:
+            httpx.ConnectError: 所有後端都無法連線
+            httpx.TimeoutException: 請求超時
+            HTTPException: 併發已達上限且佇列已滿或等候過久時返回 429
+        """
+        async with self.limiter.slot() as outcome:
+            response = await self._post_with_failover(path, payload, timeout)
+            if response.status_code >= 500:
+                outcome["ok"] = False
+            return response
+
+    async def _post_with_failover(self, path: str, payload: Dict, timeout: float) -> httpx.Response:
+        tried: tuple = ()
+        while True:
+            backend = self.pick(exclude=tried)
+            if backend is None:
+                raise httpx.ConnectError(f"{self.name}: 沒有可用的 Ollama 後端")
+            tried += (backend,)
+            try:
+                if self.hedge_after > 0 and len(self.backends) > 1:
+                    return await self._send_hedged(backend, path, payload, timeout)
+                return await self._send(backend, path, payload, timeout)
+            except httpx.ConnectError:
+                if len(tried) == len(self.backends):
+                    raise
+
+    def stats(self) -> Dict:
+        """返回各後端的狀態"""
+        return {
+            "hedge_after": self.hedge_after,
+            "limiter": self.limiter.stats(),
+            "backends": [b.stats() for b in self.backends]
+        }
+
+
+# 全局後端池實例（LLM 與嵌入可使用不同的後端）
+llm_pool = OllamaPool(
+    "llm", OLLAMA_LLM_URLS, OLLAMA_LLM_HEDGE_AFTER,
+    AdaptiveLimiter("llm", initial=LLM_LIMITER_INITIAL, max_limit=LLM_LIMITER_MAX)
+)
+embedding_pool = OllamaPool(
+    "embedding", OLLAMA_EMBEDDING_URLS, OLLAMA_EMBEDDING_HEDGE_AFTER,
+    AdaptiveLimiter("embedding", initial=EMBEDDING_LIMITER_INITIAL, max_limit=EMBEDDING_LIMITER_MAX)
+)
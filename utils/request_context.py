@@ -0,0 +1,59 @@
+"""
+請求上下文
+以 contextvars 保存目前請求的端點與用戶端識別，供下游模組（如 LLM 排程器）讀取
+"""
+from contextvars import ContextVar
+
+DEFAULT_ENDPOINT = "default"
+DEFAULT_CLIENT = "anonymous"
+
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default=DEFAULT_ENDPOINT)
+current_client: ContextVar[str] = ContextVar("current_client", default=DEFAULT_CLIENT)
+
+
+def bind_request(endpoint: str, client_id: str):
+    """
+    綁定目前請求的上下文
+
+    Args:
+        endpoint: 請求路徑
+        client_id: 用戶端識別
+
+    Returns:
+        用於 reset_request 的 token
+    """
+    return current_endpoint.set(endpoint), current_client.set(client_id or DEFAULT_CLIENT)
+
+
+def reset_request(tokens):
+    """還原 bind_request 綁定前的上下文"""
+    endpoint_token, client_token = tokens
+    current_endpoint.reset(endpoint_token)
+    current_client.reset(client_token)
+
+
+class RequestContextMiddleware:
+    """
+    綁定請求端點與用戶端的 ASGI 中介層
+
+    用戶端識別優先取 X-Client-ID 標頭，否則使用連線來源位址。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        client_id = headers.get(b"x-client-id", b"").decode("latin-1")
+        if not client_id and scope.get("client"):
+            client_id = scope["client"][0]
+
+        tokens = bind_request(scope["path"], client_id)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            reset_request(tokens)
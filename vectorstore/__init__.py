@@ -2,10 +2,13 @@
 向量存儲層
 負責向量資料庫的操作
 """
-from .store import VectorStore, vector_store
-
-__all__ = ["VectorStore", "vector_store"]
-
+from config import INDEX_SERVER_SOCKET
 
+from .store import VectorStore, MissingEmbeddingError
+from .remote import RemoteVectorStore
+from .near_duplicate import MinHashIndex
 
+# 全局向量存儲實例（設定索引服務時，所有 worker 透過索引服務共用同一個知識庫）
+vector_store = RemoteVectorStore(INDEX_SERVER_SOCKET) if INDEX_SERVER_SOCKET else VectorStore()
 
+__all__ = ["VectorStore", "RemoteVectorStore", "MinHashIndex", "MissingEmbeddingError", "vector_store"]
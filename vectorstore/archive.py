@@ -0,0 +1,194 @@
+"""
+知識庫封存檔
+將文檔、片段與已生成的嵌入向量匯出為 zip 封存檔，在其他環境匯入時不需要重新生成向量。
+
+封存檔內容：
+- manifest.json：格式版本、嵌入模型名稱、向量維度與數量
+- documents.jsonl：每行一個文檔（id、title、content、created_at、updated_at）
+- chunks.jsonl：每行一個不重複的片段內容；前 embedded 個有向量，其餘為尚未生成向量的片段
+- embeddings.npy：float32 向量矩陣（embedded × dimension）
+- refs.npy / ref_offsets.npy：各文檔依序引用的片段索引（int32，以 offsets 切分）
+
+命令列用法（經由 API 串流上傳與下載）:
+    python -m vectorstore.archive export knowledge_base.zip --url http://localhost:8000
+    python -m vectorstore.archive import knowledge_base.zip --url http://localhost:8000
+"""
+import argparse
+import json
+import time
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+import httpx
+import numpy as np
+
+from config import ARCHIVE_STREAM_BLOCK
+
+ARCHIVE_FORMAT = "rag-knowledge-base"
+ARCHIVE_VERSION = 1
+
+
+def _member(archive: zipfile.ZipFile, name: str, compress: bool = True):
+    """開啟寫入成員；向量等數值資料不壓縮（壓縮率低且耗時）"""
+    info = zipfile.ZipInfo(name, time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    return archive.open(info, "w", force_zip64=True)
+
+
+def _write_lines(archive: zipfile.ZipFile, name: str, items) -> None:
+    with _member(archive, name) as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def _write_array(archive: zipfile.ZipFile, name: str, array: np.ndarray) -> None:
+    with _member(archive, name, compress=False) as f:
+        np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def write_archive(store, fileobj: BinaryIO, model: str) -> Dict:
+    """
+    將知識庫寫入封存檔
+
+    Args:
+        store: VectorStore 或 RemoteVectorStore
+        fileobj: 可寫入的二進位檔案
+        model: 生成向量所用的嵌入模型名稱
+
+    Returns:
+        manifest 內容
+    """
+    snapshot, refs = store.export_state()
+    texts = [chunk["content"] for chunk in snapshot.chunks]
+    index = {chunk["hash"]: i for i, chunk in enumerate(snapshot.chunks)}
+    for chunk, _ in snapshot.pending:
+        if chunk["hash"] not in index:
+            index[chunk["hash"]] = len(texts)
+            texts.append(chunk["content"])
+
+    documents = list(snapshot.documents.values())
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    flat: List[int] = []
+    for n, document in enumerate(documents):
+        flat.extend(index[digest] for digest in refs.get(document["id"], []))
+        offsets[n + 1] = len(flat)
+
+    matrix = snapshot.matrix
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "embedding_model": model,
+        "dimension": int(matrix.shape[1]) if matrix.size else 0,
+        "documents": len(documents),
+        "chunks": len(texts),
+        "embedded": len(snapshot.chunks)
+    }
+    with zipfile.ZipFile(fileobj, "w") as archive:
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False))
+        _write_lines(archive, "documents.jsonl", (
+            {key: doc[key] for key in ("id", "title", "content", "created_at", "updated_at") if key in doc}
+            for doc in documents
+        ))
+        _write_lines(archive, "chunks.jsonl", texts)
+        _write_array(archive, "embeddings.npy", matrix.reshape(len(snapshot.chunks), manifest["dimension"]))
+        _write_array(archive, "refs.npy", np.asarray(flat, dtype=np.int32))
+        _write_array(archive, "ref_offsets.npy", offsets)
+    return manifest
+
+
+def _read_lines(archive: zipfile.ZipFile, name: str) -> List:
+    with archive.open(name) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _read_array(archive: zipfile.ZipFile, name: str) -> np.ndarray:
+    with archive.open(name) as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
+
+
+def read_archive(fileobj: BinaryIO, model: Optional[str] = None, dimension: int = 0) -> Dict:
+    """
+    讀取並驗證封存檔
+
+    Args:
+        fileobj: 可讀取與定位的二進位檔案
+        model: 目前使用的嵌入模型名稱（None 為不檢查）
+        dimension: 知識庫目前的向量維度（0 為不檢查）
+
+    Returns:
+        包含 manifest、documents、texts、embeddings 與 refs 的字典，可直接傳給 import_documents
+
+    Raises:
+        ValueError: 不是有效的封存檔、內容不一致，或嵌入模型與維度不符時
+    """
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            manifest = json.loads(archive.read("manifest.json"))
+            if manifest.get("format") != ARCHIVE_FORMAT or manifest.get("version") != ARCHIVE_VERSION:
+                raise ValueError("不支援的封存檔格式或版本")
+            if model and manifest["embedding_model"] != model:
+                raise ValueError(f"嵌入模型不符: 封存檔為 {manifest['embedding_model']}，目前為 {model}")
+            if dimension and manifest["embedded"] and manifest["dimension"] != dimension:
+                raise ValueError(f"嵌入向量維度不符: 封存檔為 {manifest['dimension']}，目前為 {dimension}")
+            documents = _read_lines(archive, "documents.jsonl")
+            texts = _read_lines(archive, "chunks.jsonl")
+            embeddings = _read_array(archive, "embeddings.npy")
+            flat = _read_array(archive, "refs.npy")
+            offsets = _read_array(archive, "ref_offsets.npy")
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"無效的封存檔: {e}")
+
+    if embeddings.dtype != np.float32 or embeddings.shape != (manifest["embedded"], manifest["dimension"]):
+        raise ValueError(f"嵌入向量矩陣形狀不符: {embeddings.dtype} {embeddings.shape}")
+    if len(documents) != manifest["documents"] or len(texts) != manifest["chunks"] or len(offsets) != len(documents) + 1:
+        raise ValueError("封存檔的文檔或片段數量與 manifest 不符")
+    if flat.size and (flat.min() < 0 or flat.max() >= len(texts)):
+        raise ValueError("片段引用超出範圍")
+    refs = [flat[offsets[n]:offsets[n + 1]].tolist() for n in range(len(documents))]
+    return {"manifest": manifest, "documents": documents, "texts": texts, "embeddings": embeddings, "refs": refs}
+
+
+def iter_file(fileobj: BinaryIO, block: int = ARCHIVE_STREAM_BLOCK) -> Iterator[bytes]:
+    """從頭逐塊讀取檔案，讀完後關閉（供 StreamingResponse 串流下載）"""
+    try:
+        fileobj.seek(0)
+        while True:
+            data = fileobj.read(block)
+            if not data:
+                break
+            yield data
+    finally:
+        fileobj.close()
+
+
+# ============ 命令列 ============
+
+def _export(url: str, path: str):
+    with httpx.stream("GET", f"{url}/api/documents/export", timeout=None) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for data in response.iter_bytes(ARCHIVE_STREAM_BLOCK):
+                f.write(data)
+    print(f"已匯出到 {path}")
+
+
+def _import(url: str, path: str):
+    with open(path, "rb") as f:
+        response = httpx.post(
+            f"{url}/api/documents/import",
+            content=iter(lambda: f.read(ARCHIVE_STREAM_BLOCK), b""),
+            headers={"Content-Type": "application/zip"},
+            timeout=None
+        )
+    if response.is_error:
+        raise SystemExit(f"匯入失敗: HTTP {response.status_code} {response.text}")
+    print(json.dumps(response.json(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="知識庫匯入匯出")
+    parser.add_argument("command", choices=["export", "import"], help="匯出或匯入")
+    parser.add_argument("path", help="封存檔路徑")
+    parser.add_argument("--url", default="http://localhost:8000", help="API 伺服器網址")
+    args = parser.parse_args()
+    (_export if args.command == "export" else _import)(args.url.rstrip("/"), args.path)
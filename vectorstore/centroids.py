@@ -0,0 +1,102 @@
+"""
+文檔質心索引
+為每個文檔保存其片段向量的質心；搜尋時先以質心選出最相關的 M 個文檔，只為這些文檔的片段計分
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def _centroid(matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """片段向量平均後正規化為單位長度"""
+    centroid = matrix[rows].mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return centroid / norm if norm else centroid
+
+
+class DocumentIndex:
+    """
+    文檔質心與各文檔片段列的不可變索引
+
+    與快照一起發布：更新時建立新的實例，讀取端不需要加鎖。
+    沒有任何已生成向量的片段的文檔（如延後嵌入中的文檔）不在索引中。
+    """
+
+    __slots__ = ("doc_ids", "centroids", "rows", "_positions")
+
+    def __init__(self, doc_ids: List[str], centroids: np.ndarray, rows: List[np.ndarray]):
+        self.doc_ids = doc_ids
+        self.centroids = centroids
+        self.rows = rows  # 各文檔引用的矩陣列（遞增排序）
+        self._positions = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+    @classmethod
+    def empty(cls) -> "DocumentIndex":
+        return cls([], np.zeros((0, 0), dtype=np.float32), [])
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, chunks: List[dict]) -> "DocumentIndex":
+        """依片段的 document_ids 重新建立索引"""
+        grouped: Dict[str, List[int]] = defaultdict(list)
+        for i, chunk in enumerate(chunks):
+            for doc_id in chunk["document_ids"]:
+                grouped[doc_id].append(i)
+        return cls.empty().update({doc_id: np.asarray(rows) for doc_id, rows in grouped.items()}, matrix)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def update(
+        self,
+        changes: Dict[str, Optional[np.ndarray]],
+        matrix: np.ndarray,
+        remap: Optional[np.ndarray] = None
+    ) -> "DocumentIndex":
+        """
+        返回套用變更後的新索引
+
+        Args:
+            changes: 文檔 ID → 新的片段列（None 或空陣列為移除）
+            matrix: 變更後的向量矩陣
+            remap: 矩陣刪除列後，舊列號 → 新列號的對照（None 為列號不變）
+
+        Returns:
+            新的索引
+        """
+        keep = [i for i, doc_id in enumerate(self.doc_ids) if doc_id not in changes]
+        doc_ids = [self.doc_ids[i] for i in keep]
+        rows = [self.rows[i] if remap is None else remap[self.rows[i]] for i in keep]
+        centroids = self.centroids[keep] if len(keep) != len(self.doc_ids) else self.centroids
+
+        added = []
+        for doc_id, doc_rows in changes.items():
+            if doc_rows is None or not len(doc_rows):
+                continue
+            doc_rows = np.unique(doc_rows)
+            doc_ids.append(doc_id)
+            rows.append(doc_rows)
+            added.append(_centroid(matrix, doc_rows))
+        if added:
+            added = np.asarray(added, dtype=np.float32)
+            centroids = np.vstack([centroids, added]) if len(centroids) else added
+        if not doc_ids:
+            centroids = np.zeros((0, 0), dtype=np.float32)
+        return DocumentIndex(doc_ids, centroids, rows)
+
+    def document_rows(self, doc_id: str) -> Optional[np.ndarray]:
+        position = self._positions.get(doc_id)
+        return None if position is None else self.rows[position]
+
+    def candidates(self, query: np.ndarray, documents: int) -> Optional[np.ndarray]:
+        """
+        以質心選出最相關的文檔，返回其片段列（遞增排序、不重複）
+
+        Returns:
+            候選片段列；documents 不小於文檔數（不需要篩選）時返回 None
+        """
+        if documents <= 0 or documents >= len(self.doc_ids):
+            return None
+        scores = self.centroids @ query
+        top = np.argpartition(-scores, documents - 1)[:documents]
+        return np.unique(np.concatenate([self.rows[i] for i in top]))
@@ -0,0 +1,339 @@
+"""
+索引服務
+由單一行程擁有 VectorStore，透過 Unix socket 提供搜尋與修改，讓多個 uvicorn worker 共用同一個知識庫。
+VectorStore 的向量緩衝區直接配置在共享記憶體，新增的向量寫在既有列之後，worker 直接在本機掃描；
+只有緩衝區容量不足或刪除列時才建立新的區段。
+每次修改記錄文檔、片段與待嵌入片段的差異，worker 只取得自己版本之後的差異，文檔內容則在需要時才取得。
+
+啟動方式:
+    python -m vectorstore.index_server --socket /tmp/rag_index.sock
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import signal
+from collections import deque
+from itertools import compress
+from multiprocessing import shared_memory
+from operator import is_not
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import INDEX_SERVER_SOCKET, INDEX_SHM_PREFIX
+from utils.debug_logger import logger
+from vectorstore.store import VectorStore, Snapshot, document_preview
+from vectorstore.protocol import (
+    OPS, OP_NAMES, STATUS_OK, STATUS_ERROR, CONTROL, CLOSED_VERSION,
+    encode_frame, read_frame
+)
+
+KEEP_SEGMENTS = 3  # 保留的舊區段數，讓剛取得快照的 worker 仍能連接
+CHANGELOG_VERSIONS = 256  # 保留差異的版本數；落後更多的 worker 重新取得完整快照
+
+
+def document_metadata(document: dict) -> dict:
+    """快照中的文檔資料：以預覽取代完整內容"""
+    metadata = {key: value for key, value in document.items() if key != "content"}
+    metadata["preview"] = document_preview(document)
+    return metadata
+
+
+def _removed_rows(old, new, key) -> List[int]:
+    """old 中不在 new 的項目位置（兩者皆依序保留未移除的項目）"""
+    kept = set(map(key, new))
+    return [i for i, item in enumerate(old) if key(item) not in kept]
+
+
+def _chunk_hash(chunk: dict) -> str:
+    return chunk["hash"]
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot, rows_dropped: bool) -> Dict:
+    """
+    計算兩個快照之間文檔、片段與待嵌入片段的差異
+
+    VectorStore 修改片段時只會依序移除片段、替換既有位置的片段並在最後新增，
+    待嵌入片段同樣只會移除與在最後新增；未改變的片段與文檔沿用同一個物件，可依物件身分比較。
+
+    Args:
+        old: 前一個快照
+        new: 新的快照
+        rows_dropped: 兩個快照之間是否有片段被移除
+
+    Returns:
+        差異（套用方式見 RemoteVectorStore._apply_delta）
+    """
+    delta: Dict = {}
+    if new.documents is not old.documents:
+        delta["documents"] = {
+            doc_id: document_metadata(doc) for doc_id, doc in new.documents.items() if old.documents.get(doc_id) is not doc
+        }
+        delta["removed_documents"] = list(old.documents.keys() - new.documents.keys())
+
+    if new.chunks is not old.chunks:
+        survivors = old.chunks
+        if rows_dropped:
+            removed = _removed_rows(old.chunks, new.chunks, _chunk_hash)
+            if removed:
+                delta["removed_chunks"] = removed
+                dropped = set(removed)
+                survivors = [chunk for i, chunk in enumerate(old.chunks) if i not in dropped]
+        kept = len(survivors)
+        delta["changed_chunks"] = [[i, new.chunks[i]] for i in compress(range(kept), map(is_not, survivors, new.chunks))]
+        delta["appended_chunks"] = new.chunks[kept:]
+
+    if new.pending is not old.pending:
+        removed = _removed_rows(old.pending, new.pending, id)
+        delta["removed_pending"] = removed
+        delta["added_pending"] = [chunk for chunk, _ in new.pending[len(old.pending) - len(removed):]]
+    return delta
+
+
+class IndexServer:
+    """索引服務"""
+
+    def __init__(self, socket_path: str, shm_prefix: str = INDEX_SHM_PREFIX):
+        self.socket_path = socket_path
+        self.prefix = f"{shm_prefix}_{secrets.token_hex(4)}"
+        self.store = VectorStore(allocator=self._allocate)
+        self.version = 0
+        self.requests: Dict[str, int] = {name: 0 for name in OPS}
+        self.control = shared_memory.SharedMemory(create=True, size=CONTROL.size, name=f"{self.prefix}_ctl")
+        self._segments: deque = deque()  # [區段, 緩衝區]，最新的在最後
+        self._retired: List[shared_memory.SharedMemory] = []
+        self._allocated = 0
+        self._changes: deque = deque(maxlen=CHANGELOG_VERSIONS)  # (版本, 與前一版本的差異)
+        self._published = self.store.snapshot()
+        self._row_epoch = self.store._row_epoch
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _allocate(self, rows: int, dim: int) -> np.ndarray:
+        """在新的共享記憶體區段配置向量緩衝區（VectorStore 的 allocator）"""
+        self._allocated += 1
+        segment = shared_memory.SharedMemory(
+            create=True, size=max(rows * dim * 4, 1), name=f"{self.prefix}_{self._allocated}"
+        )
+        buffer = np.ndarray((rows, dim), dtype=np.float32, buffer=segment.buf)
+        self._segments.append([segment, buffer])
+        while len(self._segments) > KEEP_SEGMENTS:
+            old, _ = self._segments.popleft()
+            old.unlink()
+            self._retired.append(old)
+        self._release_retired()
+        return buffer
+
+    def _release_retired(self):
+        """關閉已移除的舊區段（仍被舊快照引用的留待下次）"""
+        still_used = []
+        for segment in self._retired:
+            try:
+                segment.close()
+            except BufferError:
+                still_used.append(segment)
+        self._retired = still_used
+
+    def _segment_of(self, matrix: np.ndarray) -> Optional[str]:
+        """矩陣所在的共享記憶體區段名稱"""
+        if not matrix.size:
+            return None
+        for segment, buffer in reversed(self._segments):
+            if np.may_share_memory(matrix, buffer):
+                return segment.name
+        raise RuntimeError("向量矩陣不在共享記憶體中")
+
+    def _publish(self):
+        """記錄這次修改的差異，並更新控制區塊的版本"""
+        snapshot = self.store.snapshot()
+        epoch = self.store._row_epoch
+        self.version += 1
+        self._changes.append((self.version, diff_snapshots(self._published, snapshot, epoch != self._row_epoch)))
+        self._published = snapshot
+        self._row_epoch = epoch
+        CONTROL.pack_into(self.control.buf, 0, self.version)
+
+    # ============ 請求處理 ============
+
+    def _hello(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        return {"control": self.control.name, "version": self.version}, b""
+
+    def _state(self, snapshot: Snapshot) -> Dict:
+        return {
+            "version": self.version,
+            "segment": self._segment_of(snapshot.matrix),
+            "shape": list(snapshot.matrix.shape)
+        }
+
+    def _snapshot(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        """
+        control 為本服務時返回 since 版本之後的差異；
+        用戶端連接的是先前的服務，或 since 已不在差異記錄中時返回完整快照（文檔不含內容）
+        """
+        snapshot = self._published
+        result = self._state(snapshot)
+        since = payload.get("since")
+        oldest = self._changes[0][0] if self._changes else self.version + 1
+        if payload.get("control") == self.control.name and since is not None and oldest - 1 <= since <= self.version:
+            result["deltas"] = [delta for version, delta in self._changes if version > since]
+            return result, b""
+        result.update(
+            documents={doc_id: document_metadata(doc) for doc_id, doc in snapshot.documents.items()},
+            chunks=snapshot.chunks,
+            pending=[chunk for chunk, _ in snapshot.pending]
+        )
+        return result, b""
+
+    def _get_document(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        return {"document": self.store.get_document(payload["doc_id"])}, b""
+
+    def _search(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        query = np.frombuffer(data, dtype=np.float32).tolist()
+        return {"results": self.store.search(query, payload.get("top_k", 5))}, b""
+
+    @staticmethod
+    def _embeddings(payload: Dict, data: bytes) -> List[Optional[np.ndarray]]:
+        """還原與片段對應的向量列表（未傳送向量的片段為 None）"""
+        embedded = payload.get("embedded", [True] * len(payload["chunks"]))
+        vectors = iter(np.frombuffer(data, dtype=np.float32).reshape(sum(embedded), payload["dim"]) if any(embedded) else [])
+        return [next(vectors) if present else None for present in embedded]
+
+    def _add_document(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        document = self.store.add_document(
+            doc_id=payload["doc_id"],
+            title=payload["title"],
+            content=payload["content"],
+            chunks=payload["chunks"],
+            embeddings=self._embeddings(payload, data),
+            defer=payload.get("defer", False)
+        )
+        self._publish()
+        return {"document": document_metadata(document)}, b""
+
+    def _update_document(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        changes = self.store.update_document(
+            doc_id=payload["doc_id"],
+            title=payload["title"],
+            content=payload["content"],
+            chunks=payload["chunks"],
+            embeddings=self._embeddings(payload, data)
+        )
+        self._publish()
+        return {"changes": changes}, b""
+
+    def _delete_document(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        deleted = self.store.delete_document(payload["doc_id"])
+        if deleted:
+            self._publish()
+        return {"deleted": deleted}, b""
+
+    def _clear(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        self.store.clear()
+        self._publish()
+        return {}, b""
+
+    def _attach_embeddings(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        contents = payload["contents"]
+        vectors = np.frombuffer(data, dtype=np.float32).reshape(len(contents), payload["dim"]) if contents else []
+        attached = self.store.attach_embeddings(payload["doc_id"], contents, list(vectors))
+        if attached:
+            self._publish()
+        return {"attached": attached}, b""
+
+    def _mark_indexing_failed(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        self.store.mark_indexing_failed(payload["doc_id"], payload["error"])
+        self._publish()
+        return {}, b""
+
+    def _export_state(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        """完整的快照（文檔含內容）與各文檔的片段引用，用於匯出封存檔"""
+        snapshot, refs = self.store.export_state()
+        result = self._state(snapshot)
+        result.update(
+            documents=snapshot.documents,
+            chunks=snapshot.chunks,
+            pending=[chunk for chunk, _ in snapshot.pending],
+            refs=refs
+        )
+        return result, b""
+
+    def _import_documents(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        embeddings = np.frombuffer(data, dtype=np.float32).reshape(payload["embedded"], payload["dim"])
+        result = self.store.import_documents(payload["documents"], payload["texts"], embeddings, payload["refs"])
+        self._publish()
+        return {"result": result}, b""
+
+    def _near_duplicates(self, payload: Dict, data: bytes) -> Tuple[Dict, bytes]:
+        return {"documents": self.store.find_near_duplicates(payload["content"], payload.get("threshold"))}, b""
+
+    def dispatch(self, code: int, payload: Dict, data: bytes) -> bytes:
+        """執行一個請求並編碼回應"""
+        name = OP_NAMES.get(code)
+        if name is None:
+            return encode_frame(STATUS_ERROR, {"type": "ValueError", "error": f"未知的操作碼: {code}"})
+        self.requests[name] += 1
+        try:
+            result, binary = getattr(self, f"_{name}")(payload, data)
+        except Exception as e:
+            # 任何錯誤都以錯誤回應送回用戶端，不中斷連線
+            if not isinstance(e, (KeyError, TypeError, ValueError)):
+                logger.exception(f"Index server {name} failed")
+            return encode_frame(STATUS_ERROR, {"type": type(e).__name__, "error": str(e)})
+        return encode_frame(STATUS_OK, result, binary)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                code, payload, data = await read_frame(reader)
+                writer.write(self.dispatch(code, payload, data))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # ============ 生命週期 ============
+
+    async def serve(self):
+        """啟動服務直到收到 SIGINT / SIGTERM"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        # 只允許同一使用者的行程連線
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Index server listening on {self.socket_path} (shared memory prefix {self.prefix})")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        """停止服務並釋放共享記憶體"""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        CONTROL.pack_into(self.control.buf, 0, CLOSED_VERSION)
+        self.store.clear()
+        self._published = self.store.snapshot()
+        for segment, _ in self._segments:
+            segment.unlink()
+            self._retired.append(segment)
+        self._segments.clear()
+        self._release_retired()
+        self.control.close()
+        self.control.unlink()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        logger.info(f"Index server stopped: {self.requests}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG 索引服務")
+    parser.add_argument("--socket", default=INDEX_SERVER_SOCKET or "/tmp/rag_index.sock", help="Unix socket 路徑")
+    args = parser.parse_args()
+    asyncio.run(IndexServer(args.socket).serve())
@@ -0,0 +1,49 @@
+"""
+詞彙比對搜尋
+尚未生成嵌入向量的片段以字元 bigram 與查詢比對，作為向量搜尋的暫時替代
+"""
+import heapq
+from typing import FrozenSet, List, Sequence, Tuple
+
+
+def char_bigrams(text: str) -> FrozenSet[str]:
+    """文字（去除空白、轉小寫）的相鄰字元組合；中文不需斷詞即可比對"""
+    compact = "".join(text.lower().split())
+    if len(compact) < 2:
+        return frozenset([compact]) if compact else frozenset()
+    return frozenset(compact[i:i + 2] for i in range(len(compact) - 1))
+
+
+def lexical_top_k(
+    pending: Sequence[Tuple[dict, FrozenSet[str]]],
+    query_text: str,
+    top_k: int,
+    scale: float = 1.0
+) -> List[dict]:
+    """
+    依查詢的 bigram 在片段中出現的比例排序
+
+    Args:
+        pending: (片段, 片段的 bigram) 列表
+        query_text: 查詢文字
+        top_k: 返回的片段數
+        scale: 比對比例換算為 score 的倍數（與向量結果合併時為最高的餘弦分數）
+
+    Returns:
+        片段列表，lexical_score 為 0 到 1 的比對比例，score 為比對比例乘以 scale，match 為 lexical
+    """
+    query = char_bigrams(query_text)
+    if not query or not pending or top_k <= 0:
+        return []
+    scored = (
+        (len(query & grams) / len(query), -i)
+        for i, (_, grams) in enumerate(pending)
+    )
+    results = []
+    for score, negative_index in heapq.nlargest(top_k, (item for item in scored if item[0] > 0)):
+        chunk = pending[-negative_index][0].copy()
+        chunk["score"] = score * scale
+        chunk["lexical_score"] = score
+        chunk["match"] = "lexical"
+        results.append(chunk)
+    return results
@@ -0,0 +1,38 @@
+"""
+最大邊際相關性（MMR）重新排序
+從候選片段中依序挑選與查詢相關、且與已挑選片段不重複的片段，避免同一段落的重疊片段佔滿結果
+"""
+import numpy as np
+
+
+def mmr_select(vectors: np.ndarray, relevance: np.ndarray, k: int, mmr_lambda: float) -> np.ndarray:
+    """
+    以 MMR 從候選中挑選 k 個
+
+    候選之間的相似度一次以矩陣乘法算出，每次挑選只做向量運算，
+    成本為 O(n² × dim)（相似度矩陣）加上 O(k × n)，n 為數百時遠小於搜尋本身。
+
+    Args:
+        vectors: 候選片段的正規化向量（n × dim）
+        relevance: 候選與查詢的相似度（n）
+        k: 挑選數量
+        mmr_lambda: 相關度的權重（1 為只看相關度，0 為只看多樣性）
+
+    Returns:
+        依挑選順序排列的候選索引
+    """
+    n = len(vectors)
+    k = min(k, n)
+    similarity = vectors @ vectors.T
+    relevance = mmr_lambda * np.asarray(relevance, dtype=np.float32)
+    # 與已挑選片段的最大相似度；初始值 -1 對所有候選相同，第一次挑選即為最相關的片段
+    redundancy = np.full(n, -1.0, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        scores = np.where(available, relevance - (1.0 - mmr_lambda) * redundancy, -np.inf)
+        chosen = int(np.argmax(scores))
+        selected[step] = chosen
+        available[chosen] = False
+        np.maximum(redundancy, similarity[chosen], out=redundancy)
+    return selected
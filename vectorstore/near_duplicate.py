@@ -0,0 +1,117 @@
+"""
+近似重複文檔偵測
+以文字 shingle 的 MinHash 簽章估計 Jaccard 相似度，並用 LSH 分帶建立桶索引：
+查詢只比對至少一個分帶完全相同的文檔，成本與知識庫大小無關
+"""
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import NEAR_DUPLICATE_THRESHOLD, MINHASH_PERMUTATIONS, MINHASH_BANDS
+
+SHINGLE_CHARS = 5  # 每個 shingle 的字數（中文以字元為單位較穩定）
+SIGNATURE_BLOCK = 2048  # 每次計算的 shingle 數，限制暫存矩陣的大小
+
+_FNV_PRIME = np.uint64(1099511628211)
+_SHIFT = np.uint64(32)
+_MAX = np.iinfo(np.uint64).max
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_CHARS) -> np.ndarray:
+    """將文字（空白正規化後）切成連續 size 字的 shingle，返回不重複的 64 位元雜湊"""
+    codes = np.frombuffer(" ".join(text.split()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if not len(codes):
+        return np.zeros(0, dtype=np.uint64)
+    size = min(size, len(codes))
+    count = len(codes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * _FNV_PRIME + codes[offset:offset + count]
+    return np.unique(hashes)
+
+
+class MinHashIndex:
+    """
+    MinHash-LSH 索引
+
+    簽章長度為 permutations，分成 bands 個分帶；兩份文檔任一分帶完全相同即成為候選，
+    再以簽章的相同比例估計相似度。相似度 s 成為候選的機率為 1 - (1 - s^r)^bands（r 為每帶列數）。
+    """
+
+    def __init__(
+        self,
+        permutations: int = MINHASH_PERMUTATIONS,
+        bands: int = MINHASH_BANDS,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        seed: int = 1
+    ):
+        if permutations % bands:
+            raise ValueError(f"MinHash 簽章長度 {permutations} 無法平均分成 {bands} 個分帶")
+        self.permutations = permutations
+        self.bands = bands
+        self.rows = permutations // bands
+        self.threshold = threshold
+        # 固定種子：不同行程計算的簽章可以互相比較
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, permutations, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, permutations, dtype=np.uint64)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def signature(self, text: str) -> np.ndarray:
+        """計算文字的 MinHash 簽章"""
+        hashes = shingle_hashes(text)
+        signature = np.full(self.permutations, _MAX, dtype=np.uint64)
+        for start in range(0, len(hashes), SIGNATURE_BLOCK):
+            block = hashes[start:start + SIGNATURE_BLOCK]
+            permuted = (self._a[:, None] * block[None, :] + self._b[:, None]) >> _SHIFT
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+        return signature
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, key: str, signature: np.ndarray):
+        """加入一份文檔的簽章"""
+        with self._lock:
+            self._signatures[key] = signature
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        """移除一份文檔"""
+        with self._lock:
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                return
+            for band_key in self._band_keys(signature):
+                bucket = self._buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band_key]
+
+    def query(self, signature: np.ndarray, threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        查詢近似重複的文檔
+
+        Returns:
+            (文檔 ID, 估計的 Jaccard 相似度) 列表，依相似度由高到低排序
+        """
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates |= self._buckets.get(band_key, set())
+            scored = [(key, float(np.mean(self._signatures[key] == signature))) for key in candidates]
+        return sorted((item for item in scored if item[1] >= threshold), key=lambda item: (-item[1], item[0]))
+
+    def clear(self):
+        with self._lock:
+            self._signatures.clear()
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
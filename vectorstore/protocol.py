@@ -0,0 +1,94 @@
+"""
+索引服務的二進位協定
+每個訊息為固定長度的標頭加上兩段內容：
+- 標頭：操作碼或狀態碼（1 byte）、JSON 長度（4 bytes）、二進位長度（4 bytes），big-endian
+- JSON：參數或結果（UTF-8）
+- 二進位：向量等大量數值，直接以 float32 原始位元組傳送，不經 JSON 編碼
+"""
+import asyncio
+import json
+import socket
+import struct
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+HEADER = struct.Struct(">BII")
+CONTROL = struct.Struct(">Q")  # 共享記憶體控制區塊：目前的索引版本
+
+OPS = {
+    "hello": 1,
+    "snapshot": 2,
+    "search": 3,
+    "add_document": 4,
+    "delete_document": 5,
+    "clear": 6,
+    "near_duplicates": 7,
+    "update_document": 8,
+    "attach_embeddings": 9,
+    "mark_indexing_failed": 10,
+    "export_state": 11,
+    "import_documents": 12,
+    "get_document": 13,
+}
+OP_NAMES = {code: name for name, code in OPS.items()}
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+CLOSED_VERSION = 2 ** 64 - 1  # 服務關閉時寫入控制區塊，通知用戶端重新連線
+
+Frame = Tuple[int, Dict, bytes]
+
+
+def encode_frame(code: int, payload: Dict = None, data: bytes = b"") -> bytes:
+    """編碼一個訊息"""
+    body = json.dumps(payload or {}, ensure_ascii=False).encode("utf-8")
+    return HEADER.pack(code, len(body), len(data)) + body + data
+
+
+def _decode(code: int, body: bytes, data: bytes) -> Frame:
+    return code, json.loads(body) if body else {}, data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Frame:
+    """從串流讀取一個訊息（連線關閉時拋出 asyncio.IncompleteReadError）"""
+    code, body_len, data_len = HEADER.unpack(await reader.readexactly(HEADER.size))
+    body = await reader.readexactly(body_len)
+    data = await reader.readexactly(data_len)
+    return _decode(code, body, data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("索引服務已關閉連線")
+        received += n
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> Frame:
+    """從 socket 讀取一個訊息（阻塞）"""
+    code, body_len, data_len = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    body = _recv_exactly(sock, body_len)
+    data = _recv_exactly(sock, data_len)
+    return _decode(code, body, data)
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    連接既有的共享記憶體區段，且不交給本行程的 resource tracker 管理
+
+    Python 3.13 之前連接區段也會註冊到 resource tracker，
+    行程結束時會把索引服務擁有的區段刪除，因此需取消註冊。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
@@ -0,0 +1,104 @@
+"""
+降維粗搜尋
+以 PCA 或隨機投影將向量降到少數維度，搜尋先掃描降維後的矩陣選出候選片段，
+再以完整向量重新計分，減少每次搜尋需要讀取的記憶體
+"""
+from typing import Optional
+
+import numpy as np
+
+FIT_SAMPLE_ROWS = 10000  # PCA 擬合使用的最多列數
+PROJECT_BLOCK_ROWS = 65536  # 投影時每次處理的列數（限制暫存記憶體）
+
+
+def fit_projection(matrix: np.ndarray, dims: int, method: str = "pca", seed: int = 0):
+    """
+    擬合降維投影
+
+    Args:
+        matrix: 正規化後的向量矩陣
+        dims: 降維後的維度
+        method: pca（以抽樣的向量計算主成分）或 random（正交化的隨機投影）
+        seed: 抽樣與隨機投影的種子
+
+    Returns:
+        (平均向量, 投影矩陣 dim × dims)
+    """
+    rng = np.random.default_rng(seed)
+    dim = matrix.shape[1]
+    dims = min(dims, dim)
+    if method == "random":
+        components, _ = np.linalg.qr(rng.standard_normal((dim, dims)).astype(np.float32))
+        return np.zeros(dim, dtype=np.float32), components.astype(np.float32)
+    if method != "pca":
+        raise ValueError(f"未知的降維方法: {method}")
+    rows = len(matrix)
+    sample = matrix if rows <= FIT_SAMPLE_ROWS else matrix[np.sort(rng.choice(rows, FIT_SAMPLE_ROWS, replace=False))]
+    mean = sample.mean(axis=0)
+    centered = sample - mean
+    # 共變異數矩陣只有 dim × dim，特徵分解比對樣本做 SVD 省記憶體
+    eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+    components = eigenvectors[:, np.argsort(eigenvalues)[::-1][:dims]]
+    return mean.astype(np.float32), np.ascontiguousarray(components, dtype=np.float32)
+
+
+class ReducedIndex:
+    """
+    前 rows 列向量的降維副本（不可變，與快照一起發布）
+
+    投影前減去平均向量：查詢與 (x - mean) 的內積只比與 x 的內積少一個對所有片段相同的常數，
+    排序不變，因此查詢本身不需要減去平均向量。
+    """
+
+    __slots__ = ("mean", "components", "matrix")
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, matrix: np.ndarray):
+        self.mean = mean
+        self.components = components
+        self.matrix = matrix
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, dims: int, method: str = "pca") -> "ReducedIndex":
+        """擬合投影並將 matrix 的所有列降維"""
+        mean, components = fit_projection(matrix, dims, method)
+        reduced = np.empty((len(matrix), components.shape[1]), dtype=np.float32)
+        offset = mean @ components
+        for start in range(0, len(matrix), PROJECT_BLOCK_ROWS):
+            block = matrix[start:start + PROJECT_BLOCK_ROWS]
+            reduced[start:start + len(block)] = block @ components - offset
+        reduced.flags.writeable = False
+        return cls(mean, components, reduced)
+
+    @property
+    def rows(self) -> int:
+        return len(self.matrix)
+
+    @property
+    def dims(self) -> int:
+        return self.components.shape[1]
+
+    def filter(self, keep: np.ndarray) -> "ReducedIndex":
+        """矩陣刪除列後，對應刪除降維副本的列（keep 為完整矩陣的保留遮罩）"""
+        matrix = self.matrix[keep[:self.rows]]
+        matrix.flags.writeable = False
+        return ReducedIndex(self.mean, self.components, matrix)
+
+    def candidates(self, query: np.ndarray, count: int, total: int) -> Optional[np.ndarray]:
+        """
+        以降維矩陣選出候選片段列（遞增排序），尚未降維的後段列全部列入候選
+
+        Args:
+            query: 正規化後的查詢向量
+            count: 由降維矩陣選出的候選數
+            total: 完整矩陣的列數
+
+        Returns:
+            候選片段列；候選數不少於列數（不需要篩選）時返回 None
+        """
+        if count >= self.rows:
+            return None
+        scores = self.matrix @ (query @ self.components)
+        rows = np.sort(np.argpartition(-scores, count - 1)[:count])
+        if total > self.rows:
+            rows = np.concatenate([rows, np.arange(self.rows, total)])
+        return rows
@@ -0,0 +1,333 @@
+"""
+索引服務用戶端
+與 VectorStore 介面相同；修改經由 Unix socket 送到索引服務，
+搜尋則直接掃描共享記憶體中的向量矩陣。索引版本改變時只取得自己版本之後的差異套用到本地的快照，
+向量緩衝區仍是同一個區段時只擴大既有的視圖；快照中的文檔不含內容，以 get_document 取得
+"""
+import socket
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from config import VECTOR_SEARCH_SHARDS, VECTOR_PREFILTER_DOCUMENTS
+from vectorstore.store import (
+    THREAD_SEARCH_MIN_CHUNKS, MissingEmbeddingError, _normalize, search_snapshot, missing_contents
+)
+from vectorstore.lexical import char_bigrams
+from vectorstore.centroids import DocumentIndex
+from vectorstore.protocol import (
+    OPS, STATUS_OK, CONTROL, encode_frame, recv_frame, attach_shared_memory
+)
+from utils.executor import run_in_thread
+
+_ERROR_TYPES = {
+    "ValueError": ValueError, "KeyError": KeyError, "TypeError": TypeError,
+    "MissingEmbeddingError": MissingEmbeddingError
+}
+
+
+def _pending_items(chunks: List[dict]) -> List[Tuple[dict, frozenset]]:
+    return [(chunk, char_bigrams(chunk["content"])) for chunk in chunks]
+
+
+class _Snapshot:
+    """某個索引版本的文檔（不含內容）、片段與共享的向量矩陣"""
+
+    def __init__(self, key: Tuple, documents: Dict, chunks: List[dict], matrix: np.ndarray,
+                 pending: Tuple[Tuple[dict, frozenset], ...] = (), hashes: Optional[set] = None):
+        self.key = key  # (控制區塊名稱, 版本)：索引服務重新啟動後版本會重新計數
+        self.documents = documents
+        self.chunks = chunks
+        self.matrix = matrix
+        self.pending = pending
+        self.reduced = None  # 用戶端直接掃描共享記憶體中的完整向量，不使用降維副本
+        self._hashes = hashes
+        self._doc_index = None
+
+    @property
+    def hashes(self) -> set:
+        """此版本所有片段的內容雜湊（第一次使用時建立）"""
+        if self._hashes is None:
+            self._hashes = {chunk["hash"] for chunk in self.chunks}
+        return self._hashes
+
+    @property
+    def doc_index(self) -> DocumentIndex:
+        """此版本的文檔質心索引（第一次使用時依片段的 document_ids 建立）"""
+        if self._doc_index is None:
+            self._doc_index = DocumentIndex.build(self.matrix, self.chunks)
+        return self._doc_index
+
+
+class RemoteVectorStore:
+    """索引服務的 VectorStore 代理"""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0, shards: int = VECTOR_SEARCH_SHARDS,
+                 prefilter: int = VECTOR_PREFILTER_DOCUMENTS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.shards = shards
+        self.prefilter = prefilter
+        self._lock = threading.RLock()
+        self._sock: Optional[socket.socket] = None
+        self._control = None
+        self._snapshot = _Snapshot((None, -1), {}, [], np.zeros((0, 0), dtype=np.float32))
+        self._segment = None  # 目前連接的向量緩衝區區段
+        self._retired: List = []
+
+    # ============ 連線與協定 ============
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._sock = sock
+        result, _ = self._request("hello")
+        if self._control is not None:
+            self._control.close()
+        self._control = attach_shared_memory(result["control"])
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _request(self, op: str, payload: Dict = None, data: bytes = b"") -> Tuple[Dict, bytes]:
+        self._sock.sendall(encode_frame(OPS[op], payload, data))
+        status, result, binary = recv_frame(self._sock)
+        if status != STATUS_OK:
+            raise _ERROR_TYPES.get(result.get("type"), RuntimeError)(result.get("error"))
+        return result, binary
+
+    def _call(self, op: str, payload: Dict = None, data: bytes = b"") -> Tuple[Dict, bytes]:
+        """送出請求；連線中斷時重新連線一次"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._request(op, payload, data)
+                except (OSError, ConnectionError) as e:
+                    self._disconnect()
+                    if attempt:
+                        raise HTTPException(status_code=503, detail=f"無法連接索引服務: {e}")
+
+    def _cached(self) -> Optional[_Snapshot]:
+        """本地快照仍是最新版本時返回快照（只讀取共享的控制區塊，不經由 socket）；否則返回 None"""
+        control, snapshot = self._control, self._snapshot
+        if control is not None and (control.name, CONTROL.unpack_from(control.buf, 0)[0]) == snapshot.key:
+            return snapshot
+        return None
+
+    def _current(self) -> _Snapshot:
+        """返回最新的快照；控制區塊的版本改變時才重新取得"""
+        with self._lock:
+            if self._control is None:
+                self._call("hello")
+            key = (self._control.name, CONTROL.unpack_from(self._control.buf, 0)[0])
+            if key == self._snapshot.key:
+                return self._snapshot
+            # 同一個索引服務只取得目前版本之後的差異
+            known, version = self._snapshot.key
+            result, _ = self._call("snapshot", {"control": known, "since": version})
+            self._load(result)
+            return self._snapshot
+
+    def _matrix(self, result: Dict) -> np.ndarray:
+        """共享記憶體中前 rows 列的唯讀視圖；區段改變時連接新的區段"""
+        rows, dim = result["shape"]
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self._segment is None or self._segment.name.lstrip("/") != result["segment"].lstrip("/"):
+            segment = attach_shared_memory(result["segment"])
+            if self._segment is not None:
+                self._retired.append(self._segment)
+            self._segment = segment
+            self._release_retired()
+        matrix = np.ndarray((rows, dim), dtype=np.float32, buffer=self._segment.buf)
+        matrix.flags.writeable = False
+        return matrix
+
+    def _load(self, result: Dict):
+        key = (self._control.name, result["version"])
+        matrix = self._matrix(result)
+        if "deltas" not in result:
+            self._snapshot = _Snapshot(
+                key, result["documents"], result["chunks"], matrix, tuple(_pending_items(result["pending"]))
+            )
+            return
+        current = self._snapshot
+        documents, chunks, pending = current.documents, current.chunks, current.pending
+        hashes = current._hashes
+        for delta in result["deltas"]:
+            documents, chunks, pending, hashes = self._apply_delta(delta, documents, chunks, pending, hashes)
+        self._snapshot = _Snapshot(key, documents, chunks, matrix, pending, hashes)
+
+    @staticmethod
+    def _apply_delta(delta: Dict, documents: Dict, chunks: List[dict], pending: Tuple, hashes: Optional[set]):
+        """套用一個版本的差異（不修改舊快照的內容；差異格式見 index_server.diff_snapshots）"""
+        if "documents" in delta:
+            documents = dict(documents)
+            for doc_id in delta["removed_documents"]:
+                documents.pop(doc_id, None)
+            documents.update(delta["documents"])
+
+        if "appended_chunks" in delta:
+            removed = delta.get("removed_chunks")
+            if removed:
+                dropped = set(removed)
+                if hashes is not None:
+                    hashes = hashes - {chunks[i]["hash"] for i in dropped}
+                chunks = [chunk for i, chunk in enumerate(chunks) if i not in dropped]
+            else:
+                chunks = list(chunks)
+            for i, chunk in delta["changed_chunks"]:
+                chunks[i] = chunk
+            appended = delta["appended_chunks"]
+            chunks.extend(appended)
+            if hashes is not None and appended:
+                hashes = hashes | {chunk["hash"] for chunk in appended}
+
+        if "added_pending" in delta:
+            removed = set(delta["removed_pending"])
+            pending = tuple(
+                [item for i, item in enumerate(pending) if i not in removed] + _pending_items(delta["added_pending"])
+            )
+        return documents, chunks, pending, hashes
+
+    def _release_retired(self):
+        """關閉舊的區段（仍有搜尋使用中的區段留待下次）"""
+        still_used = []
+        for segment in self._retired:
+            try:
+                segment.close()
+            except BufferError:
+                still_used.append(segment)
+        self._retired = still_used
+
+    # ============ VectorStore 介面 ============
+
+    @property
+    def documents(self) -> Dict[str, dict]:
+        return self._current().documents
+
+    @property
+    def chunks(self) -> List[dict]:
+        return self._current().chunks
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._current().matrix
+
+    @property
+    def pending(self) -> Tuple[Tuple[dict, frozenset], ...]:
+        return self._current().pending
+
+    def get_document(self, doc_id: str) -> Optional[dict]:
+        """返回完整的文檔（含內容，由索引服務取得）；不存在時返回 None"""
+        result, _ = self._call("get_document", {"doc_id": doc_id})
+        return result["document"]
+
+    def pending_chunks(self, doc_id: str) -> List[str]:
+        """返回文檔尚未生成向量的片段內容"""
+        return [chunk["content"] for chunk, _ in self._current().pending if chunk["document_id"] == doc_id]
+
+    def attach_embeddings(self, doc_id: str, contents: List[str], embeddings: List[List[float]]) -> bool:
+        """為延後嵌入的片段補上向量（參數同 VectorStore.attach_embeddings）"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        result, _ = self._call("attach_embeddings", {"doc_id": doc_id, "contents": contents, "dim": dim}, vectors.tobytes())
+        return result["attached"]
+
+    def mark_indexing_failed(self, doc_id: str, error: str):
+        """記錄延後嵌入失敗"""
+        self._call("mark_indexing_failed", {"doc_id": doc_id, "error": error})
+
+    def find_near_duplicates(self, content: str, threshold: Optional[float] = None) -> List[dict]:
+        """查詢近似重複的文檔（由索引服務計算）"""
+        result, _ = self._call("near_duplicates", {"content": content, "threshold": threshold})
+        return result["documents"]
+
+    def missing_chunks(self, chunks: List[str]) -> List[str]:
+        """返回知識庫中尚未存在的片段內容（依目前的快照判斷）"""
+        return missing_contents(chunks, self._current().hashes)
+
+    def _write(self, op: str, doc_id: str, title: str, content: str, chunks: List[str],
+               embeddings: List[Optional[List[float]]], **extra) -> Dict:
+        """送出新增或更新文檔的請求；只傳送非 None 的向量"""
+        embedded = [embedding is not None for embedding in embeddings]
+        vectors = np.asarray([e for e in embeddings if e is not None], dtype=np.float32)
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        result, _ = self._call(
+            op,
+            {"doc_id": doc_id, "title": title, "content": content, "chunks": chunks, "embedded": embedded, "dim": dim, **extra},
+            vectors.tobytes()
+        )
+        return result
+
+    def add_document(self, doc_id: str, title: str, content: str, chunks: List[str],
+                     embeddings: List[Optional[List[float]]], defer: bool = False) -> dict:
+        """添加文檔（參數同 VectorStore.add_document），返回存入的文檔（以預覽取代完整內容）"""
+        return self._write("add_document", doc_id, title, content, chunks, embeddings, defer=defer)["document"]
+
+    def update_document(self, doc_id: str, title: str, content: str, chunks: List[str],
+                        embeddings: List[Optional[List[float]]]) -> Dict[str, int]:
+        """以新的內容取代文檔（參數同 VectorStore.update_document）"""
+        return self._write("update_document", doc_id, title, content, chunks, embeddings)["changes"]
+
+    def import_documents(self, documents: List[dict], texts: List[str], embeddings: np.ndarray,
+                         refs: List[List[int]]) -> Dict:
+        """批次新增文檔（參數同 VectorStore.import_documents）"""
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("嵌入向量數量或維度不正確")
+        result, _ = self._call(
+            "import_documents",
+            {"documents": documents, "texts": texts, "refs": refs, "embedded": vectors.shape[0], "dim": vectors.shape[1]},
+            vectors.tobytes()
+        )
+        return result["result"]
+
+    def export_state(self) -> Tuple[_Snapshot, Dict[str, List[str]]]:
+        """返回最新的完整快照（文檔含內容）與各文檔依序引用的片段內容雜湊（兩者為同一版本）"""
+        with self._lock:
+            result, _ = self._call("export_state")
+            snapshot = _Snapshot(
+                (self._control.name, result["version"]), result["documents"], result["chunks"],
+                self._matrix(result), tuple(_pending_items(result["pending"]))
+            )
+            return snapshot, result["refs"]
+
+    def delete_document(self, doc_id: str) -> bool:
+        """刪除文檔"""
+        result, _ = self._call("delete_document", {"doc_id": doc_id})
+        return result["deleted"]
+
+    def search(self, query_embedding: List[float], top_k: int = 5, query_text: Optional[str] = None,
+               mmr_lambda: Optional[float] = None) -> List[dict]:
+        """在共享記憶體的向量矩陣上搜尋（參數同 VectorStore.search）"""
+        snapshot = self._current()
+        query = _normalize(np.asarray([query_embedding], dtype=np.float32))[0]
+        return search_snapshot(snapshot, query, top_k, query_text, self.shards, self.prefilter, mmr_lambda=mmr_lambda)
+
+    async def asearch(self, query_embedding: List[float], top_k: int = 5, query_text: Optional[str] = None,
+                      mmr_lambda: Optional[float] = None) -> List[dict]:
+        """非同步搜尋：需要向索引服務取得新版本或片段數量大時在執行緒池執行"""
+        snapshot = self._cached()
+        if snapshot is None:
+            return await run_in_thread(self.search, query_embedding, top_k, query_text, mmr_lambda)
+        if len(snapshot.chunks) + len(snapshot.pending) < THREAD_SEARCH_MIN_CHUNKS:
+            return self.search(query_embedding, top_k, query_text, mmr_lambda)
+        return await run_in_thread(self.search, query_embedding, top_k, query_text, mmr_lambda)
+
+    def clear(self):
+        """清空所有數據"""
+        self._call("clear")
+
+    def count_chunks(self) -> int:
+        return len(self.chunks)
+
+    def count_documents(self) -> int:
+        return len(self.documents)
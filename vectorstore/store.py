@@ -2,20 +2,436 @@
 向量資料庫實現
 提供文檔存儲、向量搜索等功能
 """
-from typing import List, Dict
+import hashlib
+import heapq
+import itertools
+import threading
+from concurrent.futures import Executor
+from typing import Callable, List, Dict, Optional, Tuple
 from datetime import datetime
-import math
+
+import numpy as np
+
+from config import (
+    VECTOR_SEARCH_SHARDS, VECTOR_SHARD_MIN_CHUNKS, VECTOR_PREFILTER_DOCUMENTS, VECTOR_PREFILTER_MIN_CHUNKS,
+    VECTOR_REDUCED_DIMS, VECTOR_REDUCTION_METHOD, VECTOR_RERANK_CANDIDATES, VECTOR_REDUCTION_MIN_CHUNKS,
+    VECTOR_REFIT_GROWTH, MMR_CANDIDATES
+)
+from utils.debug_logger import logger
+from utils.executor import run_in_thread, search_pool, thread_pool
+from vectorstore.near_duplicate import MinHashIndex
+from vectorstore.centroids import DocumentIndex
+from vectorstore.reduction import ReducedIndex
+from vectorstore.mmr import mmr_select
+from vectorstore.lexical import char_bigrams, lexical_top_k
+
+# 片段數達此數量時，搜尋改在執行緒池執行（NumPy 矩陣運算會釋放 GIL）
+THREAD_SEARCH_MIN_CHUNKS = 2000
+# 向量緩衝區的最小容量（列數），容量不足時加倍
+MIN_BUFFER_ROWS = 1024
+# 文檔列表與索引服務快照中預覽的字數
+PREVIEW_CHARS = 100
+# _publish 的預設參數：沿用目前快照的內容
+_UNCHANGED = object()
+
+
+class MissingEmbeddingError(ValueError):
+    """片段內容不在知識庫中且未提供嵌入向量（如沿用的片段在生成嵌入期間被其他請求刪除）"""
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """將每列向量正規化為單位長度（零向量維持為零）"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def content_hash(text: str) -> str:
+    """片段內容的雜湊，內容完全相同的片段共用同一個向量"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def missing_contents(chunks: List[str], known) -> List[str]:
+    """返回雜湊不在 known 中的片段內容（去除重複，保持順序）"""
+    seen = set()
+    missing = []
+    for chunk in chunks:
+        digest = content_hash(chunk)
+        if digest not in known and digest not in seen:
+            seen.add(digest)
+            missing.append(chunk)
+    return missing
+
+
+def _empty_matrix() -> np.ndarray:
+    return np.zeros((0, 0), dtype=np.float32)
+
+
+def _allocate_buffer(rows: int, dim: int) -> np.ndarray:
+    return np.empty((rows, dim), dtype=np.float32)
+
+
+def document_preview(document: dict) -> str:
+    """文檔內容的預覽（索引服務快照中的文檔不含 content，只有 preview）"""
+    content = document.get("content")
+    if content is None:
+        return document.get("preview", "")
+    return content[:PREVIEW_CHARS] + "..." if len(content) > PREVIEW_CHARS else content
+
+
+class Snapshot:
+    """
+    知識庫某一版本的不可變視圖
+
+    發布後不再修改：讀取端取得後即可在任何執行緒使用，不需要鎖。
+    """
+
+    __slots__ = ("version", "documents", "chunks", "matrix", "pending", "doc_index", "reduced")
+
+    def __init__(
+        self,
+        version: int,
+        documents: Dict[str, dict],
+        chunks: List[dict],
+        matrix: np.ndarray,
+        pending: Tuple[Tuple[dict, frozenset], ...] = (),
+        doc_index: Optional[DocumentIndex] = None,
+        reduced: Optional[ReducedIndex] = None
+    ):
+        self.version = version
+        self.documents = documents
+        self.chunks = chunks
+        self.matrix = matrix
+        self.pending = pending  # 尚未生成向量的片段與其 bigram（只能以詞彙比對搜尋）
+        self.doc_index = DocumentIndex.empty() if doc_index is None else doc_index  # 文檔質心（搜尋前篩選文檔）
+        self.reduced = reduced  # 前 reduced.rows 列的降維副本（粗搜尋用）
+
+
+def _shard_bounds(rows: int, shards: int, min_rows: int = VECTOR_SHARD_MIN_CHUNKS) -> List[Tuple[int, int]]:
+    """將 rows 列切成最多 shards 個連續區段，每段至少 min_rows 列"""
+    count = max(1, min(shards, rows // max(1, min_rows)))
+    edges = np.linspace(0, rows, count + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _scan(matrix: np.ndarray, query: np.ndarray, k: int, offset: int) -> List[Tuple[float, int]]:
+    """掃描一個分片，返回依分數由高到低（同分依索引）排序的 (分數, 全域索引)"""
+    scores = matrix @ query
+    k = min(k, len(scores))
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    # 分數相同時依加入順序排列
+    order = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return [(float(scores[i]), int(i) + offset) for i in order]
+
+
+def _ranked(
+    matrix: np.ndarray,
+    query: np.ndarray,
+    top_k: int,
+    shards: int = 1,
+    pool: Optional[Executor] = None,
+    min_rows: int = VECTOR_SHARD_MIN_CHUNKS,
+    rows: Optional[np.ndarray] = None
+) -> List[Tuple[float, int]]:
+    """
+    計算餘弦相似度，返回分數最高的 k 個 (分數, 列號)
+
+    shards 大於 1 時將矩陣依列切成多個分片（只建立視圖，不複製），
+    在執行緒池平行掃描後以 heap 合併各分片的前 k 名。
+    提供 rows（遞增排序）時只為這些列計分。
+    """
+    if top_k <= 0 or not len(matrix):
+        return []
+    bounds = _shard_bounds(len(matrix), shards, min_rows)
+    if rows is not None:
+        return [(score, int(rows[i])) for score, i in _scan(matrix[rows], query, top_k, 0)] if len(rows) else []
+    if len(bounds) == 1:
+        return _scan(matrix, query, top_k, 0)
+    pool = pool or search_pool
+    futures = [pool.submit(_scan, matrix[start:stop], query, top_k, start) for start, stop in bounds]
+    ranked = heapq.merge(*[f.result() for f in futures], key=lambda item: (-item[0], item[1]))
+    return list(itertools.islice(ranked, top_k))
+
+
+def _results(chunks: List[dict], ranked) -> List[dict]:
+    results = []
+    for score, i in ranked:
+        chunk = chunks[i].copy()
+        chunk["score"] = score
+        results.append(chunk)
+    return results
+
+
+def _top_k(
+    matrix: np.ndarray,
+    chunks: List[dict],
+    query: np.ndarray,
+    top_k: int,
+    shards: int = 1,
+    pool: Optional[Executor] = None,
+    min_rows: int = VECTOR_SHARD_MIN_CHUNKS,
+    rows: Optional[np.ndarray] = None
+) -> List[dict]:
+    """計算餘弦相似度並取出分數最高的 k 個片段（參數同 _ranked）"""
+    if not chunks:
+        return []
+    return _results(chunks, _ranked(matrix, query, top_k, shards, pool, min_rows, rows))
+
+
+def search_snapshot(
+    snapshot,
+    query: np.ndarray,
+    top_k: int,
+    query_text: Optional[str] = None,
+    shards: int = 1,
+    prefilter: int = 0,
+    prefilter_min_chunks: int = VECTOR_PREFILTER_MIN_CHUNKS,
+    rerank_candidates: int = 0,
+    mmr_lambda: Optional[float] = None,
+    mmr_candidates: int = MMR_CANDIDATES
+) -> List[dict]:
+    """
+    搜尋一個快照：向量片段以餘弦相似度排序；提供 query_text 時，
+    尚未生成向量的片段以詞彙比對計分，兩者依分數合併
+    
+    詞彙比對的比例（0 到 1）與餘弦相似度不能直接比較，合併前乘以向量結果的最高分數：
+    完全比對的片段與最相關的向量片段同分，部分比對的片段依比例排在其後。
+
+    prefilter 大於 0 且片段數達 prefilter_min_chunks 時，先以文檔質心選出 prefilter 個文檔，
+    只為這些文檔的片段計分（近似搜尋）。
+    否則快照有降維副本且 rerank_candidates 大於 0 時，先掃描降維矩陣選出候選片段，
+    再以完整向量重新計分（近似搜尋）。
+    
+    mmr_lambda 小於 1 時，從相似度最高的 mmr_candidates 個片段中以 MMR 挑選 top_k 個，
+    避免內容重疊的片段佔滿結果（score 仍為與查詢的餘弦相似度）。
+    """
+    chunks = snapshot.chunks
+    rows = None
+    if prefilter and len(chunks) >= prefilter_min_chunks:
+        rows = snapshot.doc_index.candidates(query, prefilter)
+    if rows is None and snapshot.reduced is not None and rerank_candidates:
+        rows = snapshot.reduced.candidates(query, max(rerank_candidates, top_k), len(chunks))
+    if not chunks:
+        results = []
+    elif mmr_lambda is not None and mmr_lambda < 1:
+        ranked = _ranked(snapshot.matrix, query, max(top_k, mmr_candidates), shards, rows=rows)
+        candidates = np.fromiter((i for _, i in ranked), dtype=np.int64, count=len(ranked))
+        relevance = np.fromiter((score for score, _ in ranked), dtype=np.float32, count=len(ranked))
+        order = mmr_select(snapshot.matrix[candidates], relevance, top_k, mmr_lambda)
+        results = _results(chunks, [ranked[i] for i in order])
+    else:
+        results = _top_k(snapshot.matrix, chunks, query, top_k, shards, rows=rows)
+    if snapshot.pending and query_text:
+        best = max((r["score"] for r in results), default=0.0)
+        lexical = lexical_top_k(snapshot.pending, query_text, top_k, scale=best if best > 0 else 1.0)
+        results = sorted(results + lexical, key=lambda r: -r["score"])[:top_k]
+    return results
 
 
 class VectorStore:
-    """簡易向量資料庫"""
+    """
+    簡易向量資料庫
+
+    向量以正規化後的 float32 矩陣保存，搜尋為一次矩陣乘法。
+    內容相同的片段（同一文檔或不同文檔中重複的聲明、頁首、範本）只保存一列向量，
+    片段的 document_ids 記錄所有引用它的文檔，搜尋結果因此也不會出現重複的內容。
+
+    所有資料保存在不可變的 Snapshot 中：讀取端直接取得目前的快照，不需要加鎖；
+    寫入端（互相以鎖排序）建立新的快照後一次替換，進行中的搜尋不受影響。
+    片段數量大時可將矩陣分成 shards 個分片平行掃描。
+
+    新增片段時寫入向量緩衝區中尚未被任何快照使用的列，快照只持有緩衝區前 n 列的唯讀視圖，
+    因此新增不需要複製既有的向量；容量不足或刪除時才建立新的緩衝區。
+    
+    另以 MinHash-LSH 索引各文檔的全文，用於上傳時偵測近似重複的文檔。
+    
+    延後嵌入（defer=True）的文檔先以無向量的片段保存，搜尋時以詞彙比對代替；
+    背景佇列以 attach_embeddings 補上向量後，片段即移入矩陣。
+    
+    每個文檔的片段向量質心隨新增、更新與刪除維護；設定 prefilter 時，
+    搜尋先以質心選出最相關的 prefilter 個文檔，只為這些文檔的片段計分。
+    
+    設定 reduced_dims 時，片段數足夠後在背景擬合降維投影並保存降維副本；
+    搜尋先掃描降維矩陣選出 rerank_candidates 個候選，再以完整向量重新計分。
+    之後新增的片段先以完整向量掃描，累積超過 refit_growth 比例時在背景重新擬合。
+    """
+    
+    def __init__(
+        self,
+        shards: int = VECTOR_SEARCH_SHARDS,
+        track_near_duplicates: bool = True,
+        prefilter: int = VECTOR_PREFILTER_DOCUMENTS,
+        reduced_dims: int = VECTOR_REDUCED_DIMS,
+        reduction: str = VECTOR_REDUCTION_METHOD,
+        rerank_candidates: int = VECTOR_RERANK_CANDIDATES,
+        reduction_min_chunks: int = VECTOR_REDUCTION_MIN_CHUNKS,
+        refit_growth: float = VECTOR_REFIT_GROWTH,
+        allocator: Optional[Callable[[int, int], np.ndarray]] = None
+    ):
+        self.shards = shards
+        self.prefilter = prefilter
+        self.reduced_dims = reduced_dims
+        self.reduction = reduction
+        self.rerank_candidates = rerank_candidates
+        self.reduction_min_chunks = reduction_min_chunks
+        self.refit_growth = refit_growth
+        self.near_duplicates: Optional[MinHashIndex] = MinHashIndex() if track_near_duplicates else None
+        # 配置向量緩衝區：(列數, 維度) → float32 陣列（索引服務改為配置在共享記憶體）
+        self.allocator = allocator or _allocate_buffer
+        self._snapshot = Snapshot(0, {}, [], _empty_matrix())
+        self._buffer: Optional[np.ndarray] = None  # 向量緩衝區，前 len(chunks) 列有效
+        self._rows: Dict[str, int] = {}  # 內容雜湊 → 矩陣列
+        self._refs: Dict[str, List[str]] = {}  # 文檔 ID → 依序各片段的內容雜湊
+        self._pending: Dict[str, set] = {}  # 文檔 ID → 尚未生成向量的內容雜湊
+        self._row_epoch = 0  # 矩陣刪除列（既有列號改變）的次數，背景擬合據此判斷結果是否仍適用
+        self._refit_future = None
+        self._write_lock = threading.Lock()
+    
+    # ============ 快照 ============
+    
+    def snapshot(self) -> Snapshot:
+        """返回目前的快照"""
+        return self._snapshot
+    
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+    
+    @property
+    def documents(self) -> Dict[str, dict]:
+        return self._snapshot.documents
+    
+    @property
+    def chunks(self) -> List[dict]:
+        return self._snapshot.chunks
+    
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._snapshot.matrix
+    
+    @property
+    def pending(self) -> Tuple[Tuple[dict, frozenset], ...]:
+        return self._snapshot.pending
+    
+    def get_document(self, doc_id: str) -> Optional[dict]:
+        """返回完整的文檔（含內容）；不存在時返回 None"""
+        return self._snapshot.documents.get(doc_id)
+    
+    def _publish(self, documents: Dict[str, dict], chunks: List[dict], matrix: np.ndarray, pending=None,
+                 doc_index: Optional[DocumentIndex] = None, reduced=_UNCHANGED):
+        """
+        發布新的快照（呼叫端須持有寫入鎖；pending、doc_index 為 None、reduced 未指定時沿用目前的內容）
+        """
+        matrix.flags.writeable = False
+        current = self._snapshot
+        pending = current.pending if pending is None else tuple(pending)
+        self._snapshot = Snapshot(
+            current.version + 1, documents, chunks, matrix, pending,
+            current.doc_index if doc_index is None else doc_index,
+            current.reduced if reduced is _UNCHANGED else reduced
+        )
+        self._schedule_refit()
+    
+    # ============ 降維 ============
+    
+    def _needs_refit(self, snapshot: Snapshot) -> bool:
+        rows = len(snapshot.chunks)
+        if not self.reduced_dims or rows < self.reduction_min_chunks or snapshot.matrix.shape[1] <= self.reduced_dims:
+            return False
+        return snapshot.reduced is None or rows - snapshot.reduced.rows > self.refit_growth * rows
+    
+    def _schedule_refit(self):
+        """需要時在執行緒池擬合降維投影（呼叫端須持有寫入鎖）"""
+        if (self._refit_future is None or self._refit_future.done()) and self._needs_refit(self._snapshot):
+            self._refit_future = thread_pool.submit(self._background_refit)
+    
+    def _background_refit(self):
+        try:
+            self.refit()
+        except Exception as e:
+            logger.warning(f"Vector reduction refit failed: {e}")
+    
+    def refit(self) -> bool:
+        """
+        以目前的向量擬合降維投影並發布降維副本（擬合期間不持有寫入鎖，新增不受影響）
+        
+        Returns:
+            是否發布；擬合期間矩陣刪除了列（列號改變）時捨棄結果，待下次寫入時重新排程
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            epoch = self._row_epoch
+        if not snapshot.chunks or not self.reduced_dims:
+            return False
+        reduced = ReducedIndex.fit(snapshot.matrix, self.reduced_dims, self.reduction)
+        with self._write_lock:
+            if self._row_epoch != epoch:
+                return False
+            # 擬合期間只可能在矩陣之後新增列，降維副本仍對應前 reduced.rows 列
+            current = self._snapshot
+            self._publish(current.documents, current.chunks, current.matrix, reduced=reduced)
+            return True
+    
+    def _document_rows(self, doc_id: str, chunks: List[dict]) -> np.ndarray:
+        """文檔引用且已有向量的矩陣列（呼叫端須持有寫入鎖）"""
+        rows = set()
+        for digest in self._refs.get(doc_id, ()):
+            row = self._rows.get(digest)
+            if row is not None and doc_id in chunks[row]["document_ids"]:
+                rows.add(row)
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
     
-    def __init__(self):
-        self.documents: Dict[str, dict] = {}  # 文檔元數據
-        self.chunks: List[dict] = []  # 所有片段
-        self.embeddings: List[List[float]] = []  # 對應的向量
+    def _append_rows(self, current: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """將向量接在目前矩陣之後，返回新矩陣（既有快照看到的列不會被改寫）"""
+        rows = current.shape[0]
+        needed = rows + vectors.shape[0]
+        buffer = self._buffer
+        if buffer is None or not rows or needed > buffer.shape[0]:
+            capacity = max(needed, 2 * rows, MIN_BUFFER_ROWS)
+            buffer = self.allocator(capacity, vectors.shape[1])
+            if rows:
+                buffer[:rows] = current
+            self._buffer = buffer
+        buffer[rows:needed] = vectors
+        return buffer[:needed]
     
-    def add_document(self, doc_id: str, title: str, content: str, chunks: List[str], embeddings: List[List[float]]):
+    # ============ 寫入 ============
+    
+    def find_near_duplicates(self, content: str, threshold: Optional[float] = None) -> List[dict]:
+        """
+        查詢與內容近似重複的文檔
+        
+        Args:
+            content: 文檔內容
+            threshold: Jaccard 相似度門檻（None 為 NEAR_DUPLICATE_THRESHOLD）
+        
+        Returns:
+            包含文檔 ID、標題與估計相似度的列表，依相似度由高到低排序
+        """
+        if self.near_duplicates is None:
+            return []
+        documents = self._snapshot.documents
+        return [
+            {"document_id": doc_id, "title": documents[doc_id]["title"], "similarity": round(similarity, 3)}
+            for doc_id, similarity in self.near_duplicates.query(self.near_duplicates.signature(content), threshold)
+            if doc_id in documents
+        ]
+    
+    def missing_chunks(self, chunks: List[str]) -> List[str]:
+        """
+        返回知識庫中尚未存在的片段內容（去除重複，保持順序），只有這些需要生成嵌入向量
+        """
+        return missing_contents(chunks, self._rows)
+    
+    def add_document(
+        self,
+        doc_id: str,
+        title: str,
+        content: str,
+        chunks: List[str],
+        embeddings: List[Optional[List[float]]],
+        defer: bool = False
+    ) -> dict:
         """
         添加文檔到向量資料庫
         
@@ -24,9 +440,19 @@ class VectorStore:
             title: 文檔標題
             content: 文檔內容
             chunks: 文本片段列表
-            embeddings: 對應的嵌入向量列表
+            embeddings: 對應的嵌入向量列表；內容已存在的片段可為 None，沿用既有向量
+            defer: 缺少向量的新片段先以詞彙比對搜尋，之後再以 attach_embeddings 補上
+        
+        Returns:
+            存入的文檔（defer 時附有 indexing 進度）
+        
+        Raises:
+            ValueError: 文檔 ID 已存在、向量數量與片段不符、新內容缺少向量，或維度與已存向量不同時
         """
-        self.documents[doc_id] = {
+        if len(embeddings) != len(chunks):
+            raise ValueError(f"嵌入向量數量與片段數不符: {len(embeddings)} != {len(chunks)}")
+        signature = self.near_duplicates.signature(content) if self.near_duplicates is not None else None
+        document = {
             "id": doc_id,
             "title": title,
             "content": content,
@@ -35,19 +461,68 @@ class VectorStore:
             "created_at": datetime.now().isoformat()
         }
         
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            self.chunks.append({
-                "id": f"{doc_id}_{i}",
-                "document_id": doc_id,
-                "title": title,
-                "content": chunk,
-                "chunk_index": i
-            })
-            self.embeddings.append(embedding)
+        with self._write_lock:
+            if doc_id in self._snapshot.documents:
+                raise ValueError(f"文檔 ID 已存在: {doc_id}")
+            self._apply(doc_id, document, chunks, embeddings, defer)
+            if signature is not None:
+                self.near_duplicates.add(doc_id, signature)
+        return document
+    
+    def update_document(
+        self,
+        doc_id: str,
+        title: str,
+        content: str,
+        chunks: List[str],
+        embeddings: List[Optional[List[float]]]
+    ) -> Dict[str, int]:
+        """
+        以新的內容取代文檔，文檔 ID 不變
+        
+        未改變的片段沿用既有向量（embeddings 中可為 None），只有新的或修改過的片段需要向量。
+        
+        Args:
+            doc_id: 文檔 ID
+            title: 新的標題
+            content: 新的內容
+            chunks: 新內容的片段列表
+            embeddings: 對應的嵌入向量列表
+        
+        Returns:
+            片段變化統計：kept（沿用）、added（新增）、removed（不再使用）
+        
+        Raises:
+            KeyError: 文檔不存在時
+            ValueError: 同 add_document
+        """
+        if len(embeddings) != len(chunks):
+            raise ValueError(f"嵌入向量數量與片段數不符: {len(embeddings)} != {len(chunks)}")
+        signature = self.near_duplicates.signature(content) if self.near_duplicates is not None else None
+        
+        with self._write_lock:
+            previous = self._snapshot.documents.get(doc_id)
+            if previous is None:
+                raise KeyError(doc_id)
+            old = set(self._refs[doc_id])
+            document = dict(
+                previous,
+                title=title,
+                content=content,
+                content_length=len(content),
+                chunks_count=len(chunks),
+                updated_at=datetime.now().isoformat()
+            )
+            self._apply(doc_id, document, chunks, embeddings)
+            new = set(self._refs[doc_id])
+            if signature is not None:
+                self.near_duplicates.remove(doc_id)
+                self.near_duplicates.add(doc_id, signature)
+        return {"kept": len(old & new), "added": len(new - old), "removed": len(old - new)}
     
     def delete_document(self, doc_id: str) -> bool:
         """
-        刪除文檔
+        刪除文檔（其他文檔仍引用的片段與向量會保留）
         
         Args:
             doc_id: 文檔 ID
@@ -55,87 +530,365 @@ class VectorStore:
         Returns:
             是否成功刪除
         """
-        if doc_id not in self.documents:
-            return False
+        with self._write_lock:
+            if doc_id not in self._snapshot.documents:
+                return False
+            if self.near_duplicates is not None:
+                self.near_duplicates.remove(doc_id)
+            self._apply(doc_id, None, [], [])
+            return True
+    
+    def import_documents(
+        self,
+        documents: List[dict],
+        texts: List[str],
+        embeddings: np.ndarray,
+        refs: List[List[int]]
+    ) -> Dict:
+        """
+        批次新增文檔並一次發布（用於匯入封存檔，不需要生成嵌入向量）
+        
+        Args:
+            documents: 文檔資料（id、title、content，可含 created_at、updated_at）
+            texts: 不重複的片段內容
+            embeddings: 前 len(embeddings) 個片段內容的向量，其餘片段列為待嵌入
+            refs: 各文檔依序引用的片段內容索引
+        
+        Returns:
+            匯入統計：imported、skipped（ID 已存在而略過的文檔）、new_chunks、pending_chunks
         
-        # 找出要刪除的片段索引
-        indices_to_remove = [i for i, c in enumerate(self.chunks) if c["document_id"] == doc_id]
+        Raises:
+            ValueError: 參數長度不符，或向量維度與已存向量不同時
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(refs) != len(documents):
+            raise ValueError(f"文檔數與片段引用數不符: {len(documents)} != {len(refs)}")
+        if embeddings.ndim != 2 or embeddings.shape[0] > len(texts) or (embeddings.shape[0] and not embeddings.shape[1]):
+            raise ValueError("嵌入向量數量或維度不正確")
+        hashes = [content_hash(text) for text in texts]
+        embedded = embeddings.shape[0]
+        signatures = (
+            [self.near_duplicates.signature(doc["content"]) for doc in documents]
+            if self.near_duplicates is not None else None
+        )
         
-        # 從後往前刪除
-        for i in reversed(indices_to_remove):
-            del self.chunks[i]
-            del self.embeddings[i]
+        with self._write_lock:
+            current = self._snapshot
+            if embedded and current.chunks and embeddings.shape[1] != current.matrix.shape[1]:
+                raise ValueError(f"嵌入向量維度不一致: {embeddings.shape[1]} != {current.matrix.shape[1]}")
+            documents_map = dict(current.documents)
+            chunk_list = list(current.chunks)
+            pending = list(current.pending)
+            added: Dict[str, int] = {}
+            rows = []
+            skipped = []
+            refs_map: Dict[str, List[str]] = {}
+            waiting_map: Dict[str, set] = {}
+            imported = []
+            for n, (doc, doc_refs) in enumerate(zip(documents, refs)):
+                doc_id = doc["id"]
+                if doc_id in documents_map:
+                    skipped.append(doc_id)
+                    continue
+                document = {
+                    "id": doc_id,
+                    "title": doc["title"],
+                    "content": doc["content"],
+                    "content_length": len(doc["content"]),
+                    "chunks_count": len(doc_refs),
+                    "created_at": doc.get("created_at") or datetime.now().isoformat()
+                }
+                if doc.get("updated_at"):
+                    document["updated_at"] = doc["updated_at"]
+                seen = set()
+                waiting = set()
+                for i, r in enumerate(doc_refs):
+                    digest = hashes[r]
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                    row = self._rows.get(digest, added.get(digest))
+                    if row is not None:
+                        shared = chunk_list[row]
+                        chunk_list[row] = dict(shared, document_ids=shared["document_ids"] + [doc_id])
+                        continue
+                    record = {
+                        "id": f"{doc_id}_{i}",
+                        "document_id": doc_id,
+                        "title": document["title"],
+                        "content": texts[r],
+                        "chunk_index": i,
+                        "hash": digest,
+                        "document_ids": [doc_id]
+                    }
+                    if r >= embedded:
+                        waiting.add(digest)
+                        pending.append((record, char_bigrams(texts[r])))
+                        continue
+                    added[digest] = len(chunk_list)
+                    rows.append(r)
+                    chunk_list.append(record)
+                if waiting:
+                    document["indexing"] = {"status": "pending", "pending_chunks": len(waiting), "total_chunks": len(seen)}
+                    waiting_map[doc_id] = waiting
+                documents_map[doc_id] = document
+                refs_map[doc_id] = [hashes[r] for r in doc_refs]
+                imported.append(n)
+            
+            matrix = current.matrix
+            if rows:
+                matrix = self._append_rows(matrix, _normalize(embeddings[rows]))
+            self._rows.update(added)
+            self._refs.update(refs_map)
+            self._pending.update(waiting_map)
+            if signatures is not None:
+                for n in imported:
+                    self.near_duplicates.add(documents[n]["id"], signatures[n])
+            doc_index = current.doc_index.update(
+                {doc_id: self._document_rows(doc_id, chunk_list) for doc_id in refs_map}, matrix
+            )
+            self._publish(documents_map, chunk_list, matrix, pending, doc_index)
         
-        del self.documents[doc_id]
-        return True
+        return {
+            "imported": len(imported),
+            "skipped": skipped,
+            "new_chunks": len(rows),
+            "pending_chunks": sum(len(w) for w in waiting_map.values())
+        }
+    
+    def export_state(self) -> Tuple[Snapshot, Dict[str, List[str]]]:
+        """返回目前的快照與各文檔依序引用的片段內容雜湊（兩者為同一版本）"""
+        with self._write_lock:
+            return self._snapshot, dict(self._refs)
+    
+    def pending_chunks(self, doc_id: str) -> List[str]:
+        """返回文檔尚未生成向量的片段內容"""
+        return [chunk["content"] for chunk, _ in self._snapshot.pending if chunk["document_id"] == doc_id]
     
-    def search(self, query_embedding: List[float], top_k: int = 5) -> List[dict]:
+    def attach_embeddings(self, doc_id: str, contents: List[str], embeddings: List[List[float]]) -> bool:
         """
-        向量相似度搜索
+        為延後嵌入的片段補上向量，補上的片段改以向量搜尋
         
         Args:
-            query_embedding: 查詢向量
-            top_k: 返回最相關的 k 個結果
+            doc_id: 文檔 ID
+            contents: 片段內容
+            embeddings: 對應的嵌入向量
         
         Returns:
-            相關片段列表，包含相似度分數
+            文檔是否仍存在（處理期間可能已被刪除或更新）
         """
-        if not self.embeddings:
-            return []
+        vectors = {content_hash(c): e for c, e in zip(contents, embeddings)}
+        with self._write_lock:
+            current = self._snapshot
+            if doc_id not in current.documents or not self._pending.get(doc_id):
+                return False
+            pending = {chunk["hash"]: chunk["content"] for chunk, _ in current.pending if chunk["document_id"] == doc_id}
+            texts, values = [], []
+            for digest in self._refs[doc_id]:
+                if digest in pending:
+                    texts.append(pending[digest])
+                    values.append(vectors.get(digest))
+                else:
+                    texts.append(current.chunks[self._rows[digest]]["content"])
+                    values.append(None)
+            self._apply(doc_id, dict(current.documents[doc_id]), texts, values, defer=True)
+            return True
+    
+    def mark_indexing_failed(self, doc_id: str, error: str):
+        """記錄延後嵌入失敗（未補上向量的片段仍可以詞彙比對搜尋）"""
+        with self._write_lock:
+            current = self._snapshot
+            document = current.documents.get(doc_id)
+            if document is None or "indexing" not in document:
+                return
+            document = dict(document, indexing=dict(document["indexing"], status="failed", error=error))
+            self._publish(dict(current.documents, **{doc_id: document}), current.chunks, current.matrix)
+    
+    def _apply(
+        self,
+        doc_id: str,
+        document: Optional[dict],
+        chunks: List[str],
+        embeddings: List[Optional[List[float]]],
+        defer: bool = False
+    ):
+        """
+        將文檔的片段引用換成 chunks 並發布新的快照（呼叫端須持有寫入鎖）
         
-        # 計算餘弦相似度
-        scores = []
-        for i, emb in enumerate(self.embeddings):
-            score = self._cosine_similarity(query_embedding, emb)
-            scores.append((i, score))
+        document 為 None 時刪除文檔。新內容的片段接在矩陣之後；defer 時缺少向量的新內容改列為待嵌入片段。
+        不再被任何文檔引用的片段從矩陣移除，仍被其他文檔引用的片段改由下一個文檔作為來源。
+        """
+        current = self._snapshot
+        documents = dict(current.documents)
+        if document is None:
+            del documents[doc_id]
+        else:
+            documents[doc_id] = document
+        hashes = [content_hash(chunk) for chunk in chunks]
+        chunk_list = list(current.chunks)
         
-        # 排序並返回 top_k
-        scores.sort(key=lambda x: x[1], reverse=True)
+        # 文檔原有的待嵌入片段由這次的內容取代
+        pending = [item for item in current.pending if item[0]["document_id"] != doc_id]
+        waiting = set()
         
-        results = []
-        for i, score in scores[:top_k]:
-            chunk = self.chunks[i].copy()
-            chunk["score"] = score
-            results.append(chunk)
+        # 新增或更新引用
+        added: Dict[str, int] = {}
+        seen = set()
+        vectors = []
+        for i, (chunk, digest, embedding) in enumerate(zip(chunks, hashes, embeddings)):
+            if digest in seen:
+                continue
+            seen.add(digest)
+            row = self._rows.get(digest)
+            if row is None:
+                record = {
+                    "id": f"{doc_id}_{i}",
+                    "document_id": doc_id,
+                    "title": document["title"],
+                    "content": chunk,
+                    "chunk_index": i,
+                    "hash": digest,
+                    "document_ids": [doc_id]
+                }
+                if embedding is None:
+                    if not defer:
+                        raise MissingEmbeddingError(f"第 {i} 個片段的內容不在知識庫中，需要嵌入向量")
+                    waiting.add(digest)
+                    pending.append((record, char_bigrams(chunk)))
+                    continue
+                added[digest] = len(chunk_list)
+                vectors.append(embedding)
+                chunk_list.append(record)
+                continue
+            shared = chunk_list[row]
+            if doc_id not in shared["document_ids"]:
+                chunk_list[row] = dict(shared, document_ids=shared["document_ids"] + [doc_id])
+            elif shared["document_id"] == doc_id and (shared["chunk_index"] != i or shared["title"] != document["title"]):
+                chunk_list[row] = dict(shared, id=f"{doc_id}_{i}", title=document["title"], chunk_index=i)
+        
+        matrix = current.matrix
+        if vectors:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if vectors.ndim != 2:
+                raise ValueError("嵌入向量維度不一致")
+            if vectors.shape[1] == 0:
+                raise ValueError("嵌入向量為空")
+            if current.chunks and vectors.shape[1] != matrix.shape[1]:
+                raise ValueError(f"嵌入向量維度不一致: {vectors.shape[1]} != {matrix.shape[1]}")
+            matrix = self._append_rows(matrix, _normalize(vectors))
         
-        return results
+        # 移除不再使用的引用
+        dropped = []
+        for digest in dict.fromkeys(self._refs.get(doc_id, [])):
+            row = self._rows.get(digest)
+            if digest in seen or row is None or doc_id not in chunk_list[row]["document_ids"]:
+                continue
+            shared = chunk_list[row]
+            others = [d for d in shared["document_ids"] if d != doc_id]
+            if not others:
+                dropped.append(row)
+                continue
+            if shared["document_id"] == doc_id:
+                # 改以下一個引用的文檔作為片段的來源
+                owner = others[0]
+                index = self._refs[owner].index(digest)
+                shared = dict(shared, id=f"{owner}_{index}", document_id=owner,
+                              title=documents[owner]["title"], chunk_index=index)
+            chunk_list[row] = dict(shared, document_ids=others)
+        
+        if document is None:
+            self._refs.pop(doc_id, None)
+        else:
+            self._refs[doc_id] = hashes
+        if waiting:
+            self._pending[doc_id] = waiting
+        else:
+            self._pending.pop(doc_id, None)
+        if document is not None and (defer or "indexing" in document):
+            document["indexing"] = {
+                "status": "pending" if waiting else "ready",
+                "pending_chunks": len(waiting),
+                "total_chunks": len(seen)
+            }
+        remap = None
+        reduced = current.reduced
+        if dropped:
+            keep = np.ones(len(chunk_list), dtype=bool)
+            keep[dropped] = False
+            remap = np.cumsum(keep) - 1
+            self._row_epoch += 1
+            if reduced is not None:
+                reduced = reduced.filter(keep) if len(keep) > len(dropped) else None
+            chunk_list = [c for c, k in zip(chunk_list, keep) if k]
+            # 保留的列複製到新的緩衝區（舊快照仍持有原本的向量），之後的新增直接寫在其後
+            if chunk_list:
+                capacity = max(len(chunk_list), MIN_BUFFER_ROWS, 0 if self._buffer is None else self._buffer.shape[0])
+                self._buffer = self.allocator(capacity, matrix.shape[1])
+                matrix = np.compress(keep, matrix, axis=0, out=self._buffer[:len(chunk_list)])
+            else:
+                matrix = _empty_matrix()
+                self._buffer = None
+            self._rows = {c["hash"]: i for i, c in enumerate(chunk_list)}
+        else:
+            self._rows.update(added)
+        rows = self._document_rows(doc_id, chunk_list) if document is not None else None
+        doc_index = current.doc_index.update({doc_id: rows}, matrix, remap)
+        self._publish(documents, chunk_list, matrix, pending, doc_index, reduced)
     
-    def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
+    def clear(self):
+        """清空所有數據"""
+        with self._write_lock:
+            self._buffer = None
+            self._rows = {}
+            self._refs = {}
+            self._pending = {}
+            if self.near_duplicates is not None:
+                self.near_duplicates.clear()
+            self._row_epoch += 1
+            self._publish({}, [], _empty_matrix(), [], DocumentIndex.empty(), None)
+    
+    # ============ 搜尋 ============
+    
+    def _query_vector(self, query_embedding: List[float]) -> np.ndarray:
+        return _normalize(np.asarray([query_embedding], dtype=np.float32))[0]
+    
+    def search(self, query_embedding: List[float], top_k: int = 5, query_text: Optional[str] = None,
+               mmr_lambda: Optional[float] = None) -> List[dict]:
         """
-        計算餘弦相似度
+        向量相似度搜索
         
         Args:
-            a: 向量 A
-            b: 向量 B
+            query_embedding: 查詢向量
+            top_k: 返回最相關的 k 個結果
+            query_text: 查詢文字；提供時尚未生成向量的片段以詞彙比對一併搜尋
+            mmr_lambda: 以 MMR 重新排序時相關度的權重（None 或 1 為不重新排序）
         
         Returns:
-            相似度分數（0-1）
+            相關片段列表，包含相似度分數（餘弦相似度；詞彙比對的片段 match 為 lexical，
+            score 為比對比例換算到向量分數區間的值，原始比例見 lexical_score）
         """
-        dot_product = sum(x * y for x, y in zip(a, b))
-        norm_a = math.sqrt(sum(x * x for x in a))
-        norm_b = math.sqrt(sum(x * x for x in b))
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        return dot_product / (norm_a * norm_b)
+        return search_snapshot(
+            self._snapshot, self._query_vector(query_embedding), top_k, query_text, self.shards, self.prefilter,
+            rerank_candidates=self.rerank_candidates, mmr_lambda=mmr_lambda
+        )
     
-    def clear(self):
-        """清空所有數據"""
-        self.documents.clear()
-        self.chunks.clear()
-        self.embeddings.clear()
+    async def asearch(self, query_embedding: List[float], top_k: int = 5, query_text: Optional[str] = None,
+                      mmr_lambda: Optional[float] = None) -> List[dict]:
+        """
+        非同步的向量相似度搜索：片段數量大時在執行緒池計算，不阻塞事件迴圈
+        """
+        snapshot = self._snapshot
+        if len(snapshot.chunks) + len(snapshot.pending) < THREAD_SEARCH_MIN_CHUNKS:
+            return self.search(query_embedding, top_k, query_text, mmr_lambda)
+        return await run_in_thread(
+            search_snapshot, snapshot, self._query_vector(query_embedding), top_k, query_text, self.shards, self.prefilter,
+            rerank_candidates=self.rerank_candidates, mmr_lambda=mmr_lambda
+        )
     
     def count_chunks(self) -> int:
-        """返回片段總數"""
-        return len(self.chunks)
+        """返回片段總數（內容相同的片段只計一次）"""
+        return len(self._snapshot.chunks)
     
     def count_documents(self) -> int:
         """返回文檔總數"""
-        return len(self.documents)
-
-
-# 全局向量存儲實例
-vector_store = VectorStore()
-
-
-
-
+        return len(self._snapshot.documents)